@@ -0,0 +1,158 @@
+"""MongoDB aggregation pipelines behind /api/weather/stats.
+
+The heavy lifting runs inside MongoDB so only compact results come back:
+per-location averages use the stored `temperature_summary` of each record,
+while climatology and extremes work on the deduplicated per-day documents in
+`daily_temperatures`, restricted to the date span the saved records cover.
+"""
+
+
+def location_averages(match, limit):
+    """Per-location record count, covered days and day-weighted mean/min/max."""
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': '$location',
+            'records': {'$sum': 1},
+            'days': {'$sum': '$temperature_summary.count'},
+            'weighted_sum': {'$sum': {'$multiply': ['$temperature_summary.mean', '$temperature_summary.count']}},
+            'min': {'$min': '$temperature_summary.min'},
+            'max': {'$max': '$temperature_summary.max'},
+            'first_date': {'$min': '$start_date'},
+            'last_date': {'$max': '$end_date'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'location': '$_id',
+            'records': 1,
+            'days': 1,
+            'mean': {'$cond': [{'$gt': ['$days', 0]}, {'$divide': ['$weighted_sum', '$days']}, None]},
+            'min': 1,
+            'max': 1,
+            'first_date': 1,
+            'last_date': 1
+        }},
+        {'$sort': {'records': -1, 'location': 1}},
+        {'$limit': limit}
+    ]
+
+
+def _daily_by_period(match, period_length, daily_collection):
+    """Group stored days per (location, period) for the saved records' span.
+
+    `period_length` is how many leading characters of the YYYY-MM-DD date
+    form the period key: 7 for year-month, or the month alone when None.
+    """
+    if period_length is None:
+        period = {'$substrBytes': ['$date', 5, 2]}
+    else:
+        period = {'$substrBytes': ['$date', 0, period_length]}
+    return [
+        {'$match': dict(match, latitude={'$exists': True})},
+        {'$group': {
+            # Records store the archive grid point they were built from
+            '_id': {'location': '$location', 'lat': '$latitude', 'lon': '$longitude'},
+            'start': {'$min': '$start_date'},
+            'end': {'$max': '$end_date'}
+        }},
+        {'$lookup': {
+            'from': daily_collection,
+            'let': {'lat': '$_id.lat', 'lon': '$_id.lon', 'start': '$start', 'end': '$end'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$lat', '$$lat']},
+                    {'$eq': ['$lon', '$$lon']},
+                    {'$gte': ['$date', '$$start']},
+                    {'$lte': ['$date', '$$end']}
+                ]}}},
+                {'$match': {'temperature_2m_mean': {'$ne': None}}},
+                {'$group': {
+                    '_id': period,
+                    'sum': {'$sum': '$temperature_2m_mean'},
+                    'days': {'$sum': 1},
+                    'min': {'$min': '$temperature_2m_mean'},
+                    'max': {'$max': '$temperature_2m_mean'}
+                }}
+            ],
+            'as': 'periods'
+        }},
+        {'$unwind': '$periods'},
+        # A location name can map to more than one grid point; combine them.
+        {'$group': {
+            '_id': {'location': '$_id.location', 'period': '$periods._id'},
+            'sum': {'$sum': '$periods.sum'},
+            'days': {'$sum': '$periods.days'},
+            'min': {'$min': '$periods.min'},
+            'max': {'$max': '$periods.max'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'location': '$_id.location',
+            'period': '$_id.period',
+            'mean': {'$divide': ['$sum', '$days']},
+            'min': 1,
+            'max': 1,
+            'days': 1
+        }}
+    ]
+
+
+def monthly_climatology(match, daily_collection):
+    """Mean/min/max temperature per location and calendar month (01-12)."""
+    return _daily_by_period(match, None, daily_collection) + [
+        {'$sort': {'location': 1, 'period': 1}},
+        {'$group': {
+            '_id': '$location',
+            'months': {'$push': {
+                'month': '$period',
+                'mean': '$mean',
+                'min': '$min',
+                'max': '$max',
+                'days': '$days'
+            }}
+        }},
+        {'$project': {'_id': 0, 'location': '$_id', 'months': 1}},
+        {'$sort': {'location': 1}}
+    ]
+
+
+def extreme_periods(match, limit, daily_collection):
+    """The warmest and coldest calendar months (YYYY-MM) across locations."""
+    return _daily_by_period(match, 7, daily_collection) + [
+        {'$project': {'location': 1, 'month': '$period', 'mean': 1, 'min': 1, 'max': 1, 'days': 1}},
+        {'$facet': {
+            'warmest': [{'$sort': {'mean': -1}}, {'$limit': limit}],
+            'coldest': [{'$sort': {'mean': 1}}, {'$limit': limit}]
+        }}
+    ]
+
+
+def records_over_time(match):
+    """Number of records created per month."""
+    return [
+        {'$match': dict(match, created_at={'$exists': True})},
+        {'$group': {
+            '_id': {'$dateToString': {'format': '%Y-%m', 'date': '$created_at'}},
+            'records': {'$sum': 1}
+        }},
+        {'$project': {'_id': 0, 'month': '$_id', 'records': 1}},
+        {'$sort': {'month': 1}}
+    ]
+
+
+def location_points(match):
+    """Distinct (location, grid point) pairs with how many records use each."""
+    return [
+        {'$match': dict(match, latitude={'$exists': True})},
+        {'$group': {
+            '_id': {'location': '$location', 'lat': '$latitude', 'lon': '$longitude'},
+            'records': {'$sum': 1}
+        }},
+        {'$project': {
+            '_id': 0,
+            'location': '$_id.location',
+            'latitude': '$_id.lat',
+            'longitude': '$_id.lon',
+            'records': 1
+        }}
+    ]
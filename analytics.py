@@ -0,0 +1,190 @@
+"""Temperature series statistics.
+
+Series are lists of daily values with None for missing days. With NumPy
+installed the math runs vectorized (gaps become NaN), and `summarize_many`
+handles a whole batch of records in a few array operations; without it the
+same functions fall back to plain Python.
+"""
+import math
+
+# Optional: vectorized implementation
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Base temperature (°C) for heating/cooling degree-days
+DEGREE_DAY_BASE = 18.0
+
+
+def _empty_summary(null_count=0):
+    return {
+        'count': 0,
+        'mean': None,
+        'min': None,
+        'max': None,
+        'stddev': None,
+        'null_count': null_count
+    }
+
+
+def _summarize_py(values):
+    values = values or []
+    present = [v for v in values if v is not None]
+    summary = _empty_summary(len(values) - len(present))
+    summary['count'] = len(present)
+    if not present:
+        return summary
+    mean = math.fsum(present) / len(present)
+    summary.update({
+        'mean': mean,
+        'min': min(present),
+        'max': max(present),
+        'stddev': math.sqrt(math.fsum((v - mean) ** 2 for v in present) / len(present))
+    })
+    return summary
+
+
+def to_array(values):
+    """float64 array of a series with NaN for None."""
+    # NumPy converts None to NaN itself when the dtype is float
+    return np.array(values or [], dtype=float)
+
+
+def _optional(value):
+    # NaN -> None, numpy scalar -> float, for JSON output
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def summarize(values):
+    """Summarize a daily series that may contain None gaps.
+
+    Returns count (non-null days), mean, min, max, population stddev and
+    null_count. Statistics are None when the series has no values.
+    """
+    return summarize_many([values])[0]
+
+
+def summarize_many(series):
+    """`summarize` for a list of series, computed in one batch.
+
+    All series are concatenated into one flat array, so records of any
+    length are handled without padding.
+    """
+    if np is None:
+        return [_summarize_py(values) for values in series]
+    lengths = np.array([len(values or []) for values in series], dtype=np.intp)
+    if not len(lengths):
+        return []
+    flat = to_array([v for values in series for v in values or []])
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    present = ~np.isnan(flat)
+
+    counts = np.bincount(owner[present], minlength=len(lengths))
+    sums = np.bincount(owner[present], weights=flat[present], minlength=len(lengths))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    deviations = np.where(present, flat - means[owner], 0.0)
+    variances = np.bincount(owner, weights=deviations * deviations, minlength=len(lengths))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stddevs = np.sqrt(variances / counts)
+
+    # reduceat needs non-empty segments; empty series are filled in below
+    nonempty = lengths > 0
+    starts = (np.cumsum(lengths) - lengths)[nonempty]
+    mins = np.full(len(lengths), np.nan)
+    maxs = np.full(len(lengths), np.nan)
+    if len(starts):
+        mins[nonempty] = np.minimum.reduceat(np.where(present, flat, np.inf), starts)
+        maxs[nonempty] = np.maximum.reduceat(np.where(present, flat, -np.inf), starts)
+
+    summaries = []
+    for i in range(len(lengths)):
+        count = int(counts[i])
+        summary = _empty_summary(int(lengths[i]) - count)
+        if count:
+            summary.update({
+                'count': count,
+                'mean': float(means[i]),
+                'min': float(mins[i]),
+                'max': float(maxs[i]),
+                'stddev': float(stddevs[i])
+            })
+        summaries.append(summary)
+    return summaries
+
+
+def rolling_mean(values, window=7, min_periods=1):
+    """Trailing `window`-day mean for each day, ignoring gaps.
+
+    A day's value is None when fewer than `min_periods` of the window's days
+    have data.
+    """
+    if np is None:
+        result = []
+        for i in range(len(values or [])):
+            present = [v for v in values[max(0, i - window + 1):i + 1] if v is not None]
+            result.append(math.fsum(present) / len(present) if len(present) >= min_periods else None)
+        return result
+    arr = to_array(values)
+    present = ~np.isnan(arr)
+    sums = np.cumsum(np.where(present, arr, 0.0))
+    counts = np.cumsum(present)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    means[counts < max(min_periods, 1)] = np.nan
+    return [_optional(v) for v in means]
+
+
+def monthly_means(dates, values):
+    """Mean value per calendar month ("01".."12") of a dated series."""
+    if np is None:
+        groups = {}
+        for date_str, v in zip(dates, values):
+            if v is not None:
+                groups.setdefault(date_str[5:7], []).append(v)
+        return {month: math.fsum(vs) / len(vs) for month, vs in sorted(groups.items())}
+    arr = to_array(values)
+    months = np.array([int(d[5:7]) for d in dates], dtype=np.intp)
+    present = ~np.isnan(arr)
+    counts = np.bincount(months[present], minlength=13)
+    sums = np.bincount(months[present], weights=arr[present], minlength=13)
+    return {f"{m:02d}": float(sums[m] / counts[m]) for m in range(1, 13) if counts[m]}
+
+
+def anomalies(dates, values, baseline):
+    """Each day's departure from `baseline`.
+
+    `baseline` is either one number or a `monthly_means` dict; days without
+    a value (or without a baseline for their month) are None.
+    """
+    if isinstance(baseline, dict):
+        base = [baseline.get(d[5:7]) for d in dates]
+    else:
+        base = [baseline] * len(dates)
+    if np is None:
+        return [v - b if v is not None and b is not None else None for v, b in zip(values, base)]
+    return [_optional(v) for v in to_array(values) - to_array(base)]
+
+
+def degree_days(values, base=DEGREE_DAY_BASE):
+    """Heating and cooling degree-days (daily mean method) over a series."""
+    if np is None:
+        present = [v for v in values or [] if v is not None]
+        return {
+            'base': base,
+            'heating': math.fsum(max(base - v, 0) for v in present),
+            'cooling': math.fsum(max(v - base, 0) for v in present),
+            'days': len(present)
+        }
+    arr = to_array(values)
+    arr = arr[~np.isnan(arr)]
+    return {
+        'base': base,
+        'heating': float(np.clip(base - arr, 0, None).sum()),
+        'cooling': float(np.clip(arr - base, 0, None).sum()),
+        'days': int(arr.size)
+    }
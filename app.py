@@ -1,11 +1,46 @@
-from flask import Flask, request, jsonify, render_template, make_response
-from flask_pymongo import PyMongo
+from flask import (Blueprint, Flask, Response, current_app, g, has_app_context, request, jsonify, render_template,
+                   stream_with_context, url_for)
+from bson import BSON
 from bson.objectid import ObjectId
+import pymongo
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+import click
 import requests
+import asyncio
+import contextvars
 import datetime
+import functools
+import hashlib
 import json
+import logging
+import re
+import sys
+import time
 import csv
+import itertools
+import textwrap
+import threading
 from io import StringIO
+from urllib.parse import urlparse
+
+import aggregations
+import analytics
+import metrics
+from archive_store import ArchiveStore
+from cache import TTLCache, SQLiteStore, MongoStore, registry as cache_registry
+from circuit import CLOSED as CIRCUIT_CLOSED, CircuitBreakers, CircuitOpenError
+from database import LazyMongo
+from gazetteer import Gazetteer
+from jobs import JobError, MongoJobQueue, QueueFull
+from live import LiveHub
+from prefetch import PopularityTracker, PrefetchScheduler
+from responses import OrjsonProvider, compress as compress_response, orjson
+from settings import get_setting
+from temperature_storage import FORMATS as TEMPERATURE_FORMATS, store_series, unpack_series, unpack_values
+from upstream import AsyncUpstreamClient, UpstreamClient
+
+logger = logging.getLogger(__name__)
 
 # Try to import config, use defaults if not available
 try:
@@ -13,369 +48,2247 @@ try:
 except ImportError:
     GOOGLE_MAPS_API_KEY = "YOUR_GOOGLE_MAPS_API_KEY_HERE"
 
-app = Flask(__name__)
+# Routes and hooks live on this blueprint; create_app() (at the end of this
+# module) builds the Flask app around it.
+bp = Blueprint('weather', __name__, cli_group=None)
+
+# MongoDB: each app gets its own LazyMongo (app.extensions['mongo']), whose
+# client is created on first use in each process (see database.py)
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/weather_app"
+
+def current_mongo():
+    """The database of the app handling the current request or command, or
+    None outside an app context.
+
+    Background threads (job workers, prefetching, live update polls, ...) run
+    in the app context of the app that started them; see `with_app_context`.
+    """
+    if has_app_context():
+        return current_app.extensions.get('mongo')
+    return None
+
+def with_app_context(fn, app=None):
+    """`fn` wrapped to run in the context of `app` (default: the current app),
+    for work handed to another thread."""
+    app = app or current_app._get_current_object()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+    return run
+
+# Shared, pooled client for all upstream HTTP calls (open-meteo, Nominatim).
+# Each host has a circuit breaker (see circuit.py) shared with the async client.
+circuit_breakers = CircuitBreakers()
+upstream = UpstreamClient(observer=metrics.observe_upstream, breakers=circuit_breakers)
+
+# --- Request metrics and access log ---
+# Registered before every other hook so that all requests are counted and
+# traced. Each request gets an ID (the caller's X-Request-ID if it sent a
+# usable one) that is echoed in the response and appears in its access log
+# line together with its upstream calls and MongoDB time.
+ACCESS_LOG = get_setting('ACCESS_LOG', True, bool)
+
+# Access log lines go to the `access` logger at INFO. Unless the server's
+# logging configuration has set that logger up, they are written as bare JSON
+# lines to stdout.
+access_logger = logging.getLogger('access')
+if ACCESS_LOG and not access_logger.handlers:
+    _access_handler = logging.StreamHandler(sys.stdout)
+    _access_handler.setFormatter(logging.Formatter('%(message)s'))
+    access_logger.addHandler(_access_handler)
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+@bp.before_app_request
+def start_request_trace():
+    g.trace, g.trace_token = metrics.start_trace(request.headers.get('X-Request-ID'))
+    metrics.http_in_flight.inc()
+
+@bp.after_app_request
+def add_request_id(response):
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.id
+        g.status = response.status_code
+    return response
+
+@bp.teardown_app_request
+def finish_request_trace(exc):
+    # Runs after a streamed body has been sent, so exports are timed in full
+    trace = g.pop('trace', None)
+    if trace is None:
+        return
+    seconds = trace.elapsed()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('status', 500)
+    metrics.http_in_flight.dec()
+    metrics.http_requests.inc(route=route, method=request.method, status=status)
+    metrics.http_latency.observe(seconds, route=route, method=request.method)
+    if ACCESS_LOG and route != '/metrics':
+        access_logger.info(json.dumps({
+            'ts': datetime.datetime.utcnow().isoformat() + 'Z',
+            'request_id': trace.id,
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': status,
+            'ms': round(seconds * 1000, 1),
+            'remote_addr': request.remote_addr,
+            'upstream': trace.upstream,
+            'mongo': {'commands': trace.mongo_commands, 'ms': round(trace.mongo_seconds * 1000, 1)},
+            'error': str(exc) if exc is not None else None
+        }))
+    metrics.end_trace(g.pop('trace_token'))
+
+# --- New: safe helper to get a MongoDB collection ---
+def get_collection_safe(name):
+    """
+    Return the specified collection object. If the database is not initialized,
+    return None. Callers should check the return value and respond with a
+    500 error or an appropriate message when None is returned.
+    """
+    # Handles are cached per process, so this is a dict lookup after the first call
+    mongo = current_mongo()
+    if mongo is None:
+        # Not in an app context
+        return None
+    return mongo.collection(name)
+
+# --- Geocoding caches ---
+# Forward lookups are keyed on the normalized location string, reverse lookups
+# on coordinates rounded to 3 decimals (~100 m). Set GEOCODE_CACHE_STORE to
+# "mongo" or "sqlite" to keep entries across restarts. Expired forward lookups
+# are kept in memory for GEOCODE_STALE_TTL more seconds as a fallback for when
+# the geocoding API is down.
+def _cache_store(prefix, namespace):
+    """Persistent store selected by `<prefix>_STORE` (mongo, sqlite or none).
+
+    MongoDB uses the collection named after the prefix (e.g. `geocode_cache`);
+    SQLite uses the file at `<prefix>_SQLITE_PATH`.
+    """
+    kind = (get_setting(f'{prefix}_STORE', '') or '').lower()
+    if kind == 'mongo':
+        return MongoStore(lambda: get_collection_safe(prefix.lower()), namespace)
+    if kind == 'sqlite':
+        return SQLiteStore(get_setting(f'{prefix}_SQLITE_PATH', f'{prefix.lower()}.sqlite3'), namespace)
+    return None
+
+geocode_cache = TTLCache(
+    'geocode',
+    maxsize=get_setting('GEOCODE_CACHE_SIZE', 10000, int),
+    ttl=get_setting('GEOCODE_CACHE_TTL', 7 * 24 * 3600, int),
+    negative_ttl=get_setting('GEOCODE_CACHE_NEGATIVE_TTL', 3600, int),
+    store=_cache_store('GEOCODE_CACHE', 'geocode'),
+    stale_ttl=get_setting('GEOCODE_STALE_TTL', 30 * 24 * 3600, int)
+)
+reverse_geocode_cache = TTLCache(
+    'reverse_geocode',
+    maxsize=get_setting('GEOCODE_CACHE_SIZE', 10000, int),
+    ttl=get_setting('GEOCODE_CACHE_TTL', 7 * 24 * 3600, int),
+    negative_ttl=get_setting('GEOCODE_CACHE_NEGATIVE_TTL', 3600, int),
+    store=_cache_store('GEOCODE_CACHE', 'reverse_geocode')
+)
+
+# --- Helper Functions ---
+def validate_date(date_str):
+    try:
+        datetime.datetime.strptime(date_str, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+def parse_coords(location):
+    """Return `(lat, lon)` if `location` is a "lat,lon" string, else None."""
+    # Check if location is already in lat,lon format
+    if ',' in location:
+        try:
+            parts = location.split(',')
+            lat = float(parts[0].strip())
+            lon = float(parts[1].strip())
+            # Validate lat/lon ranges
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                return lat, lon
+        except (ValueError, IndexError):
+            pass
+    return None
+
+def _geocode_result(key, location, response):
+    """Turn a geocoding response into `(lat, lon, name)` and cache it."""
+    if response.status_code != 200:
+        # Upstream trouble is not a real miss, so don't cache it
+        return None, None, None
+    results = response.json().get("results")
+    if not results:
+        geocode_cache.set(key, None)
+        return None, None, None
+    data = results[0]
+    coords = [data["latitude"], data["longitude"], data.get("name", location)]
+    geocode_cache.set(key, coords)
+    gazetteer.learn(data, uses=1)
+    return tuple(coords)
+
+def get_location_coords(location):
+    """Geocode location to get latitude and longitude."""
+    coords = parse_coords(location)
+    if coords:
+        # Use reverse geocoding to get actual city name
+        lat, lon = coords
+        return lat, lon, get_city_from_coords(lat, lon)
+
+    # Serve repeat lookups (including known misses) from the cache
+    key = normalize_location(location)
+    hit, cached = geocode_cache.lookup(key)
+    if hit:
+        return tuple(cached) if cached else (None, None, None)
+
+    # Try geocoding API for location name
+    try:
+        response = upstream.get('geocoding', params={'name': location, 'count': 1})
+    except requests.RequestException as e:
+        logger.warning('Geocoding error: %s', e)
+        return stale_location_coords(key)
+    return _geocode_result(key, location, response)
+
+def get_record_location(location):
+    """`get_location_coords` for a record about to be saved: returns
+    `(lat, lon, name, resolved)`.
+
+    For "lat,lon" input that can't be named right now (Nominatim throttled
+    or failing) `name` is the coordinate placeholder and `resolved` is False.
+    It doesn't wait for a slot, since it runs on request and fan-out
+    threads; the record is saved with `location_pending` and a
+    `resolve_location` job renames it (see `resolve_location_later`).
+    """
+    coords = parse_coords(location)
+    if not coords:
+        lat, lon, name = get_location_coords(location)
+        return lat, lon, name, True
+    lat, lon = coords
+    resolved, city = lookup_city(lat, lon)
+    return lat, lon, city or coords_fallback_name(lat, lon), resolved
+
+def stale_location_coords(key):
+    """An expired geocoding result for `key`, used while the API is failing."""
+    hit, cached = geocode_cache.stale(key)
+    return tuple(cached) if hit and cached else (None, None, None)
+
+def normalize_location(location):
+    """Normalize a location string for use as a cache key."""
+    return ' '.join(location.lower().split())
+
+def reverse_geocode_params(lat, lon):
+    return {
+        'lat': lat,
+        'lon': lon,
+        'format': 'json',
+        'accept-language': 'en'
+    }
+
+def _place_name(data):
+    """Pick a display name out of a Nominatim reverse geocoding response."""
+    address = data.get('address', {})
+
+    # Try to get city name in order of preference
+    city = (address.get('city') or
+           address.get('town') or
+           address.get('village') or
+           address.get('municipality') or
+           address.get('county') or
+           address.get('state') or
+           data.get('display_name', '').split(',')[0])
+
+    # Add country for context
+    country = address.get('country', '')
+    if city and country:
+        return f"{city}, {country}"
+    return city or None
+
+def _reverse_geocode(lat, lon):
+    """Look up a place name with Nominatim. Returns None if it has no name.
+
+    Raises on transport errors and non-200 responses so callers can tell an
+    upstream failure from a genuine miss.
+    """
+    # Use Nominatim reverse geocoding (free, no API key needed). One slot is
+    # one request, so no retries (they would also resend after a 429).
+    response = upstream.get('reverse', params=reverse_geocode_params(lat, lon), retries=0)
+    response.raise_for_status()
+    return _place_name(response.json())
+
+def reverse_cache_key(lat, lon):
+    return f"{round(lat, 3)},{round(lon, 3)}"
+
+def coords_fallback_name(lat, lon):
+    return f"Location ({lat:.4f}, {lon:.4f})"
+
+# Reverse geocoding is answered from the offline gazetteer (nearest place
+# within REVERSE_GEOCODE_MAX_KM). Nominatim is only a fallback, and is kept
+# under its usage policy of one request per second.
+REVERSE_GEOCODE_MAX_KM = get_setting('REVERSE_GEOCODE_MAX_KM', 50.0, float)
+REVERSE_GEOCODE_FALLBACK = get_setting('REVERSE_GEOCODE_FALLBACK', True, bool)
+NOMINATIM_MIN_INTERVAL = get_setting('NOMINATIM_MIN_INTERVAL', 1.0, float)
+# How long a background lookup for a record saved with a coordinate
+# placeholder name waits for its turn
+NOMINATIM_MAX_WAIT = get_setting('NOMINATIM_MAX_WAIT', 30.0, float)
+
+_nominatim_lock = threading.Lock()
+_nominatim_last = 0.0
+
+def nominatim_slot(wait=0):
+    """Claim a Nominatim request; False if one was sent too recently.
+
+    With `wait`, reserve the next free slot if it comes within that many
+    seconds and sleep until then, so waiting callers go one per interval.
+    """
+    global _nominatim_last
+    with _nominatim_lock:
+        now = time.monotonic()
+        at = max(now, _nominatim_last + NOMINATIM_MIN_INTERVAL)
+        if at - now > wait:
+            return False
+        _nominatim_last = at
+    if at > now:
+        time.sleep(at - now)
+    return True
+
+def local_place_name(lat, lon):
+    """Nearest place in the offline gazetteer as "City, Country", or None."""
+    place = gazetteer.nearest(lat, lon, REVERSE_GEOCODE_MAX_KM)
+    if place is None:
+        return None
+    if place['country']:
+        return f"{place['name']}, {place['country']}"
+    return place['name']
+
+def lookup_city(lat, lon, wait=0):
+    """Reverse geocode coordinates; returns `(resolved, city)`.
+
+    `city` is None when no place is known there. `resolved` is False when
+    Nominatim could not be asked (throttled, see `nominatim_slot(wait)`, or
+    failing), i.e. the answer may still be found later.
+    """
+    city = local_place_name(lat, lon)
+    if city:
+        return True, city
+
+    key = reverse_cache_key(lat, lon)
+    hit, city = reverse_geocode_cache.lookup(key)
+    if hit or not REVERSE_GEOCODE_FALLBACK:
+        return True, city
+    if not nominatim_slot(wait):
+        return False, None
+    try:
+        city = _reverse_geocode(lat, lon)
+    except Exception as e:
+        logger.warning('Reverse geocoding error: %s', e)
+        return False, None
+    reverse_geocode_cache.set(key, city)
+    return True, city
+
+def get_city_from_coords(lat, lon):
+    """Reverse geocode coordinates to get city name."""
+    _, city = lookup_city(lat, lon)
+    # Fallback to coordinates if reverse geocoding fails
+    return city or coords_fallback_name(lat, lon)
+
+CURRENT_FIELDS = "temperature_2m,relative_humidity_2m,apparent_temperature,is_day,precipitation,rain,showers,snowfall,weather_code,cloud_cover,pressure_msl,surface_pressure,wind_speed_10m,wind_direction_10m,wind_gusts_10m"
+FORECAST_DAILY_FIELDS = "weather_code,temperature_2m_max,temperature_2m_min,apparent_temperature_max,apparent_temperature_min,sunrise,sunset,precipitation_sum,rain_sum,showers_sum,snowfall_sum,precipitation_hours,wind_speed_10m_max,wind_gusts_10m_max,wind_direction_10m_dominant"
+UNIT_PARAMS = {
+    'temperature_unit': 'celsius',
+    'wind_speed_unit': 'kmh',
+    'precipitation_unit': 'mm'
+}
+
+def _get_json(endpoint, params):
+    """GET an upstream endpoint and return the decoded JSON, or None on failure."""
+    try:
+        response = upstream.get(endpoint, params=params)
+    except CircuitOpenError:
+        # Failing fast; the breaker already logged why it opened
+        return None
+    except requests.RequestException as e:
+        logger.warning('Upstream %s error: %s', endpoint, e)
+        return None
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+def get_weather_data(lat, lon, start_date, end_date):
+    """Fetch historical weather data from Open-Meteo."""
+    return _get_json('archive', {
+        'latitude': lat,
+        'longitude': lon,
+        'start_date': start_date,
+        'end_date': end_date,
+        'daily': 'temperature_2m_mean'
+    })
+
+def get_weather_data_many(lats, lons, start_date, end_date):
+    """Fetch historical weather for several locations in one request.
+
+    open-meteo accepts comma-separated coordinate lists and then answers with
+    a list of per-location results in the same order.
+    """
+    return _get_json('archive', {
+        'latitude': ','.join(str(lat) for lat in lats),
+        'longitude': ','.join(str(lon) for lon in lons),
+        'start_date': start_date,
+        'end_date': end_date,
+        'daily': 'temperature_2m_mean'
+    })
+
+def current_weather_params(lat, lon):
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'current': CURRENT_FIELDS,
+        **UNIT_PARAMS
+    }
+
+def forecast_params(lat, lon):
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'daily': FORECAST_DAILY_FIELDS,
+        'forecast_days': 5,
+        **UNIT_PARAMS
+    }
+
+def get_current_weather(lat, lon):
+    """Fetch current weather from Open-Meteo."""
+    return _get_json('forecast', current_weather_params(lat, lon))
+
+def get_forecast(lat, lon):
+    """Fetch 5-day weather forecast from Open-Meteo."""
+    return _get_json('forecast', forecast_params(lat, lon))
+
+# --- Weather response cache ---
+# Current conditions update roughly every 15 minutes and forecasts hourly, so
+# both are cached per (endpoint, lat, lon rounded to 0.01 deg ~ 1 km). When
+# open-meteo fails (or its circuit is open), the last response fetched within
+# WEATHER_STALE_TTL is served instead, marked as stale.
+WEATHER_CACHE_TTLS = {
+    'current': get_setting('CURRENT_CACHE_TTL', 600, int),
+    'forecast': get_setting('FORECAST_CACHE_TTL', 3600, int)
+}
+WEATHER_FETCHERS = {
+    'current': get_current_weather,
+    'forecast': get_forecast
+}
+WEATHER_PARAMS = {
+    'current': current_weather_params,
+    'forecast': forecast_params
+}
+
+weather_cache = TTLCache(
+    'weather',
+    maxsize=get_setting('WEATHER_CACHE_SIZE', 5000, int),
+    ttl=max(WEATHER_CACHE_TTLS.values()),
+    # Shared between workers (and with their prefetchers) when configured
+    store=_cache_store('WEATHER_CACHE', 'weather'),
+    stale_ttl=get_setting('WEATHER_STALE_TTL', 24 * 3600, int)
+)
+
+def weather_cache_key(kind, lat, lon):
+    return f"{kind}:{round(lat, 2)}:{round(lon, 2)}"
+
+def get_cached_weather(kind, lat, lon):
+    """Return `(data, max_age, stale)` for `kind` ('current' or 'forecast').
+
+    Concurrent misses for the same key share one upstream request. `max_age`
+    is how many seconds the response stays fresh. If the upstream call fails,
+    `data` is the last known response and `stale` says how old it is, or
+    `data` is None when there is none.
+    """
+    ttl = WEATHER_CACHE_TTLS[kind]
+    rlat, rlon = round(lat, 2), round(lon, 2)
+    popularity.record(rlat, rlon, kind)
+
+    def load():
+        data = WEATHER_FETCHERS[kind](rlat, rlon)
+        if not data:
+            return None
+        return {'data': data, 'fetched_at': time.time()}
+
+    key = weather_cache_key(kind, lat, lon)
+    entry = weather_cache.get_or_load(key, load, ttl=ttl)
+    if entry is None:
+        return stale_weather(key)
+    return _weather_entry_result(entry, ttl)
+
+# --- Prefetching ---
+# Requests are counted per location; a background thread refreshes cached
+# responses for the most popular ones shortly before they expire, so those
+# requests never wait on the upstream.
+popularity = PopularityTracker(
+    half_life=get_setting('PREFETCH_HALF_LIFE', 3600, int),
+    max_tracked=get_setting('PREFETCH_MAX_TRACKED', 10000, int)
+)
+
+def cached_weather_fetched_at(kind, lat, lon):
+    hit, entry = weather_cache.peek(weather_cache_key(kind, lat, lon))
+    return entry['fetched_at'] if hit and entry else None
+
+def refresh_weather(kind, lat, lon):
+    """Fetch `kind` for the (rounded) location and replace the cached entry."""
+    data = WEATHER_FETCHERS[kind](lat, lon)
+    if not data:
+        return False
+    weather_cache.set(weather_cache_key(kind, lat, lon), {'data': data, 'fetched_at': time.time()},
+                      WEATHER_CACHE_TTLS[kind])
+    return True
+
+prefetcher = PrefetchScheduler(
+    popularity,
+    cached_weather_fetched_at,
+    refresh_weather,
+    ttls=WEATHER_CACHE_TTLS,
+    hosts={kind: urlparse(upstream.endpoints['forecast']).netloc for kind in WEATHER_CACHE_TTLS},
+    top_n=get_setting('PREFETCH_TOP_N', 200, int),
+    interval=get_setting('PREFETCH_INTERVAL', 30, int),
+    lead=get_setting('PREFETCH_LEAD', 60, int),
+    jitter=get_setting('PREFETCH_JITTER', 30, int),
+    rate=get_setting('PREFETCH_RATE', 1.0, float),
+    burst=get_setting('PREFETCH_BURST', 5, int)
+)
+PREFETCH_ENABLED = get_setting('PREFETCH_ENABLED', True, bool)
+
+@bp.before_app_request
+def start_prefetch_once():
+    # Started per process on its first request (threads don't survive a fork)
+    if PREFETCH_ENABLED and not prefetcher.running:
+        prefetcher.start(current_app._get_current_object().app_context)
+
+def _weather_entry_result(entry, ttl):
+    if entry is None:
+        return None, 0, None
+    max_age = ttl - (time.time() - entry['fetched_at'])
+    return entry['data'], max(int(max_age), 0), None
+
+def stale_weather(key):
+    """The expired entry for `key` as a stale `(data, 0, stale)` result."""
+    hit, entry = weather_cache.stale(key)
+    if not hit or entry is None:
+        return None, 0, None
+    fetched_at = datetime.datetime.utcfromtimestamp(entry['fetched_at'])
+    return entry['data'], 0, {
+        'fetched_at': fetched_at.isoformat(timespec='seconds') + 'Z',
+        'age_seconds': int(time.time() - entry['fetched_at'])
+    }
+
+def weather_json(payload, max_age, stale):
+    """`cacheable_json` for weather payloads; stale data is flagged in the body
+    and must not be reused by caches."""
+    if stale is not None:
+        payload['stale'] = stale
+    return cacheable_json(payload, max_age)
+
+def weather_unavailable(message, endpoint='forecast'):
+    """Error for weather that could not be fetched (and has no stale copy):
+    503 with Retry-After while the endpoint's circuit is open, else 500."""
+    breaker = upstream.breaker(endpoint)
+    if breaker.state == CIRCUIT_CLOSED:
+        return jsonify({"error": message}), 500
+    response = jsonify({"error": message, "upstream": breaker.name, "circuit": breaker.state})
+    response.headers['Retry-After'] = str(max(int(breaker.retry_in()), 1))
+    return response, 503
+
+# --- Response compression ---
+COMPRESSION_ENABLED = get_setting('COMPRESSION_ENABLED', True, bool)
+COMPRESSION_MIN_SIZE = get_setting('COMPRESSION_MIN_SIZE', 500, int)
+GZIP_LEVEL = get_setting('GZIP_LEVEL', 6, int)
+BROTLI_QUALITY = get_setting('BROTLI_QUALITY', 4, int)
+# Streamed responses are flushed every this many (uncompressed) bytes
+COMPRESSION_FLUSH_SIZE = get_setting('COMPRESSION_FLUSH_SIZE', 8192, int)
+
+@bp.after_app_request
+def compress_responses(response):
+    if not COMPRESSION_ENABLED:
+        return response
+    return compress_response(response, request.accept_encodings, COMPRESSION_MIN_SIZE,
+                             GZIP_LEVEL, BROTLI_QUALITY, COMPRESSION_FLUSH_SIZE)
+
+# --- Response versions ---
+# v=1 (default) returns a record's `temperatures` as a JSON-encoded string,
+# as older clients expect; v=2 returns the series as a JSON object.
+API_VERSIONS = ('1', '2')
+# Only the record endpoints read `v`; elsewhere (the page, static files) it is
+# an ordinary cache-busting parameter
+VERSIONED_ENDPOINTS = {
+    'create_weather_record', 'create_weather_records_bulk', 'get_history', 'get_record',
+    'get_record_analytics', 'update_record', 'export_json', 'export_csv', 'export_markdown'
+}
+
+@bp.before_app_request
+def check_api_version():
+    if request.blueprint != bp.name or request.endpoint.rpartition('.')[2] not in VERSIONED_ENDPOINTS:
+        return
+    if request.args.get('v', '1') not in API_VERSIONS:
+        return jsonify({"error": f"v must be one of: {', '.join(API_VERSIONS)}"}), 400
+
+def temperatures_field(series):
+    """A record's series as the requested response version encodes it."""
+    if request.args.get('v', '1') == '2':
+        return series
+    return json.dumps(series)
+
+def cacheable_json(payload, max_age):
+    """JSON response with an ETag and Cache-Control so browsers and proxies
+    can reuse it; conditional GETs get a 304."""
+    response = jsonify(payload)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.add_etag()
+    return response.make_conditional(request)
+
+def request_param(name):
+    """Read `name` from the query string (GET) or the JSON body (POST)."""
+    if request.method == 'GET':
+        return request.args.get(name)
+    data = request.get_json(silent=True) or {}
+    return data.get(name)
+
+def request_location():
+    return request_param('location')
+
+# --- Historical archive store ---
+# Daily temperatures are kept per (lat, lon, date) in `daily_temperatures`, so
+# overlapping record ranges only download the days we don't have yet.
+archive_store = ArchiveStore(
+    lambda: get_collection_safe('daily_temperatures'),
+    get_weather_data,
+    settle_days=get_setting('ARCHIVE_SETTLE_DAYS', 7, int),
+    fetch_many=get_weather_data_many,
+    batch_size=get_setting('ARCHIVE_BATCH_SIZE', 50, int)
+)
+
+# WMO weather interpretation codes used by open-meteo
+WEATHER_CODES = {
+    0: {"description": "Clear sky", "icon": "☀️"},
+    1: {"description": "Mainly clear", "icon": "🌤️"},
+    2: {"description": "Partly cloudy", "icon": "⛅"},
+    3: {"description": "Overcast", "icon": "☁️"},
+    45: {"description": "Foggy", "icon": "🌫️"},
+    48: {"description": "Depositing rime fog", "icon": "🌫️"},
+    51: {"description": "Light drizzle", "icon": "🌦️"},
+    53: {"description": "Moderate drizzle", "icon": "🌦️"},
+    55: {"description": "Dense drizzle", "icon": "🌧️"},
+    61: {"description": "Slight rain", "icon": "🌧️"},
+    63: {"description": "Moderate rain", "icon": "🌧️"},
+    65: {"description": "Heavy rain", "icon": "🌧️"},
+    71: {"description": "Slight snow", "icon": "🌨️"},
+    73: {"description": "Moderate snow", "icon": "❄️"},
+    75: {"description": "Heavy snow", "icon": "❄️"},
+    77: {"description": "Snow grains", "icon": "🌨️"},
+    80: {"description": "Slight rain showers", "icon": "🌦️"},
+    81: {"description": "Moderate rain showers", "icon": "🌧️"},
+    82: {"description": "Violent rain showers", "icon": "⛈️"},
+    85: {"description": "Slight snow showers", "icon": "🌨️"},
+    86: {"description": "Heavy snow showers", "icon": "❄️"},
+    95: {"description": "Thunderstorm", "icon": "⛈️"},
+    96: {"description": "Thunderstorm with slight hail", "icon": "⛈️"},
+    99: {"description": "Thunderstorm with heavy hail", "icon": "⛈️"}
+}
+UNKNOWN_WEATHER = {"description": "Unknown", "icon": "🌡️"}
+
+def get_weather_description(code):
+    """Convert weather code to description and icon."""
+    return WEATHER_CODES.get(code, UNKNOWN_WEATHER)
+
+def format_current_weather(location_name, lat, lon, current):
+    weather_info = get_weather_description(current.get('weather_code', 0))
+    return {
+        'location': location_name,
+        'latitude': lat,
+        'longitude': lon,
+        'temperature': current.get('temperature_2m'),
+        'feels_like': current.get('apparent_temperature'),
+        'humidity': current.get('relative_humidity_2m'),
+        'wind_speed': current.get('wind_speed_10m'),
+        'wind_direction': current.get('wind_direction_10m'),
+        'precipitation': current.get('precipitation'),
+        'cloud_cover': current.get('cloud_cover'),
+        'pressure': current.get('pressure_msl'),
+        'weather_description': weather_info['description'],
+        'weather_icon': weather_info['icon'],
+        'is_day': current.get('is_day')
+    }
+
+def format_forecast(daily):
+    forecast_list = []
+    for i in range(min(5, len(daily['time']))):
+        weather_info = get_weather_description(daily['weather_code'][i])
+        forecast_list.append({
+            'date': daily['time'][i],
+            'temp_max': daily['temperature_2m_max'][i],
+            'temp_min': daily['temperature_2m_min'][i],
+            'precipitation': daily.get('precipitation_sum', [0])[i],
+            'wind_speed': daily.get('wind_speed_10m_max', [0])[i],
+            'weather_description': weather_info['description'],
+            'weather_icon': weather_info['icon']
+        })
+    return forecast_list
+
+def format_search_results(data):
+    """Shape geocoding search results for the autocomplete dropdown."""
+    results = []
+    for item in data.get('results') or []:
+        location_parts = []
+
+        # Add name
+        if item.get('name'):
+            location_parts.append(item['name'])
+
+        # Add admin areas
+        if item.get('admin1'):
+            location_parts.append(item['admin1'])
+
+        # Add country
+        if item.get('country'):
+            location_parts.append(item['country'])
+
+        results.append({
+            'name': item.get('name', ''),
+            'display_name': ', '.join(location_parts),
+            'latitude': item.get('latitude'),
+            'longitude': item.get('longitude'),
+            'country': item.get('country', ''),
+            'admin1': item.get('admin1', ''),
+            'id': item.get('id')
+        })
+    return results
+
+def search_params(query):
+    return {
+        'name': query,
+        'count': 10,
+        'language': 'en',
+        'format': 'json'
+    }
+
+# --- Local place index ---
+# Place names from an offline GeoNames dump (GAZETTEER_PATH) plus every place
+# resolved through the geocoding API or saved in history. Autocomplete answers
+# from here and only asks the geocoding API when too few places match; the
+# dump's coordinates also back offline reverse geocoding.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MIN_LOCAL = get_setting('AUTOCOMPLETE_MIN_LOCAL', 3, int)
+_autocomplete_timeout = get_setting('AUTOCOMPLETE_UPSTREAM_TIMEOUT', 2.0, float)
+AUTOCOMPLETE_TIMEOUT = (_autocomplete_timeout, _autocomplete_timeout)
+
+gazetteer = Gazetteer(learned_max=get_setting('GAZETTEER_LEARNED_MAX', 10000, int))
+_gazetteer_started = False
+
+def load_gazetteer():
+    """Load the offline dataset and learn the places already saved in history."""
+    path = get_setting('GAZETTEER_PATH')
+    if path:
+        started = time.time()
+        try:
+            count = gazetteer.load(
+                path,
+                country_info_path=get_setting('GAZETTEER_COUNTRY_INFO_PATH'),
+                admin1_path=get_setting('GAZETTEER_ADMIN1_PATH'),
+                min_population=get_setting('GAZETTEER_MIN_POPULATION', 0, int)
+            )
+            logger.info('Gazetteer: loaded %s places in %.1fs', count, time.time() - started)
+        except (OSError, ValueError) as e:
+            logger.warning('Gazetteer load error: %s', e)
+
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        return
+    try:
+        for point in coll.aggregate(aggregations.location_points({})):
+            location = point.get('location') or ''
+            if location.startswith('Location ('):
+                continue
+            # Reverse-geocoded names are stored as "City, Country"
+            name, _, country = location.partition(', ')
+            gazetteer.learn({'name': name, 'country': country,
+                             'latitude': point['latitude'], 'longitude': point['longitude']},
+                            uses=point['records'])
+    except Exception as e:
+        logger.warning('Gazetteer history error: %s', e)
+
+@bp.before_app_request
+def load_gazetteer_once():
+    # Loaded in the background on the first request of each process;
+    # autocomplete and reverse geocoding fall back to the APIs until it is ready.
+    global _gazetteer_started
+    if _gazetteer_started:
+        return
+    _gazetteer_started = True
+    threading.Thread(target=with_app_context(load_gazetteer), name='gazetteer-load', daemon=True).start()
+
+def merge_places(local, remote, limit=AUTOCOMPLETE_LIMIT):
+    """Local matches first, then geocoding API results not already listed."""
+    merged = list(local)
+    seen = {p.get('id') for p in local if p.get('id') is not None}
+    seen_names = {(p['name'], round(p['latitude'], 1), round(p['longitude'], 1)) for p in local}
+    for place in remote:
+        if place.get('id') in seen:
+            continue
+        if (place.get('name'), round(place.get('latitude', 0), 1), round(place.get('longitude', 0), 1)) in seen_names:
+            continue
+        merged.append(place)
+    return merged[:limit]
+
+def learn_places(places):
+    for place in places:
+        gazetteer.learn(place)
+
+# --- API Routes ---
+
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+@bp.route('/api/config', methods=['GET'])
+def get_config():
+    """Return API configuration to frontend"""
+    return jsonify({
+        'google_maps_api_key': GOOGLE_MAPS_API_KEY,
+        'live_updates': STREAM_ENABLED
+    })
+
+# --- Upstream health ---
+# Open circuits are probed in the background with a cheap request, so they
+# close as soon as the host recovers instead of waiting for real traffic.
+CIRCUIT_PROBE_INTERVAL = get_setting('CIRCUIT_PROBE_INTERVAL', 10, int)
+HEALTH_DB_TIMEOUT = get_setting('HEALTH_DB_TIMEOUT', 2.0, float)
+
+def probe_params(endpoint):
+    """Smallest useful request for each upstream endpoint."""
+    day = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
+    return {
+        'geocoding': {'name': 'London', 'count': 1},
+        'reverse': reverse_geocode_params(51.51, -0.13),
+        'archive': {'latitude': 51.51, 'longitude': -0.13, 'start_date': day, 'end_date': day,
+                    'daily': 'temperature_2m_mean'},
+        'forecast': {'latitude': 51.51, 'longitude': -0.13, 'current': 'temperature_2m'}
+    }[endpoint]
+
+def probe_host(host):
+    """Probe an upstream host; None to skip this round."""
+    endpoint = next((name for name, netloc in upstream.hosts.items() if netloc == host), None)
+    if endpoint is None:
+        return None
+    if endpoint == 'reverse' and not nominatim_slot():
+        return None
+    return upstream.probe(endpoint, probe_params(endpoint))
+
+@bp.before_app_request
+def start_circuit_probe_once():
+    if not circuit_breakers.probing:
+        circuit_breakers.start_probing(with_app_context(probe_host), CIRCUIT_PROBE_INTERVAL)
+
+def upstream_health():
+    """Circuit state per upstream host, with the endpoints it serves."""
+    hosts = {}
+    for endpoint, host in upstream.hosts.items():
+        hosts.setdefault(host, []).append(endpoint)
+    return {host: dict(upstream.breaker(endpoints[0]).status(), endpoints=endpoints)
+            for host, endpoints in hosts.items()}
+
+@bp.route('/api/admin/health', methods=['GET'])
+def get_health():
+    """Upstream circuit states and database reachability.
+
+    "degraded" while any upstream circuit is not closed (cached or stale data
+    is served for it); 503 only when MongoDB is unreachable.
+    """
+    upstreams = upstream_health()
+    database = {'ok': False}
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        database['error'] = "Database not initialized"
+    else:
+        try:
+            started = time.perf_counter()
+            # Bounded, so a missing server doesn't hold the check for the full selection timeout
+            with pymongo.timeout(HEALTH_DB_TIMEOUT):
+                coll.database.command('ping')
+            database = {'ok': True, 'ms': round((time.perf_counter() - started) * 1000, 1)}
+        except PyMongoError as e:
+            database['error'] = str(e)
+
+    if not database['ok']:
+        status = 'down'
+    elif any(u['state'] != CIRCUIT_CLOSED for u in upstreams.values()):
+        status = 'degraded'
+    else:
+        status = 'ok'
+    return jsonify({
+        'status': status,
+        'upstreams': upstreams,
+        'database': database,
+        'stale_served': {name: c.stats()['stale_hits'] for name, c in cache_registry.items()
+                         if c.stale_ttl}
+    }), 503 if status == 'down' else 200
+
+@bp.route('/api/admin/stats', methods=['GET'])
+def get_admin_stats():
+    """Return runtime counters (upstream connection pool usage, cache hit rates)."""
+    stats = {
+        'upstream': upstream.stats(),
+        'circuits': circuit_breakers.status(),
+        'caches': {name: c.stats() for name, c in cache_registry.items()}
+    }
+    stats['gazetteer'] = gazetteer.stats()
+    stats['live'] = live_hub.stats()
+    stats['record_jobs'] = record_jobs.stats()
+    if async_upstream is not None:
+        stats['upstream_async'] = async_upstream.stats()
+    return jsonify(stats)
+
+@metrics.registry.collector
+def collect_runtime_stats():
+    """Cache and upstream pool counters for /metrics, read at scrape time."""
+    caches = {name: c.stats() for name, c in cache_registry.items()}
+
+    def per_cache(key):
+        return [({'cache': name}, stats[key]) for name, stats in caches.items()]
+
+    pool = upstream.stats()
+    prefetch = prefetcher.stats()
+    circuits = circuit_breakers.status()
+    live = live_hub.stats()
+    return [
+        ('cache_hits_total', 'counter', 'Cache lookups answered from the cache.', per_cache('hits')),
+        ('cache_misses_total', 'counter', 'Cache lookups that had to load.', per_cache('misses')),
+        ('cache_hit_ratio', 'gauge', 'Hits per lookup since the process started.', per_cache('hit_ratio')),
+        ('cache_entries', 'gauge', 'Entries held in memory.', per_cache('size')),
+        ('upstream_pool_reused_total', 'counter', 'Upstream requests sent on a pooled connection.',
+         [({}, pool['pool_hits'])]),
+        ('upstream_connections_total', 'counter', 'Upstream connections opened.',
+         [({}, pool['new_connections'])]),
+        ('upstream_retries_total', 'counter', 'Upstream attempts retried.',
+         [({'endpoint': name}, c['retries']) for name, c in pool['endpoints'].items()]),
+        ('upstream_rejected_total', 'counter', 'Upstream calls failed fast by an open circuit.',
+         [({'endpoint': name}, c['rejected']) for name, c in pool['endpoints'].items()]),
+        ('upstream_circuit_open', 'gauge', '1 while the host\'s circuit is open or half-open.',
+         [({'host': host}, int(c['state'] != CIRCUIT_CLOSED)) for host, c in circuits.items()]),
+        ('cache_stale_served_total', 'counter', 'Expired entries served while the upstream was failing.',
+         per_cache('stale_hits')),
+        ('live_stream_subscribers', 'gauge', 'Open live weather streams.', [({}, live['subscribers'])]),
+        ('live_stream_topics', 'gauge', 'Locations polled for live streams.', [({}, live['active_topics'])]),
+        ('live_stream_polls_total', 'counter', 'Polls made for live streams.', [({}, live['polls'])]),
+        ('prefetch_refreshes_total', 'counter', 'Background refreshes of popular locations.',
+         [({'outcome': 'ok'}, prefetch['refreshed']), ({'outcome': 'error'}, prefetch['failed'])])
+    ]
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for this process."""
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/admin/prefetch', methods=['GET'])
+def get_prefetch_status():
+    """Prefetch schedule: the most requested locations and how fresh their cached responses are."""
+    limit = request.args.get('limit', type=int)
+    return jsonify(dict(prefetcher.status(limit), enabled=PREFETCH_ENABLED))
+
+# --- Shared by the sync and async views ---
+
+def search_request():
+    """Parse a search and look it up in the gazetteer.
+
+    Returns `(query, local places, response)`; `response` is set when no API
+    call is needed (query too short, or enough local matches).
+    """
+    query = request.args.get('q', '')
+    if not query or len(query) < 2:
+        return query, [], jsonify([])
+    local = gazetteer.search(query, AUTOCOMPLETE_LIMIT)
+    if len(local) >= AUTOCOMPLETE_MIN_LOCAL:
+        return query, local, search_response(local)
+    return query, local, None
+
+def search_api_results(response):
+    """Places from a geocoding search response (none unless it is a 200)."""
+    if response.status_code != 200:
+        return None
+    return response.json().get('results') or []
+
+def search_response(local, remote=None):
+    """Search results: gazetteer matches merged with the API's, if any."""
+    if remote:
+        learn_places(remote)
+        local = merge_places(local, remote)
+    return jsonify(format_search_results({'results': local}))
+
+def weather_request():
+    """The requested location: `(location, None)`, or `(None, error response)`."""
+    location = request_location()
+    if not location:
+        return None, (jsonify({"error": "Location is required"}), 400)
+    return location, None
+
+def location_not_found(location):
+    return jsonify({"error": f"Could not find location: {location}"}), 404
+
+def current_weather_response(location_name, lat, lon, result):
+    """Response for a `get_cached_weather('current', ...)` result."""
+    weather_data, max_age, stale = result
+    if not weather_data or 'current' not in weather_data:
+        return weather_unavailable("Could not retrieve current weather data.")
+    return weather_json(format_current_weather(location_name, lat, lon, weather_data['current']),
+                        max_age, stale)
+
+def forecast_response(location_name, lat, lon, result):
+    """Response for a `get_cached_weather('forecast', ...)` result."""
+    forecast_data, max_age, stale = result
+    if not forecast_data or 'daily' not in forecast_data:
+        return weather_unavailable("Could not retrieve forecast data.")
+    return weather_json({
+        'location': location_name,
+        'latitude': lat,
+        'longitude': lon,
+        'forecast': format_forecast(forecast_data['daily'])
+    }, max_age, stale)
+
+@bp.route('/api/locations/search', methods=['GET'])
+def search_locations():
+    """Search for locations with autocomplete."""
+    query, local, done = search_request()
+    if done is not None:
+        return done
+
+    # Few local matches: ask the geocoding API, but don't let a slow
+    # upstream hold up the dropdown
+    remote = None
+    try:
+        remote = search_api_results(upstream.get('geocoding', params=search_params(query),
+                                                 timeout=AUTOCOMPLETE_TIMEOUT, retries=0))
+    except Exception as e:
+        logger.warning('Location search error: %s', e)
+    return search_response(local, remote)
+
+# Current Weather
+@bp.route('/api/weather/current', methods=['GET', 'POST'])
+def get_current_weather_api():
+    location, error = weather_request()
+    if error:
+        return error
+
+    lat, lon, found_location_name = get_location_coords(location)
+    if not lat:
+        return location_not_found(location)
+    return current_weather_response(found_location_name, lat, lon, get_cached_weather('current', lat, lon))
+
+# 5-Day Forecast
+@bp.route('/api/weather/forecast', methods=['GET', 'POST'])
+def get_forecast_api():
+    location, error = weather_request()
+    if error:
+        return error
+
+    lat, lon, found_location_name = get_location_coords(location)
+    if not lat:
+        return location_not_found(location)
+    return forecast_response(found_location_name, lat, lon, get_cached_weather('forecast', lat, lon))
+
+# --- Dashboard ---
+# One call for everything the weather page shows: the location is resolved
+# once and current conditions, the forecast and (optionally) a recent archive
+# window are fetched concurrently.
+DASHBOARD_MAX_HISTORY_DAYS = get_setting('DASHBOARD_MAX_HISTORY_DAYS', 92, int)
+
+# Worker threads for fanning out independent upstream calls within a request
+fanout_executor = metrics.ContextThreadPoolExecutor(max_workers=get_setting('FANOUT_WORKERS', 16, int),
+                                     thread_name_prefix='fanout')
+
+def resolve_and_fetch(location, fetchers):
+    """Resolve `location` and run each `fetchers[name](lat, lon)` in parallel.
+
+    Returns `(lat, lon, name, {name: result})`, or lat None when the location
+    cannot be found. For "lat,lon" input the reverse geocode runs alongside
+    the fetches.
+    """
+    coords = parse_coords(location)
+    if coords:
+        lat, lon = coords
+        name_future = fanout_executor.submit(get_city_from_coords, lat, lon)
+    else:
+        lat, lon, name = get_location_coords(location)
+        if not lat:
+            return None, None, None, {}
+        name_future = None
+    futures = {key: fanout_executor.submit(fetch, lat, lon) for key, fetch in fetchers.items()}
+    results = {key: future.result() for key, future in futures.items()}
+    if name_future is not None:
+        name = name_future.result()
+    return lat, lon, name, results
+
+def recent_history(lat, lon, days):
+    """Daily mean temperatures for the `days` days up to yesterday, from the archive store."""
+    end = datetime.date.today() - datetime.timedelta(days=1)
+    start = end - datetime.timedelta(days=days - 1)
+    series = archive_store.get_series(lat, lon, start.isoformat(), end.isoformat())
+    if series is None:
+        return None
+    return {
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'temperatures': series,
+        'temperature_summary': analytics.summarize(series['temperature_2m_mean'])
+    }
+
+def parse_history_days():
+    """Validated `history_days` parameter (0 when absent), or None if invalid."""
+    value = request_param('history_days')
+    if value in (None, ''):
+        return 0
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return None
+    if days < 0 or days > DASHBOARD_MAX_HISTORY_DAYS:
+        return None
+    return days
+
+def dashboard_request():
+    """`(location, history_days, None)`, or `(None, None, error response)`."""
+    location, error = weather_request()
+    if error:
+        return None, None, error
+    history_days = parse_history_days()
+    if history_days is None:
+        return None, None, (jsonify({
+            "error": f"history_days must be an integer between 0 and {DASHBOARD_MAX_HISTORY_DAYS}"}), 400)
+    return location, history_days, None
+
+def dashboard_fetchers(history_days):
+    fetchers = {
+        'current': lambda lat, lon: get_cached_weather('current', lat, lon),
+        'forecast': lambda lat, lon: get_cached_weather('forecast', lat, lon)
+    }
+    if history_days:
+        fetchers['history'] = lambda lat, lon: recent_history(lat, lon, history_days)
+    return fetchers
+
+def dashboard_response(lat, lon, location_name, results):
+    """Combine the fetched sections into one cacheable response.
+
+    A section that could not be fetched is null (and listed in `errors`);
+    the request only fails when neither current nor forecast data came back.
+    Sections served from stale cache entries are listed in `stale`.
+    """
+    current_data, current_age, current_stale = results['current']
+    forecast_data, forecast_age, forecast_stale = results['forecast']
+    payload = {
+        'location': location_name,
+        'latitude': lat,
+        'longitude': lon,
+        'current': None,
+        'forecast': None,
+        'errors': []
+    }
+    max_ages = []
+    stale = {}
+    if current_data and 'current' in current_data:
+        payload['current'] = format_current_weather(location_name, lat, lon, current_data['current'])
+        max_ages.append(current_age)
+        if current_stale is not None:
+            stale['current'] = current_stale
+    else:
+        payload['errors'].append('current')
+    if forecast_data and 'daily' in forecast_data:
+        payload['forecast'] = format_forecast(forecast_data['daily'])
+        max_ages.append(forecast_age)
+        if forecast_stale is not None:
+            stale['forecast'] = forecast_stale
+    else:
+        payload['errors'].append('forecast')
+    if not max_ages:
+        return weather_unavailable("Could not retrieve weather data.")
+    if 'history' in results:
+        payload['history'] = results['history']
+        if results['history'] is None:
+            payload['errors'].append('history')
+    return weather_json(payload, min(max_ages), stale or None)
+
+@bp.route('/api/weather/dashboard', methods=['GET', 'POST'])
+def get_dashboard_api():
+    location, history_days, error = dashboard_request()
+    if error:
+        return error
+
+    lat, lon, found_location_name, results = resolve_and_fetch(location, dashboard_fetchers(history_days))
+    if not lat:
+        return location_not_found(location)
+    return dashboard_response(lat, lon, found_location_name, results)
+
+# --- Live updates ---
+# `GET /api/weather/stream` keeps a Server-Sent Events connection open and
+# pushes current conditions as they change. All streams for the same place
+# (coordinates rounded like the weather cache) share one poll loop that reads
+# through the weather cache, so upstream calls scale with distinct locations.
+# Every open stream holds a server thread for its whole lifetime, so streams
+# are off unless STREAM_ENABLED is set (on a server with threads to spare) and
+# capped per process by STREAM_MAX_SUBSCRIBERS.
+STREAM_ENABLED = get_setting('STREAM_ENABLED', False, bool)
+STREAM_HEARTBEAT = get_setting('STREAM_HEARTBEAT', 15, int)
+STREAM_RETRY_MS = get_setting('STREAM_RETRY_MS', 5000, int)
+
+def live_current_weather(key):
+    """Poll function for the live hub: current conditions for a rounded location."""
+    lat, lon = key
+    data, max_age, stale = get_cached_weather('current', lat, lon)
+    if not data or 'current' not in data:
+        return None, 0
+    fields = format_current_weather(None, lat, lon, data['current'])
+    for name in ('location', 'latitude', 'longitude'):
+        del fields[name]
+    fields['observed_at'] = data['current'].get('time')
+    fields['stale'] = stale
+    return fields, max_age
+
+live_hub = LiveHub(
+    live_current_weather,
+    min_interval=get_setting('STREAM_MIN_INTERVAL', 60, int),
+    retry_interval=get_setting('STREAM_RETRY_INTERVAL', 30, int),
+    idle_ttl=get_setting('STREAM_IDLE_TTL', 60, int),
+    max_subscribers=get_setting('STREAM_MAX_SUBSCRIBERS', 100, int),
+    workers=get_setting('STREAM_POLL_WORKERS', 4, int)
+)
+
+def sse_event(event, data, dumps):
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
+@bp.route('/api/weather/stream', methods=['GET'])
+def stream_current_weather():
+    """Server-Sent Events: a `snapshot` of current conditions, then `update`
+    events with only the fields that changed."""
+    if not STREAM_ENABLED:
+        return jsonify({"error": "Live updates are disabled"}), 404
+    location = request.args.get('location')
+    if not location:
+        return jsonify({"error": "Location is required"}), 400
+
+    lat, lon, found_location_name = get_location_coords(location)
+    if not lat:
+        return location_not_found(location)
+
+    live_hub.start(current_app._get_current_object().app_context)
+    subscription = live_hub.subscribe((round(lat, 2), round(lon, 2)))
+    if subscription is None:
+        response = jsonify({"error": "Too many live streams, try again later."})
+        response.headers['Retry-After'] = str(STREAM_RETRY_MS // 1000)
+        return response, 503
+    place = {'location': found_location_name, 'latitude': lat, 'longitude': lon}
+    # The generator runs after the app context is gone
+    dumps = current_app.json.dumps
+
+    def events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while True:
+                event = subscription.get(STREAM_HEARTBEAT)
+                if event is None:
+                    # Comment line: keeps proxies from timing out the connection
+                    # and lets the server notice disconnected clients
+                    yield ": keepalive\n\n"
+                    continue
+                name, data = event
+                if name == 'snapshot':
+                    data = dict(data, **place)
+                yield sse_event(name, data, dumps)
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Async mode ---
+# With ASYNC_MODE enabled the upstream-bound read endpoints run as coroutines
+# on the httpx-based client, and independent upstream calls within a request
+# (e.g. reverse geocoding and the weather fetch for "lat,lon" input) run
+# concurrently. Mongo-backed routes keep using the pooled, thread-safe pymongo
+# client. Serve with any WSGI server, or over ASGI via asgi.py.
+ASYNC_MODE = get_setting('ASYNC_MODE', False, bool)
+async_upstream = (AsyncUpstreamClient(observer=metrics.observe_upstream, breakers=circuit_breakers)
+                  if ASYNC_MODE else None)
+
+async def _aget_json(endpoint, params):
+    """Async `_get_json`."""
+    try:
+        response = await async_upstream.get(endpoint, params=params)
+    except CircuitOpenError:
+        return None
+    except requests.RequestException as e:
+        logger.warning('Upstream %s error: %s', endpoint, e)
+        return None
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+async def aget_city_from_coords(lat, lon):
+    """Async `get_city_from_coords`."""
+    city = local_place_name(lat, lon)
+    if city:
+        return city
+    key = reverse_cache_key(lat, lon)
+    hit, city = await reverse_geocode_cache.alookup(key)
+    if not hit and REVERSE_GEOCODE_FALLBACK and nominatim_slot():
+        try:
+            response = await async_upstream.get('reverse', params=reverse_geocode_params(lat, lon), retries=0)
+            response.raise_for_status()
+            city = _place_name(response.json())
+            await reverse_geocode_cache.aset(key, city)
+        except Exception as e:
+            logger.warning('Reverse geocoding error: %s', e)
+            city = None
+    return city or coords_fallback_name(lat, lon)
+
+async def aget_location_coords(location):
+    """Async `get_location_coords` for place names (not "lat,lon" input)."""
+    key = normalize_location(location)
+    hit, cached = await geocode_cache.alookup(key)
+    if hit:
+        return tuple(cached) if cached else (None, None, None)
+    try:
+        response = await async_upstream.get('geocoding', params={'name': location, 'count': 1})
+    except requests.RequestException as e:
+        logger.warning('Geocoding error: %s', e)
+        return stale_location_coords(key)
+    # Caching the result may write to a persistent store
+    return await asyncio.get_running_loop().run_in_executor(
+        None, contextvars.copy_context().run, _geocode_result, key, location, response)
+
+async def aget_cached_weather(kind, lat, lon):
+    """Async `get_cached_weather` (shares the same response cache, and its
+    request coalescing)."""
+    ttl = WEATHER_CACHE_TTLS[kind]
+    rlat, rlon = round(lat, 2), round(lon, 2)
+    popularity.record(rlat, rlon, kind)
+
+    async def load():
+        data = await _aget_json('forecast', WEATHER_PARAMS[kind](rlat, rlon))
+        if not data:
+            return None
+        return {'data': data, 'fetched_at': time.time()}
+
+    key = weather_cache_key(kind, lat, lon)
+    entry = await weather_cache.aget_or_load(key, load, ttl=ttl)
+    if entry is None:
+        return stale_weather(key)
+    return _weather_entry_result(entry, ttl)
+
+async def aresolve_and_fetch(location, fetchers):
+    """Async `resolve_and_fetch`: `fetchers[name](lat, lon)` returns an awaitable.
+
+    For "lat,lon" input the reverse geocode and the fetches all run at the
+    same time.
+    """
+    names = list(fetchers)
+    coords = parse_coords(location)
+    if coords:
+        lat, lon = coords
+        name, *results = await asyncio.gather(
+            aget_city_from_coords(lat, lon),
+            *(fetchers[key](lat, lon) for key in names))
+    else:
+        lat, lon, name = await aget_location_coords(location)
+        if not lat:
+            return None, None, None, {}
+        results = await asyncio.gather(*(fetchers[key](lat, lon) for key in names))
+    return lat, lon, name, dict(zip(names, results))
+
+def aweather_fetcher(kind):
+    return lambda lat, lon: aget_cached_weather(kind, lat, lon)
+
+# The async views only differ from the sync ones in how they wait on
+# upstream calls; parsing, validation and responses are the shared helpers
+# above.
+async def search_locations_async():
+    query, local, done = search_request()
+    if done is not None:
+        return done
+    remote = None
+    try:
+        remote = search_api_results(await async_upstream.get('geocoding', params=search_params(query),
+                                                             timeout=AUTOCOMPLETE_TIMEOUT, retries=0))
+    except Exception as e:
+        logger.warning('Location search error: %s', e)
+    return search_response(local, remote)
+
+async def get_current_weather_api_async():
+    location, error = weather_request()
+    if error:
+        return error
+
+    lat, lon, found_location_name, results = await aresolve_and_fetch(
+        location, {'current': aweather_fetcher('current')})
+    if not lat:
+        return location_not_found(location)
+    return current_weather_response(found_location_name, lat, lon, results['current'])
+
+async def get_forecast_api_async():
+    location, error = weather_request()
+    if error:
+        return error
+
+    lat, lon, found_location_name, results = await aresolve_and_fetch(
+        location, {'forecast': aweather_fetcher('forecast')})
+    if not lat:
+        return location_not_found(location)
+    return forecast_response(found_location_name, lat, lon, results['forecast'])
+
+async def get_dashboard_api_async():
+    location, history_days, error = dashboard_request()
+    if error:
+        return error
+
+    fetchers = {'current': aweather_fetcher('current'), 'forecast': aweather_fetcher('forecast')}
+    if history_days:
+        # The archive store talks to MongoDB, so it runs on the fan-out threads
+        fetchers['history'] = lambda lat, lon: asyncio.get_running_loop().run_in_executor(
+            fanout_executor, recent_history, lat, lon, history_days)
+
+    lat, lon, found_location_name, results = await aresolve_and_fetch(location, fetchers)
+    if not lat:
+        return location_not_found(location)
+    return dashboard_response(lat, lon, found_location_name, results)
+
+# Same URLs and endpoint names, async implementations (installed by create_app)
+ASYNC_VIEWS = {
+    'search_locations': search_locations_async,
+    'get_current_weather_api': get_current_weather_api_async,
+    'get_forecast_api': get_forecast_api_async,
+    'get_dashboard_api': get_dashboard_api_async
+}
+
+# CREATE
+# How new and updated records store their daily series: 'json' (open-meteo's
+# lists of dates and values) or 'binary' (packed float32, see
+# temperature_storage.py). Reads accept either.
+TEMPERATURE_STORAGE = (get_setting('TEMPERATURE_STORAGE', 'json') or 'json').lower()
+if TEMPERATURE_STORAGE not in TEMPERATURE_FORMATS:
+    raise ValueError(f"TEMPERATURE_STORAGE must be one of: {', '.join(TEMPERATURE_FORMATS)}")
+
+def record_request_error(data):
+    """Validation message for a `{location, start_date, end_date}` body, or None."""
+    if not all([data.get('location'), data.get('start_date'), data.get('end_date')]):
+        return "Missing required fields"
+    if not all(isinstance(data[field], str) for field in ('location', 'start_date', 'end_date')):
+        return "Fields must be strings"
+    if not validate_date(data['start_date']) or not validate_date(data['end_date']):
+        return "Invalid date format. Use YYYY-MM-DD."
+    if data['start_date'] > data['end_date']:
+        return "Start date cannot be after end date."
+    return None
+
+def location_key(name):
+    """Lower-cased location stored next to it: location filters are prefix
+    matches on this field, which (unlike a case-insensitive regex on
+    `location`) can use its index."""
+    return name.lower()
+
+def location_prefix_filter(prefix):
+    """Case-insensitive prefix filter on the stored location."""
+    return {'location_key': {'$regex': '^' + re.escape(location_key(prefix))}}
+
+def build_record(location_name, lat, lon, start_date, end_date, daily, summary=None, resolved=True):
+    """A new `weather_history` document for a fetched daily series
+    (`resolved=False` for a placeholder name, see `get_record_location`)."""
+    # Store the archive grid point the series was built from
+    grid_lat, grid_lon = archive_store.grid_point(lat, lon)
+    record = {
+        'location': location_name,
+        'location_key': location_key(location_name),
+        'latitude': grid_lat,
+        'longitude': grid_lon,
+        'start_date': start_date,
+        'end_date': end_date,
+        'temperatures': store_series(daily, TEMPERATURE_STORAGE),
+        'temperature_summary': summary or analytics.summarize(daily['temperature_2m_mean']),
+        'created_at': datetime.datetime.utcnow()
+    }
+    if not resolved:
+        record['location_pending'] = True
+    return record
+
+def archive_error():
+    """`JobError` for an archive download that failed. Retryable, but not
+    before the archive host's circuit would let a call through."""
+    return JobError("Could not retrieve weather data.", 503, retry=True,
+                    retry_after=upstream.breaker('archive').retry_in())
+
+def create_record(location, start_date, end_date, progress=None, job_id=None):
+    """Geocode `location`, fetch its daily series and insert a new record.
+
+    Returns `(record, daily)`. Raises `JobError` with the HTTP status to
+    report when the location is unknown, the archive download fails or the
+    database is not available. With `job_id` the record is tagged with it and
+    a repeated run of that job returns the record it already created.
+    """
+    report = progress or (lambda **fields: None)
+    report(stage='geocoding')
+    lat, lon, found_location_name, resolved = get_record_location(location)
+    if not lat:
+        raise JobError(f"Could not find location: {location}", 404)
+
+    report(stage='archive')
+    daily = archive_store.get_series(lat, lon, start_date, end_date)
+    if daily is None:
+        raise archive_error()
+
+    # Insert into MongoDB - store as native JSON/dict
+    report(stage='writing')
+    new_record = build_record(found_location_name, lat, lon, start_date, end_date, daily, resolved=resolved)
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise JobError("Database not initialized", 500)
+    if job_id is None:
+        coll.insert_one(new_record)
+    else:
+        new_record['job_id'] = job_id
+        try:
+            new_record = coll.find_one_and_update({'job_id': job_id}, {'$setOnInsert': new_record},
+                                                  upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Another run of the same job inserted it first
+            new_record = coll.find_one({'job_id': job_id})
+    history_changed()
+    if new_record.get('location_pending'):
+        resolve_location_later(new_record['_id'])
+    return new_record, daily
+
+def update_record_series(record_id, location, start_date, end_date, progress=None):
+    """Re-geocode `location` and replace a record's place, dates and series.
+
+    Returns the new daily series; raises `JobError` like `create_record`.
+    """
+    report = progress or (lambda **fields: None)
+    report(stage='geocoding')
+    lat, lon, found_location_name, resolved = get_record_location(location)
+    if not lat:
+        raise JobError(f"Could not find location: {location}", 404)
+
+    report(stage='archive')
+    daily = archive_store.get_series(lat, lon, start_date, end_date)
+    if daily is None:
+        raise archive_error()
+
+    report(stage='writing')
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise JobError("Database not initialized", 500)
+    grid_lat, grid_lon = archive_store.grid_point(lat, lon)
+    fields = {
+        'location': found_location_name,
+        'location_key': location_key(found_location_name),
+        'latitude': grid_lat,
+        'longitude': grid_lon,
+        'start_date': start_date,
+        'end_date': end_date,
+        'temperatures': store_series(daily, TEMPERATURE_STORAGE),
+        'temperature_summary': analytics.summarize(daily['temperature_2m_mean']),
+        'updated_at': datetime.datetime.utcnow()
+    }
+    if resolved:
+        update = {'$set': fields, '$unset': {'location_pending': ''}}
+    else:
+        update = {'$set': dict(fields, location_pending=True)}
+    result = coll.update_one({'_id': ObjectId(record_id)}, update)
+    if result.matched_count == 0:
+        # Deleted while the job was queued
+        raise JobError("Record not found", 404)
+    history_changed()
+    if not resolved:
+        resolve_location_later(record_id)
+    return daily
+
+def record_error_response(error):
+    """HTTP response for a `JobError` raised while handling a request."""
+    if error.retry:
+        return weather_unavailable(str(error), 'archive')
+    return jsonify({"error": str(error)}), error.code
+
+@bp.route('/api/weather', methods=['POST'])
+def create_weather_record():
+    """Create a record. With `background` (see `background_requested`) the
+    work is queued as a job and the response is 202 with the job's URL."""
+    data = request.get_json()
+    error = record_request_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    location = data['location']
+    start_date = data['start_date']
+    end_date = data['end_date']
+
+    if background_requested(data):
+        return submit_record_job(
+            'create_record',
+            {'location': location, 'start_date': start_date, 'end_date': end_date},
+            f"create:{normalize_location(location)}:{start_date}:{end_date}")
+
+    try:
+        new_record, daily = create_record(location, start_date, end_date)
+    except JobError as e:
+        return record_error_response(e)
+    
+    # Convert for response
+    response_data = {
+        'id': str(new_record['_id']),
+        'location': new_record['location'],
+        'start_date': new_record['start_date'],
+        'end_date': new_record['end_date'],
+        'temperatures': temperatures_field(daily)
+    }
+
+    return jsonify(response_data), 201
+
+# --- Record jobs ---
+# Creating or re-fetching a record can take many seconds for long ranges.
+# Clients can opt in to running it in the background: the request is stored
+# as a job in the `jobs` collection and answered with 202 right away, and a
+# bounded pool of worker threads (RECORD_JOB_WORKERS per process) works through the
+# queue (bulk imports run on it too). Identical pending requests share one job, and attempts that failed
+# on the upstream are retried with exponential backoff.
+JOB_WORKERS_ENABLED = get_setting('JOB_WORKERS_ENABLED', True, bool)
+
+def run_create_record_job(payload, progress=None, job_id=None):
+    # Keyed on the job id: a re-run after an expired lease must not add a
+    # second record
+    record, _ = create_record(payload['location'], payload['start_date'], payload['end_date'], progress,
+                              job_id)
+    return {
+        'id': str(record['_id']),
+        'location': record['location'],
+        'start_date': record['start_date'],
+        'end_date': record['end_date']
+    }
+
+def run_update_record_job(payload, progress=None, job_id=None):
+    update_record_series(payload['id'], payload['location'], payload['start_date'], payload['end_date'],
+                         progress)
+    return {'id': payload['id']}
+
+def resolve_record_location(coll, record):
+    """Look up the place name of a `location_pending` record, waiting up to
+    NOMINATIM_MAX_WAIT seconds for a Nominatim slot, and save it. Returns
+    the name, or None if it still can't be looked up."""
+    resolved, city = lookup_city(record['latitude'], record['longitude'], NOMINATIM_MAX_WAIT)
+    if not resolved:
+        return None
+    name = city or coords_fallback_name(record['latitude'], record['longitude'])
+    # Only while still pending: a name set by the user in the meantime wins
+    coll.update_one({'_id': record['_id'], 'location_pending': True}, {
+        '$set': {'location': name, 'location_key': location_key(name)},
+        '$unset': {'location_pending': ''}
+    })
+    return name
+
+def run_resolve_location_job(payload, progress=None, job_id=None):
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise JobError("Database not initialized", 500, retry=True)
+    record = coll.find_one({'_id': ObjectId(payload['id']), 'location_pending': True},
+                           ['latitude', 'longitude'])
+    if record is None:
+        # Renamed or deleted since
+        return {'id': payload['id']}
+    name = resolve_record_location(coll, record)
+    if name is None:
+        raise JobError("Reverse geocoding is unavailable", 503, retry=True)
+    history_changed()
+    return {'id': payload['id'], 'location': name}
+
+def resolve_location_later(record_id):
+    """Queue a job that names a record saved with a coordinate placeholder.
+    If it can't be queued, `flask --app app resolve-locations` catches up."""
+    try:
+        record_jobs.submit('resolve_location', {'id': str(record_id)}, f"resolve:{record_id}")
+    except (QueueFull, PyMongoError) as e:
+        logger.warning('Could not queue location lookup for %s: %s', record_id, e)
+
+record_jobs = MongoJobQueue(
+    lambda: get_collection_safe('jobs'),
+    {'create_record': run_create_record_job, 'update_record': run_update_record_job,
+     'resolve_location': run_resolve_location_job},
+    workers=get_setting('RECORD_JOB_WORKERS', 2, int),
+    max_attempts=get_setting('JOB_MAX_ATTEMPTS', 3, int),
+    backoff=get_setting('JOB_RETRY_BACKOFF', 30, int),
+    lease_seconds=get_setting('JOB_LEASE_SECONDS', 300, int),
+    poll_interval=get_setting('JOB_POLL_INTERVAL', 2.0, float),
+    keep_seconds=get_setting('JOB_KEEP_SECONDS', 24 * 3600, int),
+    max_queued=get_setting('JOB_QUEUE_MAX', 1000, int)
+)
+
+@bp.before_app_request
+def start_job_workers_once():
+    # Per process, like prefetching; set JOB_WORKERS_ENABLED=0 to leave the
+    # queue to `flask --app app run-jobs` processes
+    if JOB_WORKERS_ENABLED and not record_jobs.running:
+        record_jobs.start(current_app._get_current_object().app_context)
+
+def background_requested(data=None):
+    """Whether the client asked for a write to run as a job: `?background=true`,
+    `"background": true` in the body or a `Prefer: respond-async` header."""
+    if request.args.get('background', '').lower() in ('1', 'true', 'yes'):
+        return True
+    if isinstance(data, dict) and data.get('background') is True:
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '').lower()
+
+def submit_record_job(kind, payload, dedupe_key):
+    """Queue a record job and answer 202 with its status URL."""
+    try:
+        job_id, created = record_jobs.submit(kind, payload, dedupe_key)
+        status = 'queued' if created else (record_jobs.get(job_id) or {}).get('status', 'queued')
+    except QueueFull:
+        response = jsonify({"error": "Too many pending jobs, try again later."})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    except PyMongoError as e:
+        logger.warning('Job queue error: %s', e)
+        return jsonify({"error": "Could not queue the job"}), 500
+    job_url = url_for('.get_job', job_id=job_id)
+    response = jsonify({'job_id': job_id, 'status': status, 'url': job_url, 'deduplicated': not created})
+    response.headers['Location'] = job_url
+    return response, 202
+
+# --- Bulk create ---
+BULK_MAX_ITEMS = get_setting('BULK_MAX_ITEMS', 1000, int)
+# Bulk geocoding gets its own small pool, so a large import can't take the
+# fan-out threads every dashboard request needs
+bulk_geocode_executor = metrics.ContextThreadPoolExecutor(
+    max_workers=get_setting('BULK_GEOCODE_WORKERS', 4, int), thread_name_prefix='bulk-geocode')
+
+def create_records(items, progress=None, job_id=None):
+    """Create history records for a batch of `{location, start_date, end_date}`.
+
+    Each distinct location is geocoded once, archive days missing for many
+    locations over the same span are fetched in shared multi-location
+    requests, and all records are written with one unordered insert_many.
+    Returns per-item results in input order. With `job_id` each record is
+    tagged `<job_id>:<index>`, and a repeated run of that job reports the
+    records it already saved instead of adding them again.
+    """
+    report = progress or (lambda **fields: None)
+    results = [None] * len(items)
+
+    valid = []
+    for index, item in enumerate(items):
+        error = record_request_error(item) if isinstance(item, dict) else "Item must be an object"
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'code': 400, 'error': error}
+        else:
+            valid.append(index)
+
+    # Geocode each distinct location once
+    locations = {}
+    for index in valid:
+        locations.setdefault(normalize_location(items[index]['location']), items[index]['location'])
+    report(stage='geocoding', done=0, total=len(locations))
+    coords = {}
+    for done, (key, location_coords) in enumerate(
+            zip(locations, bulk_geocode_executor.map(get_record_location, locations.values())), 1):
+        coords[key] = location_coords
+        report(done=done)
+
+    found = []
+    for index in valid:
+        item = items[index]
+        lat, lon, name, resolved = coords[normalize_location(item['location'])]
+        if not lat:
+            results[index] = {'index': index, 'status': 'error', 'code': 404,
+                              'error': f"Could not find location: {item['location']}"}
+        else:
+            found.append((index, lat, lon, name, resolved))
+
+    report(stage='archive', done=0, total=None)
+    series = archive_store.get_many(
+        [(lat, lon, items[index]['start_date'], items[index]['end_date']) for index, lat, lon, _, _ in found],
+        progress=lambda done, total: report(done=done, total=total))
+
+    summaries = iter(analytics.summarize_many([d['temperature_2m_mean'] for d in series if d is not None]))
+    records = []
+    for (index, lat, lon, name, resolved), daily in zip(found, series):
+        item = items[index]
+        if daily is None:
+            results[index] = {'index': index, 'status': 'error', 'code': 500,
+                              'error': "Could not retrieve weather data."}
+        else:
+            record = build_record(name, lat, lon, item['start_date'], item['end_date'], daily,
+                                  next(summaries), resolved)
+            if job_id is not None:
+                record['job_id'] = f"{job_id}:{index}"
+            records.append((index, record))
+
+    report(stage='writing', done=0, total=len(records))
+    if records:
+        coll = get_collection_safe('weather_history')
+        write_errors = {}
+        if coll is None:
+            write_errors = {i: "Database not initialized" for i in range(len(records))}
+        else:
+            try:
+                # insert_many assigns each document's _id before sending
+                coll.insert_many([doc for _, doc in records], ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                write_errors = {err['index']: err.get('errmsg', 'Write failed') for err in errors}
+                if job_id is not None:
+                    # Saved by an earlier run of this job (unique `job_id` index)
+                    duplicates = [err['index'] for err in errors if err.get('code') == 11000]
+                    saved = {doc['job_id']: doc for doc in coll.find(
+                        {'job_id': {'$in': [records[i][1]['job_id'] for i in duplicates]}})}
+                    for i in duplicates:
+                        doc = saved.get(records[i][1]['job_id'])
+                        if doc is not None:
+                            records[i] = (records[i][0], doc)
+                            del write_errors[i]
+            except PyMongoError as e:
+                logger.warning('Bulk insert error: %s', e)
+                write_errors = {i: "Database error" for i in range(len(records))}
+            history_changed()
+        for position, (index, doc) in enumerate(records):
+            if position in write_errors:
+                results[index] = {'index': index, 'status': 'error', 'code': 500, 'error': write_errors[position]}
+            else:
+                if doc.get('location_pending'):
+                    resolve_location_later(doc['_id'])
+                results[index] = {
+                    'index': index,
+                    'status': 'created',
+                    'id': str(doc['_id']),
+                    'location': doc['location'],
+                    'start_date': doc['start_date'],
+                    'end_date': doc['end_date']
+                }
+        report(done=len(records))
+
+    created = sum(1 for r in results if r['status'] == 'created')
+    return {'created': created, 'failed': len(results) - created, 'results': results}
+
+@bp.route('/api/weather/bulk', methods=['POST'])
+def create_weather_records_bulk():
+    """Create many records at once.
+
+    Body: a list of `{location, start_date, end_date}`, or
+    `{"items": [...], "background": true}` to run it as a job and poll
+    `/api/jobs/<id>` for progress and results.
+    """
+    data = request.get_json(silent=True)
+    background = background_requested(data)
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Expected a non-empty list of items"}), 400
+    if len(data) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_MAX_ITEMS} items per request"}), 400
+
+    if background:
+        # Only the fields a record needs go into the stored job
+        items = [{name: item.get(name) for name in ('location', 'start_date', 'end_date')}
+                 if isinstance(item, dict) else item for item in data]
+        digest = hashlib.sha1(json.dumps(items, sort_keys=True).encode()).hexdigest()
+        return submit_record_job('bulk_create', {'items': items}, f"bulk:{digest}")
+
+    return jsonify(create_records(data))
+
+def run_bulk_create_job(payload, progress=None, job_id=None):
+    return create_records(payload['items'], progress, job_id)
+
+# Bulk imports run on the same persistent queue as record jobs
+record_jobs.handlers['bulk_create'] = run_bulk_create_job
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and (when done) the result of a background job."""
+    try:
+        job = record_jobs.get(job_id)
+    except PyMongoError as e:
+        logger.warning('Job lookup error: %s', e)
+        return jsonify({"error": "Database not initialized"}), 500
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] == 'done' and 'id' in (job['result'] or {}):
+        job['result']['url'] = url_for('.get_record', id=job['result']['id'])
+    return jsonify(job)
+
+# --- History listing helpers ---
+HISTORY_PAGE_SIZE = get_setting('HISTORY_PAGE_SIZE', 50, int)
+HISTORY_MAX_PAGE_SIZE = get_setting('HISTORY_MAX_PAGE_SIZE', 500, int)
+TEMPERATURE_MODES = ('full', 'summary', 'none')
+
+def parse_datetime_param(value):
+    """Parse an ISO 8601 timestamp into a naive UTC datetime (as stored by MongoDB)."""
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def build_history_query(args):
+    """Translate history query-string filters into a MongoDB filter.
+
+    Raises ValueError with a user-facing message for invalid parameters.
+    """
+    query = {}
+
+    location = args.get('location')
+    if location:
+        query.update(location_prefix_filter(location))
+
+    # Records whose date range overlaps [from, to]
+    date_from = args.get('from')
+    date_to = args.get('to')
+    for value in (date_from, date_to):
+        if value and not validate_date(value):
+            raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+    if date_to:
+        query['start_date'] = {'$lte': date_to}
+    if date_from:
+        query['end_date'] = {'$gte': date_from}
+
+    created = {}
+    try:
+        if args.get('created_after'):
+            created['$gte'] = parse_datetime_param(args['created_after'])
+        if args.get('created_before'):
+            created['$lt'] = parse_datetime_param(args['created_before'])
+    except ValueError:
+        raise ValueError("Invalid created_after/created_before. Use ISO 8601.")
+    if created:
+        query['created_at'] = created
+
+    cursor = args.get('cursor')
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise ValueError("Invalid cursor")
+        query['_id'] = {'$lt': ObjectId(cursor)}
+
+    return query
+
+def record_summaries(records, coll=None):
+    """Return the stored temperature summaries of a batch of records.
+
+    Records saved before summaries existed are summarized on the fly, all in
+    one batch; when the caller projected their series away, they are loaded
+    from `coll` with a single query. Run `flask --app app backfill-summaries`
+    to store them once.
+    """
+    summaries = [record.get('temperature_summary') for record in records]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if not missing:
+        return summaries
+    series = {records[i]['_id']: records[i].get('temperatures') for i in missing}
+    unloaded = [_id for _id, temps in series.items() if temps is None]
+    if unloaded and coll is not None:
+        for doc in coll.find({'_id': {'$in': unloaded}}, {'temperatures': 1}):
+            series[doc['_id']] = doc.get('temperatures')
+    values = [unpack_values(series[records[i]['_id']]) for i in missing]
+    for i, summary in zip(missing, analytics.summarize_many(values)):
+        summaries[i] = summary
+    return summaries
+
+def record_summary(record, coll=None):
+    return record_summaries([record], coll)[0]
+
+def with_summaries(records, coll):
+    """Yield `(record, summary)` pairs for a cursor, a batch at a time."""
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, EXPORT_BATCH_SIZE))
+        if not batch:
+            return
+        yield from zip(batch, record_summaries(batch, coll))
+
+def serialize_record(record, temperatures='full', coll=None, summary=None):
+    """Shape a history document for the API."""
+    item = {
+        'id': str(record['_id']),
+        'location': record['location'],
+        'start_date': record['start_date'],
+        'end_date': record['end_date']
+    }
+    if temperatures == 'full':
+        item['temperatures'] = temperatures_field(unpack_series(record['temperatures']))
+    elif temperatures == 'summary':
+        item['temperature_summary'] = summary if summary is not None else record_summary(record, coll)
+    return item
+
+def ensure_indexes():
+    """Create the indexes behind history filtering and keyset pagination."""
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        return
+    coll.create_index([('location_key', 1), ('_id', -1)])
+    coll.create_index([('created_at', -1)])
+    coll.create_index([('start_date', 1), ('end_date', 1)])
+    # One record per create job, however often the job runs
+    coll.create_index([('job_id', 1)], unique=True, sparse=True)
+    archive_store.ensure_indexes()
+    record_jobs.ensure_indexes()
 
-# MongoDB Configuration
-app.config["MONGO_URI"] = "mongodb://localhost:27017/weather_app"
-mongo = PyMongo(app)
+def ensure_indexes_in_background():
+    try:
+        ensure_indexes()
+    except Exception as e:
+        logger.warning('Index creation error: %s', e)
 
-# --- New: safe helper to get a MongoDB collection ---
-def get_collection_safe(name):
-    """
-    Return the specified collection object. If the database is not initialized,
-    return None. Callers should check the return value and respond with a
-    500 error or an appropriate message when None is returned.
-    """
-    # Prefer the initialized `mongo.db` when available
-    db = getattr(mongo, 'db', None)
-    # `pymongo.database.Database` does not support truth-value testing
-    # (bool(db) raises NotImplementedError). Compare explicitly with None.
-    if db is not None:
-        return getattr(db, name, None)
-
-    # Fallback: try to obtain the database from the underlying pymongo client
-    client = getattr(mongo, 'cx', None) or getattr(mongo, 'client', None)
-    # Similarly, avoid truth-value testing on client; check for None instead.
-    if client is not None:
-        # Try to infer the database name from configuration
-        db_name = app.config.get('MONGO_DBNAME') or app.config.get('MONGO_URI', '').rsplit('/', 1)[-1]
-        try:
-            if db_name:
-                return client[db_name][name]
-        except Exception:
-            return None
+# Index setup runs once per process, in the background so the first request
+# doesn't wait on it (create_index is a no-op when the index exists). Set
+# ENSURE_INDEXES=0 when `flask --app app init-db` runs at deploy time instead.
+ENSURE_INDEXES = get_setting('ENSURE_INDEXES', True, bool)
+_indexes_started = False
 
-    return None
+@bp.before_app_request
+def ensure_indexes_once():
+    global _indexes_started
+    if _indexes_started or not ENSURE_INDEXES:
+        return
+    _indexes_started = True
+    threading.Thread(target=with_app_context(ensure_indexes_in_background), name='ensure-indexes',
+                     daemon=True).start()
+
+# READ (All) - MongoDB version
+@bp.route('/api/weather/history', methods=['GET'])
+def get_history():
+    """List saved records, newest first, one page at a time.
+
+    Query params: limit, cursor (from the previous page's X-Next-Cursor),
+    location (prefix, case-insensitive), from/to (date range overlap),
+    created_after/created_before (ISO 8601) and
+    temperatures=full|summary|none.
+    """
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        return jsonify({"error": "Database not initialized"}), 500
 
-# --- Helper Functions ---
-def validate_date(date_str):
     try:
-        datetime.datetime.strptime(date_str, '%Y-%m-%d')
-        return True
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
     except ValueError:
-        return False
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
 
-def get_location_coords(location):
-    """Geocode location to get latitude and longitude."""
-    # Check if location is already in lat,lon format
-    if ',' in location:
-        try:
-            parts = location.split(',')
-            lat = float(parts[0].strip())
-            lon = float(parts[1].strip())
-            # Validate lat/lon ranges
-            if -90 <= lat <= 90 and -180 <= lon <= 180:
-                # Use reverse geocoding to get actual city name
-                location_name = get_city_from_coords(lat, lon)
-                return lat, lon, location_name
-        except (ValueError, IndexError):
-            pass
-    
-    # Try geocoding API for location name
-    url = f"https://geocoding-api.open-meteo.com/v1/search?name={location}&count=1"
-    response = requests.get(url, timeout=10)
-    if response.status_code == 200 and response.json().get("results"):
-        data = response.json()["results"][0]
-        return data["latitude"], data["longitude"], data.get("name", location)
-    return None, None, None
+    temperatures = request.args.get('temperatures', 'full')
+    if temperatures not in TEMPERATURE_MODES:
+        return jsonify({"error": f"temperatures must be one of: {', '.join(TEMPERATURE_MODES)}"}), 400
 
-def get_city_from_coords(lat, lon):
-    """Reverse geocode coordinates to get city name."""
     try:
-        # Use Nominatim reverse geocoding (free, no API key needed)
-        url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json&accept-language=en"
-        headers = {'User-Agent': 'WeatherApp/1.0'}
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            address = data.get('address', {})
-            
-            # Try to get city name in order of preference
-            city = (address.get('city') or 
-                   address.get('town') or 
-                   address.get('village') or 
-                   address.get('municipality') or
-                   address.get('county') or
-                   address.get('state') or
-                   data.get('display_name', '').split(',')[0])
-            
-            # Add country for context
-            country = address.get('country', '')
-            if city and country:
-                return f"{city}, {country}"
-            elif city:
-                return city
-    except Exception as e:
-        print(f"Reverse geocoding error: {e}")
-    
-    # Fallback to coordinates if reverse geocoding fails
-    return f"Location ({lat:.4f}, {lon:.4f})"
+        query = build_history_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-def get_weather_data(lat, lon, start_date, end_date):
-    """Fetch historical weather data from Open-Meteo."""
-    url = f"https://archive-api.open-meteo.com/v1/archive?latitude={lat}&longitude={lon}&start_date={start_date}&end_date={end_date}&daily=temperature_2m_mean"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
+    etag = history_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
 
-def get_current_weather(lat, lon):
-    """Fetch current weather from Open-Meteo."""
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m,relative_humidity_2m,apparent_temperature,is_day,precipitation,rain,showers,snowfall,weather_code,cloud_cover,pressure_msl,surface_pressure,wind_speed_10m,wind_direction_10m,wind_gusts_10m&temperature_unit=celsius&wind_speed_unit=kmh&precipitation_unit=mm"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
+    projection = ['location', 'start_date', 'end_date']
+    if temperatures == 'full':
+        projection.append('temperatures')
+    elif temperatures == 'summary':
+        projection.append('temperature_summary')
 
-def get_forecast(lat, lon):
-    """Fetch 5-day weather forecast from Open-Meteo."""
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&daily=weather_code,temperature_2m_max,temperature_2m_min,apparent_temperature_max,apparent_temperature_min,sunrise,sunset,precipitation_sum,rain_sum,showers_sum,snowfall_sum,precipitation_hours,wind_speed_10m_max,wind_gusts_10m_max,wind_direction_10m_dominant&temperature_unit=celsius&wind_speed_unit=kmh&precipitation_unit=mm&forecast_days=5"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
+    # Fetch one extra document to know whether there is a next page
+    records = list(coll.find(query, projection).sort('_id', -1).limit(limit + 1))
+    has_more = len(records) > limit
+    records = records[:limit]
 
-def get_weather_description(code):
-    """Convert weather code to description and icon."""
-    weather_codes = {
-        0: {"description": "Clear sky", "icon": "☀️"},
-        1: {"description": "Mainly clear", "icon": "🌤️"},
-        2: {"description": "Partly cloudy", "icon": "⛅"},
-        3: {"description": "Overcast", "icon": "☁️"},
-        45: {"description": "Foggy", "icon": "🌫️"},
-        48: {"description": "Depositing rime fog", "icon": "🌫️"},
-        51: {"description": "Light drizzle", "icon": "🌦️"},
-        53: {"description": "Moderate drizzle", "icon": "🌦️"},
-        55: {"description": "Dense drizzle", "icon": "🌧️"},
-        61: {"description": "Slight rain", "icon": "🌧️"},
-        63: {"description": "Moderate rain", "icon": "🌧️"},
-        65: {"description": "Heavy rain", "icon": "🌧️"},
-        71: {"description": "Slight snow", "icon": "🌨️"},
-        73: {"description": "Moderate snow", "icon": "❄️"},
-        75: {"description": "Heavy snow", "icon": "❄️"},
-        77: {"description": "Snow grains", "icon": "🌨️"},
-        80: {"description": "Slight rain showers", "icon": "🌦️"},
-        81: {"description": "Moderate rain showers", "icon": "🌧️"},
-        82: {"description": "Violent rain showers", "icon": "⛈️"},
-        85: {"description": "Slight snow showers", "icon": "🌨️"},
-        86: {"description": "Heavy snow showers", "icon": "❄️"},
-        95: {"description": "Thunderstorm", "icon": "⛈️"},
-        96: {"description": "Thunderstorm with slight hail", "icon": "⛈️"},
-        99: {"description": "Thunderstorm with heavy hail", "icon": "⛈️"}
-    }
-    return weather_codes.get(code, {"description": "Unknown", "icon": "🌡️"})
+    if temperatures == 'summary':
+        summaries = record_summaries(records, coll)
+    else:
+        summaries = [None] * len(records)
+    response = jsonify([serialize_record(r, temperatures, coll, summary)
+                        for r, summary in zip(records, summaries)])
+    if has_more:
+        next_cursor = str(records[-1]['_id'])
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(".get_history", **args)}>; rel="next"'
+    return with_history_etag(response, etag)
 
-# --- API Routes ---
+# READ (One)
+@bp.route('/api/weather/history/<id>', methods=['GET'])
+def get_record(id):
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        return jsonify({"error": "Database not initialized"}), 500
+    if not ObjectId.is_valid(id):
+        return jsonify({"error": "Invalid record ID"}), 400
+    etag = history_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    record = coll.find_one({'_id': ObjectId(id)})
+    if not record:
+        return jsonify({"error": "Record not found"}), 404
+    return with_history_etag(jsonify(serialize_record(record)), etag)
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+ANALYTICS_MAX_WINDOW = 365
 
-@app.route('/api/config', methods=['GET'])
-def get_config():
-    """Return API configuration to frontend"""
-    return jsonify({
-        'google_maps_api_key': GOOGLE_MAPS_API_KEY
-    })
+@bp.route('/api/weather/history/<id>/analytics', methods=['GET'])
+def get_record_analytics(id):
+    """Derived series for one record: rolling mean, anomalies and degree-days.
 
-@app.route('/api/locations/search', methods=['GET'])
-def search_locations():
-    """Search for locations with autocomplete."""
-    query = request.args.get('q', '')
-    if not query or len(query) < 2:
-        return jsonify([])
-    
+    Query params: window (rolling mean days, default 7) and base (degree-day
+    base temperature, default 18). Anomalies are measured against the
+    monthly means of every stored day at the record's grid point, or the
+    record's own monthly means when it has no coordinates.
+    """
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        return jsonify({"error": "Database not initialized"}), 500
+    if not ObjectId.is_valid(id):
+        return jsonify({"error": "Invalid record ID"}), 400
     try:
-        url = f"https://geocoding-api.open-meteo.com/v1/search?name={query}&count=10&language=en&format=json"
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            results = []
-            
-            if data.get('results'):
-                for item in data['results']:
-                    location_parts = []
-                    
-                    # Add name
-                    if item.get('name'):
-                        location_parts.append(item['name'])
-                    
-                    # Add admin areas
-                    if item.get('admin1'):
-                        location_parts.append(item['admin1'])
-                    
-                    # Add country
-                    if item.get('country'):
-                        location_parts.append(item['country'])
-                    
-                    display_name = ', '.join(location_parts)
-                    
-                    results.append({
-                        'name': item.get('name', ''),
-                        'display_name': display_name,
-                        'latitude': item.get('latitude'),
-                        'longitude': item.get('longitude'),
-                        'country': item.get('country', ''),
-                        'admin1': item.get('admin1', ''),
-                        'id': item.get('id')
-                    })
-            
-            return jsonify(results)
-    except Exception as e:
-        print(f"Location search error: {e}")
-        return jsonify([])
-    
-    return jsonify([])
+        window = int(request.args.get('window', 7))
+    except ValueError:
+        window = 0
+    if not 1 <= window <= ANALYTICS_MAX_WINDOW:
+        return jsonify({"error": f"window must be an integer between 1 and {ANALYTICS_MAX_WINDOW}"}), 400
+    try:
+        base = float(request.args.get('base', analytics.DEGREE_DAY_BASE))
+    except ValueError:
+        return jsonify({"error": "base must be a number"}), 400
+    record = coll.find_one({'_id': ObjectId(id)})
+    if not record:
+        return jsonify({"error": "Record not found"}), 404
 
-# Current Weather
-@app.route('/api/weather/current', methods=['POST'])
-def get_current_weather_api():
-    data = request.get_json()
-    location = data.get('location')
-    
-    if not location:
-        return jsonify({"error": "Location is required"}), 400
-    
-    lat, lon, found_location_name = get_location_coords(location)
-    if not lat:
-        return jsonify({"error": f"Could not find location: {location}"}), 404
-    
-    weather_data = get_current_weather(lat, lon)
-    if not weather_data or 'current' not in weather_data:
-        return jsonify({"error": "Could not retrieve current weather data."}), 500
-    
-    current = weather_data['current']
-    weather_info = get_weather_description(current.get('weather_code', 0))
-    
-    return jsonify({
-        'location': found_location_name,
-        'latitude': lat,
-        'longitude': lon,
-        'temperature': current.get('temperature_2m'),
-        'feels_like': current.get('apparent_temperature'),
-        'humidity': current.get('relative_humidity_2m'),
-        'wind_speed': current.get('wind_speed_10m'),
-        'wind_direction': current.get('wind_direction_10m'),
-        'precipitation': current.get('precipitation'),
-        'cloud_cover': current.get('cloud_cover'),
-        'pressure': current.get('pressure_msl'),
-        'weather_description': weather_info['description'],
-        'weather_icon': weather_info['icon'],
-        'is_day': current.get('is_day')
-    }), 200
+    daily = unpack_series(record['temperatures'])
+    dates, values = daily['time'], daily['temperature_2m_mean']
+
+    baseline, source = {}, 'record'
+    if record.get('latitude') is not None:
+        stored = archive_store.stored_days(record['latitude'], record['longitude'])
+        baseline = analytics.monthly_means(list(stored), list(stored.values()))
+        source = 'climatology'
+    if not baseline:
+        baseline, source = analytics.monthly_means(dates, values), 'record'
 
-# 5-Day Forecast
-@app.route('/api/weather/forecast', methods=['POST'])
-def get_forecast_api():
-    data = request.get_json()
-    location = data.get('location')
-    
-    if not location:
-        return jsonify({"error": "Location is required"}), 400
-    
-    lat, lon, found_location_name = get_location_coords(location)
-    if not lat:
-        return jsonify({"error": f"Could not find location: {location}"}), 404
-    
-    forecast_data = get_forecast(lat, lon)
-    if not forecast_data or 'daily' not in forecast_data:
-        return jsonify({"error": "Could not retrieve forecast data."}), 500
-    
-    daily = forecast_data['daily']
-    forecast_list = []
-    
-    for i in range(min(5, len(daily['time']))):
-        weather_info = get_weather_description(daily['weather_code'][i])
-        forecast_list.append({
-            'date': daily['time'][i],
-            'temp_max': daily['temperature_2m_max'][i],
-            'temp_min': daily['temperature_2m_min'][i],
-            'precipitation': daily.get('precipitation_sum', [0])[i],
-            'wind_speed': daily.get('wind_speed_10m_max', [0])[i],
-            'weather_description': weather_info['description'],
-            'weather_icon': weather_info['icon']
-        })
-    
     return jsonify({
-        'location': found_location_name,
-        'latitude': lat,
-        'longitude': lon,
-        'forecast': forecast_list
-    }), 200
+        'id': str(record['_id']),
+        'location': record['location'],
+        'start_date': record['start_date'],
+        'end_date': record['end_date'],
+        'time': dates,
+        'summary': record_summary(record),
+        'rolling_mean': {'window': window, 'values': analytics.rolling_mean(values, window)},
+        'baseline': {'source': source, 'monthly_means': baseline},
+        'anomalies': analytics.anomalies(dates, values, baseline),
+        'degree_days': analytics.degree_days(values, base)
+    })
 
-# CREATE
-@app.route('/api/weather', methods=['POST'])
-def create_weather_record():
-    data = request.get_json()
-    location = data.get('location')
-    start_date = data.get('start_date')
-    end_date = data.get('end_date')
+# --- Aggregated statistics ---
+STATS_VIEWS = ('locations', 'climatology', 'extremes', 'activity')
 
-    if not all([location, start_date, end_date]):
-        return jsonify({"error": "Missing required fields"}), 400
+# Results are cached in-process, keyed by the history change counter (see
+# below), so a write from any process makes the cached results unreachable.
+stats_cache = TTLCache(
+    'stats',
+    maxsize=get_setting('STATS_CACHE_SIZE', 256, int),
+    ttl=get_setting('STATS_CACHE_TTL', 300, int)
+)
 
-    if not validate_date(start_date) or not validate_date(end_date):
-        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
-    
-    if start_date > end_date:
-        return jsonify({"error": "Start date cannot be after end date."}), 400
+# --- History change counter ---
+# Every write to weather_history bumps a counter document in `counters`.
+# History reads derive their ETag from it, so a client revalidating an
+# unchanged listing or export gets a 304 without any records being read,
+# whichever process served it first.
+def history_version():
+    """Current change counter of weather_history, or None if unavailable."""
+    counters = get_collection_safe('counters')
+    if counters is None:
+        return None
+    try:
+        doc = counters.find_one({'_id': 'weather_history'})
+    except PyMongoError as e:
+        logger.warning('Change counter read error: %s', e)
+        return None
+    return (doc or {}).get('version', 0)
 
-    lat, lon, found_location_name = get_location_coords(location)
-    if not lat:
-        return jsonify({"error": f"Could not find location: {location}"}), 404
+def history_changed():
+    """Call after any write to weather_history to drop derived caches."""
+    stats_cache.clear()
+    counters = get_collection_safe('counters')
+    if counters is None:
+        return
+    try:
+        counters.update_one({'_id': 'weather_history'}, {'$inc': {'version': 1}}, upsert=True)
+    except PyMongoError as e:
+        logger.warning('Change counter update error: %s', e)
 
-    weather_data = get_weather_data(lat, lon, start_date, end_date)
-    if not weather_data or 'daily' not in weather_data:
-        return jsonify({"error": "Could not retrieve weather data."}), 500
+def history_etag():
+    """ETag for a history read: the change counter plus the request's path and
+    query string (paging, filters and version all change the body)."""
+    version = history_version()
+    if version is None:
+        return None
+    return f"h{version}-" + hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
 
-    # Insert into MongoDB - store as native JSON/dict
-    new_record = {
-        'location': found_location_name,
-        'start_date': start_date,
-        'end_date': end_date,
-        'temperatures': weather_data['daily'],  # Store as dict directly
-        'created_at': datetime.datetime.utcnow()
-    }
-    
-    coll = get_collection_safe('weather_history')
-    if coll is None:
-        return jsonify({"error": "Database not initialized"}), 500
-    result = coll.insert_one(new_record)
-    
-    # Convert for response
-    response_data = {
-        'id': str(result.inserted_id),
-        'location': new_record['location'],
-        'start_date': new_record['start_date'],
-        'end_date': new_record['end_date'],
-        'temperatures': json.dumps(new_record['temperatures'])  # Convert to JSON string for frontend
-    }
+def history_not_modified(etag):
+    """A 304 response if the client already has `etag`, else None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_history_etag(Response(status=304), etag)
 
-    return jsonify(response_data), 201
+def with_history_etag(response, etag):
+    # Clients may keep the response but must revalidate it on every use
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        response.cache_control.private = True
+    return response
 
-# READ (All) - MongoDB version
-@app.route('/api/weather/history', methods=['GET'])
-def get_history():
+def compute_stats(coll, view, match, limit):
+    if view == 'locations':
+        return list(coll.aggregate(aggregations.location_averages(match, limit)))
+    if view == 'climatology':
+        return list(coll.aggregate(aggregations.monthly_climatology(match, 'daily_temperatures')))
+    if view == 'extremes':
+        result = list(coll.aggregate(aggregations.extreme_periods(match, limit, 'daily_temperatures')))
+        return result[0] if result else {'warmest': [], 'coldest': []}
+    return list(coll.aggregate(aggregations.records_over_time(match)))
+
+@bp.route('/api/weather/stats', methods=['GET'])
+def get_stats():
+    """Aggregate saved records inside MongoDB.
+
+    Query params: view (locations, climatology, extremes or activity; all
+    of them when omitted), location (prefix filter) and limit (rows for
+    locations/extremes, default 10).
+    """
     coll = get_collection_safe('weather_history')
     if coll is None:
         return jsonify({"error": "Database not initialized"}), 500
-    records = coll.find()
-    result = []
-    for record in records:
-        result.append({
-            'id': str(record['_id']),
-            'location': record['location'],
-            'start_date': record['start_date'],
-            'end_date': record['end_date'],
-            'temperatures': json.dumps(record['temperatures'])  # Convert to JSON string
-        })
+
+    view = request.args.get('view')
+    if view and view not in STATS_VIEWS:
+        return jsonify({"error": f"view must be one of: {', '.join(STATS_VIEWS)}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    match = {}
+    location = request.args.get('location')
+    if location:
+        match.update(location_prefix_filter(location))
+
+    cache_key = f"{history_version()}|{view}|{location_key(location or '')}|{limit}"
+    hit, result = stats_cache.lookup(cache_key)
+    if not hit:
+        views = [view] if view else STATS_VIEWS
+        result = {name: compute_stats(coll, name, match, limit) for name in views}
+        if stats_cache.ttl > 0:
+            stats_cache.set(cache_key, result)
     return jsonify(result)
 
 # UPDATE - MongoDB version
-@app.route('/api/weather/history/<id>', methods=['PUT'])
+@bp.route('/api/weather/history/<id>', methods=['PUT'])
 def update_record(id):
+    """Update a record's location, or its location and dates (re-fetching the
+    series; queued as a job with `background`, like create)."""
     coll = get_collection_safe('weather_history')
     if coll is None:
         return jsonify({"error": "Database not initialized"}), 500
@@ -402,36 +2315,30 @@ def update_record(id):
         
         if start_date > end_date:
             return jsonify({"error": "Start date cannot be after end date."}), 400
+
+        if background_requested(data):
+            return submit_record_job(
+                'update_record',
+                {'id': id, 'location': new_location, 'start_date': start_date, 'end_date': end_date},
+                f"update:{id}:{normalize_location(new_location)}:{start_date}:{end_date}")
         
         # Re-validate location and fetch new data
-        lat, lon, found_location_name = get_location_coords(new_location)
-        if not lat:
-            return jsonify({"error": f"Could not find location: {new_location}"}), 404
-        
-        weather_data = get_weather_data(lat, lon, start_date, end_date)
-        if not weather_data or 'daily' not in weather_data:
-            return jsonify({"error": "Could not retrieve weather data."}), 500
-        
-        # Update MongoDB document
-        coll.update_one(
-            {'_id': ObjectId(id)},
-            {'$set': {
-                'location': found_location_name,
-                'start_date': start_date,
-                'end_date': end_date,
-                'temperatures': weather_data['daily'],
-                'updated_at': datetime.datetime.utcnow()
-            }}
-        )
+        try:
+            update_record_series(id, new_location, start_date, end_date)
+        except JobError as e:
+            return record_error_response(e)
     else:
         # Only update location name
         coll.update_one(
             {'_id': ObjectId(id)},
             {'$set': {
                 'location': new_location,
+                'location_key': location_key(new_location),
                 'updated_at': datetime.datetime.utcnow()
-            }}
+            }, '$unset': {'location_pending': ''}}
         )
+        # (update_record_series signals its own change)
+        history_changed()
     
     # Fetch updated record
     updated_record = coll.find_one({'_id': ObjectId(id)})
@@ -440,11 +2347,11 @@ def update_record(id):
         'location': updated_record['location'],
         'start_date': updated_record['start_date'],
         'end_date': updated_record['end_date'],
-        'temperatures': json.dumps(updated_record['temperatures'])
+        'temperatures': temperatures_field(unpack_series(updated_record['temperatures']))
     })
 
 # DELETE - MongoDB version
-@app.route('/api/weather/history/<id>', methods=['DELETE'])
+@bp.route('/api/weather/history/<id>', methods=['DELETE'])
 def delete_record(id):
     coll = get_collection_safe('weather_history')
     if coll is None:
@@ -453,12 +2360,13 @@ def delete_record(id):
         result = coll.delete_one({'_id': ObjectId(id)})
         if result.deleted_count == 0:
             return jsonify({"error": "Record not found"}), 404
+        history_changed()
         return jsonify({"message": "Record deleted successfully"})
     except:
         return jsonify({"error": "Invalid record ID"}), 400, 200
 
 
-@app.route('/api/weather/history', methods=['DELETE'])
+@bp.route('/api/weather/history', methods=['DELETE'])
 def clear_history():
     """Clear all weather history records.
 
@@ -486,6 +2394,7 @@ def clear_history():
 
     try:
         result = coll.delete_many({})
+        history_changed()
         return jsonify({
             'message': 'All weather history records deleted',
             'deleted_count': int(result.deleted_count)
@@ -493,98 +2402,263 @@ def clear_history():
     except Exception as e:
         return jsonify({"error": "Failed to delete records", "details": str(e)}), 500
 
+# --- Streaming export helpers ---
+# Exports walk a batched cursor and yield one record at a time, so memory use
+# stays flat regardless of collection size and the first bytes go out
+# immediately.
+EXPORT_BATCH_SIZE = get_setting('EXPORT_BATCH_SIZE', 500, int)
+
+def export_cursor(coll, projection):
+    return coll.find({}, projection, batch_size=EXPORT_BATCH_SIZE)
+
+def streaming_download(chunks, content_type, filename):
+    response = Response(stream_with_context(chunks), content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def format_temp(value, unit='', missing=''):
+    """Format a temperature to one decimal, or `missing` when there is no value."""
+    return missing if value is None else f"{value:.1f}{unit}"
+
+def csv_line(row):
+    """Format one CSV row (with line terminator) as a string."""
+    output = StringIO()
+    csv.writer(output).writerow(row)
+    return output.getvalue()
+
 # EXPORT - JSON - MongoDB version
-@app.route('/api/export/json', methods=['GET'])
+@bp.route('/api/export/json', methods=['GET'])
 def export_json():
     """Export all weather records as JSON."""
     coll = get_collection_safe('weather_history')
     if coll is None:
         return jsonify({"error": "Database not initialized"}), 500
-    records = coll.find()
-    result = []
-    for record in records:
-        result.append({
-            'id': str(record['_id']),
-            'location': record['location'],
-            'start_date': record['start_date'],
-            'end_date': record['end_date'],
-            'temperatures': record['temperatures']  # Keep as dict for JSON export
-        })
-    
-    response = make_response(json.dumps(result, indent=2))
-    response.headers['Content-Type'] = 'application/json'
-    response.headers['Content-Disposition'] = 'attachment; filename=weather_data.json'
-    return response
+    etag = history_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    records = export_cursor(coll, ['location', 'start_date', 'end_date', 'temperatures'])
+
+    def generate():
+        # Same layout as json.dumps(records, indent=2), one element at a time
+        yield '['
+        first = True
+        for record in records:
+            item = json.dumps({
+                'id': str(record['_id']),
+                'location': record['location'],
+                'start_date': record['start_date'],
+                'end_date': record['end_date'],
+                'temperatures': unpack_series(record['temperatures'])  # Keep as dict for JSON export
+            }, indent=2)
+            yield ('\n' if first else ',\n') + textwrap.indent(item, '  ')
+            first = False
+        yield ']' if first else '\n]'
+
+    return with_history_etag(streaming_download(generate(), 'application/json', 'weather_data.json'), etag)
 
 # EXPORT - CSV - MongoDB version
-@app.route('/api/export/csv', methods=['GET'])
+@bp.route('/api/export/csv', methods=['GET'])
 def export_csv():
     """Export all weather records as CSV."""
     coll = get_collection_safe('weather_history')
     if coll is None:
         return jsonify({"error": "Database not initialized"}), 500
-    records = coll.find()
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Location', 'Start Date', 'End Date', 'Average Temperature', 'Min Temperature', 'Max Temperature'])
-    
-    for record in records:
-        temps = record['temperatures']['temperature_2m_mean']
-        avg_temp = sum(temps) / len(temps) if temps else 0
-        min_temp = min(temps) if temps else 0
-        max_temp = max(temps) if temps else 0
-        
-        writer.writerow([
-            str(record['_id']),
-            record['location'],
-            record['start_date'],
-            record['end_date'],
-            f"{avg_temp:.1f}",
-            f"{min_temp:.1f}",
-            f"{max_temp:.1f}"
-        ])
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=weather_data.csv'
-    return response
+    etag = history_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    records = export_cursor(coll, ['location', 'start_date', 'end_date', 'temperature_summary'])
+
+    def generate():
+        yield csv_line(['ID', 'Location', 'Start Date', 'End Date', 'Average Temperature', 'Min Temperature', 'Max Temperature'])
+
+        for record, summary in with_summaries(records, coll):
+            yield csv_line([
+                str(record['_id']),
+                record['location'],
+                record['start_date'],
+                record['end_date'],
+                format_temp(summary['mean']),
+                format_temp(summary['min']),
+                format_temp(summary['max'])
+            ])
+
+    return with_history_etag(streaming_download(generate(), 'text/csv', 'weather_data.csv'), etag)
 
 # EXPORT - Markdown - MongoDB version
-@app.route('/api/export/markdown', methods=['GET'])
+@bp.route('/api/export/markdown', methods=['GET'])
 def export_markdown():
     """Export all weather records as Markdown."""
     coll = get_collection_safe('weather_history')
     if coll is None:
         return jsonify({"error": "Database not initialized"}), 500
-    records = coll.find()
-    
-    md_content = "# Weather History Data\n\n"
-    md_content += f"*Generated on {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*\n\n"
-    
-    for record in records:
-        temps = record['temperatures']['temperature_2m_mean']
-        avg_temp = sum(temps) / len(temps) if temps else 0
-        min_temp = min(temps) if temps else 0
-        max_temp = max(temps) if temps else 0
-        
-        md_content += f"## {record['location']}\n\n"
-        md_content += f"- **Date Range:** {record['start_date']} to {record['end_date']}\n"
-        md_content += f"- **Average Temperature:** {avg_temp:.1f}°C\n"
-        md_content += f"- **Min Temperature:** {min_temp:.1f}°C\n"
-        md_content += f"- **Max Temperature:** {max_temp:.1f}°C\n"
-        md_content += f"- **Record ID:** {str(record['_id'])}\n\n"
-        
-        # Add Google Maps and YouTube links
-        md_content += f"### Links\n"
-        md_content += f"- [View on Google Maps](https://www.google.com/maps/search/?api=1&query={record['location'].replace(' ', '+')})\n"
-        md_content += f"- [YouTube Videos](https://www.youtube.com/results?search_query={record['location'].replace(' ', '+')}+travel)\n\n"
-        md_content += "---\n\n"
-    
-    response = make_response(md_content)
-    response.headers['Content-Type'] = 'text/markdown'
-    response.headers['Content-Disposition'] = 'attachment; filename=weather_data.md'
-    return response
+    etag = history_etag()
+    not_modified = history_not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    records = export_cursor(coll, ['location', 'start_date', 'end_date', 'temperature_summary'])
+
+    def generate():
+        yield "# Weather History Data\n\n"
+        yield f"*Generated on {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*\n\n"
+
+        for record, summary in with_summaries(records, coll):
+            query = record['location'].replace(' ', '+')
+
+            yield ''.join([
+                f"## {record['location']}\n\n",
+                f"- **Date Range:** {record['start_date']} to {record['end_date']}\n",
+                f"- **Average Temperature:** {format_temp(summary['mean'], '°C', 'N/A')}\n",
+                f"- **Min Temperature:** {format_temp(summary['min'], '°C', 'N/A')}\n",
+                f"- **Max Temperature:** {format_temp(summary['max'], '°C', 'N/A')}\n",
+                f"- **Record ID:** {str(record['_id'])}\n\n",
+                # Add Google Maps and YouTube links
+                "### Links\n",
+                f"- [View on Google Maps](https://www.google.com/maps/search/?api=1&query={query})\n",
+                f"- [YouTube Videos](https://www.youtube.com/results?search_query={query}+travel)\n\n",
+                "---\n\n"
+            ])
+
+    return with_history_etag(streaming_download(generate(), 'text/markdown', 'weather_data.md'), etag)
+
+# --- CLI commands ---
+@bp.cli.command('init-db')
+def init_db():
+    """Create the MongoDB indexes the app relies on."""
+    if get_collection_safe('weather_history') is None:
+        raise click.ClickException("Database not initialized")
+    ensure_indexes()
+    click.echo("Indexes are in place")
+
+@bp.cli.command('backfill-summaries')
+@click.option('--all', 'recompute_all', is_flag=True, help='Recompute summaries that already exist.')
+def backfill_summaries(recompute_all):
+    """Store temperature_summary on records saved before summaries existed."""
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise click.ClickException("Database not initialized")
+    query = {} if recompute_all else {'temperature_summary': {'$exists': False}}
+    ops = []
+    updated = 0
+    for record in coll.find(query, ['temperatures'], batch_size=EXPORT_BATCH_SIZE):
+        ops.append(UpdateOne({'_id': record['_id']}, {'$set': {
+            'temperature_summary': analytics.summarize(unpack_values(record.get('temperatures')))
+        }}))
+        if len(ops) >= EXPORT_BATCH_SIZE:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += coll.bulk_write(ops, ordered=False).modified_count
+    if updated:
+        history_changed()
+    click.echo(f"Updated {updated} record(s)")
+
+@bp.cli.command('backfill-location-keys')
+def backfill_location_keys():
+    """Store location_key on records saved before location filters used it."""
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise click.ClickException("Database not initialized")
+    ops = []
+    updated = 0
+    for record in coll.find({'location_key': {'$exists': False}}, ['location'], batch_size=EXPORT_BATCH_SIZE):
+        ops.append(UpdateOne({'_id': record['_id']},
+                             {'$set': {'location_key': location_key(record['location'])}}))
+        if len(ops) >= EXPORT_BATCH_SIZE:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += coll.bulk_write(ops, ordered=False).modified_count
+    if updated:
+        history_changed()
+    click.echo(f"Updated {updated} record(s)")
+
+@bp.cli.command('resolve-locations')
+def resolve_locations():
+    """Look up place names for records saved with a coordinate placeholder."""
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise click.ClickException("Database not initialized")
+    updated = pending = 0
+    for record in coll.find({'location_pending': True}, ['latitude', 'longitude']):
+        if resolve_record_location(coll, record) is None:
+            pending += 1
+            continue
+        updated += 1
+    if updated:
+        history_changed()
+    click.echo(f"Resolved {updated} record(s), {pending} still pending")
+
+@bp.cli.command('run-jobs')
+def run_jobs():
+    """Work through queued record jobs until interrupted."""
+    record_jobs.start(current_app._get_current_object().app_context)
+    click.echo(f"Running {record_jobs.workers} job workers (Ctrl+C to stop)")
+    try:
+        while record_jobs.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        record_jobs.stop()
+
+@bp.cli.command('migrate-temperatures')
+@click.option('--to', 'target', type=click.Choice(TEMPERATURE_FORMATS), default=None,
+              help='Storage format to convert to (default: TEMPERATURE_STORAGE).')
+def migrate_temperatures(target):
+    """Rewrite stored temperature series in another storage format."""
+    coll = get_collection_safe('weather_history')
+    if coll is None:
+        raise click.ClickException("Database not initialized")
+    target = target or TEMPERATURE_STORAGE
+    ops = []
+    updated = 0
+    bytes_before = bytes_after = 0
+    for record in coll.find({}, ['temperatures'], batch_size=EXPORT_BATCH_SIZE):
+        temps = record.get('temperatures')
+        converted = store_series(temps, target)
+        if converted is temps:
+            continue
+        bytes_before += len(BSON.encode({'temperatures': temps}))
+        bytes_after += len(BSON.encode({'temperatures': converted}))
+        ops.append(UpdateOne({'_id': record['_id']}, {'$set': {'temperatures': converted}}))
+        if len(ops) >= EXPORT_BATCH_SIZE:
+            updated += coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += coll.bulk_write(ops, ordered=False).modified_count
+    if updated:
+        history_changed()
+    click.echo(f"Converted {updated} record(s) to {target}: {bytes_before} -> {bytes_after} bytes of series data")
+
+# --- Application factory ---
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    `config` overrides Flask config values, e.g. `MONGO_URI` (otherwise read
+    from config.py / the environment) or the `MONGO_*` client settings in
+    database.py; each app has its own MongoDB client (see `current_mongo`).
+    Nothing here opens connections or starts threads: the MongoDB client,
+    caches and background workers all start on first use in each process, so
+    the app can be created before a server forks. Background workers are
+    shared by the process and run in the context of the app whose first
+    request (or `run-jobs` command) started them.
+    """
+    app = Flask(__name__)
+    app.config['MONGO_URI'] = get_setting('MONGO_URI', DEFAULT_MONGO_URI)
+    app.config.update(config or {})
+    mongo = LazyMongo(event_listeners=[metrics.MongoCommandListener()])
+    mongo.init_app(app)
+    if orjson is not None:
+        app.json = OrjsonProvider(app, fallback=app.json)
+    app.register_blueprint(bp)
+    if ASYNC_MODE:
+        for endpoint, view in ASYNC_VIEWS.items():
+            app.view_functions[f'{bp.name}.{endpoint}'] = view
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     app.run(debug=True, port=5001)
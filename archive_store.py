@@ -0,0 +1,224 @@
+"""Per-location store of daily mean temperatures backed by MongoDB.
+
+Historical days never change once the archive has settled, so each day is
+fetched from archive-api at most once per grid point. Requests for a date
+range only download the days the store does not have yet.
+"""
+import datetime
+import logging
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+def date_range(start_date, end_date):
+    """List every YYYY-MM-DD date from start_date to end_date inclusive."""
+    start = datetime.date.fromisoformat(start_date)
+    end = datetime.date.fromisoformat(end_date)
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def contiguous_ranges(dates):
+    """Group sorted YYYY-MM-DD dates into (first, last) runs of consecutive days."""
+    ranges = []
+    prev = None
+    for date_str in dates:
+        day = datetime.date.fromisoformat(date_str)
+        if prev is not None and (day - prev).days == 1:
+            ranges[-1][1] = date_str
+        else:
+            ranges.append([date_str, date_str])
+        prev = day
+    return [tuple(r) for r in ranges]
+
+
+class ArchiveStore:
+    """Incremental cache of archive-api daily temperatures.
+
+    `get_collection` returns the MongoDB collection (or None when the
+    database is unavailable); `fetch(lat, lon, start_date, end_date)` calls
+    archive-api and returns its JSON. The optional `fetch_many(lats, lons,
+    start_date, end_date)` does the same for several coordinates in one
+    request and returns a list of per-location JSON objects; `get_many` uses
+    it for up to `batch_size` locations at a time. Coordinates are snapped to
+    a 0.01 deg grid so nearby lookups share stored days.
+    """
+
+    def __init__(self, get_collection, fetch, settle_days=7, precision=2,
+                 fetch_many=None, batch_size=50):
+        self.get_collection = get_collection
+        self.fetch = fetch
+        self.fetch_many = fetch_many
+        self.batch_size = batch_size
+        self.settle_days = settle_days
+        self.precision = precision
+        self._indexed = False
+
+    def grid_point(self, lat, lon):
+        return round(lat, self.precision), round(lon, self.precision)
+
+    def ensure_indexes(self, coll=None):
+        coll = coll if coll is not None else self.get_collection()
+        if coll is None or self._indexed:
+            return
+        coll.create_index([('lat', ASCENDING), ('lon', ASCENDING), ('date', ASCENDING)], unique=True)
+        self._indexed = True
+
+    def stored_days(self, lat, lon):
+        """Every stored day for the grid point of (lat, lon), as {date: value}."""
+        lat, lon = self.grid_point(lat, lon)
+        coll = self.get_collection()
+        if coll is None:
+            return {}
+        try:
+            cursor = coll.find({'lat': lat, 'lon': lon}, {'_id': 0, 'date': 1, 'temperature_2m_mean': 1})
+            return {doc['date']: doc.get('temperature_2m_mean') for doc in cursor}
+        except PyMongoError as e:
+            logger.warning('Archive store read error: %s', e)
+            return {}
+
+    def _load(self, coll, lat, lon, start_date, end_date):
+        cursor = coll.find(
+            {'lat': lat, 'lon': lon, 'date': {'$gte': start_date, '$lte': end_date}},
+            {'_id': 0, 'date': 1, 'temperature_2m_mean': 1}
+        )
+        return {doc['date']: doc.get('temperature_2m_mean') for doc in cursor}
+
+    def _upserts(self, lat, lon, days):
+        # Recent days can still be null while the archive catches up; only
+        # persist nulls once they are old enough to be real gaps.
+        settled = (datetime.date.today() - datetime.timedelta(days=self.settle_days)).isoformat()
+        return [
+            UpdateOne({'lat': lat, 'lon': lon, 'date': date_str},
+                      {'$set': {'temperature_2m_mean': value}},
+                      upsert=True)
+            for date_str, value in days.items()
+            if value is not None or date_str <= settled
+        ]
+
+    def _write(self, coll, ops):
+        if not ops:
+            return
+        try:
+            coll.bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            logger.warning('Archive store write error: %s', e)
+
+    def _save(self, coll, lat, lon, days):
+        self._write(coll, self._upserts(lat, lon, days))
+
+    @staticmethod
+    def _days(data):
+        if not data or 'daily' not in data:
+            return None
+        daily = data['daily']
+        return dict(zip(daily.get('time', []), daily.get('temperature_2m_mean', [])))
+
+    def _fetch_days(self, lat, lon, start_date, end_date):
+        return self._days(self.fetch(lat, lon, start_date, end_date))
+
+    def _fetch_days_many(self, points, start_date, end_date):
+        """Days for each grid point in `points` (None where the fetch failed)."""
+        if self.fetch_many is None or len(points) == 1:
+            return [self._fetch_days(lat, lon, start_date, end_date) for lat, lon in points]
+        data = self.fetch_many([p[0] for p in points], [p[1] for p in points], start_date, end_date)
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list) or len(data) != len(points):
+            return [None] * len(points)
+        return [self._days(item) for item in data]
+
+    def get_series(self, lat, lon, start_date, end_date):
+        """Return `{'time': [...], 'temperature_2m_mean': [...]}` for the range,
+        fetching only missing days from upstream. Returns None if a needed
+        upstream fetch fails.
+        """
+        lat, lon = self.grid_point(lat, lon)
+        dates = date_range(start_date, end_date)
+
+        coll = self.get_collection()
+        known = {}
+        if coll is not None:
+            try:
+                self.ensure_indexes(coll)
+                known = self._load(coll, lat, lon, start_date, end_date)
+            except PyMongoError as e:
+                logger.warning('Archive store read error: %s', e)
+                coll = None
+
+        missing = [d for d in dates if d not in known]
+        for first, last in contiguous_ranges(missing):
+            days = self._fetch_days(lat, lon, first, last)
+            if days is None:
+                return None
+            known.update(days)
+            if coll is not None:
+                self._save(coll, lat, lon, days)
+
+        return {
+            'time': dates,
+            'temperature_2m_mean': [known.get(d) for d in dates]
+        }
+
+    def get_many(self, ranges, progress=None):
+        """Batch `get_series` for a list of `(lat, lon, start_date, end_date)`.
+
+        Stored days are read once per grid point, and days missing at several
+        points over the same span are downloaded together. Returns the series
+        in input order, with None for entries whose download failed.
+        `progress(done, total)` is called after each upstream request.
+        """
+        wanted = {}
+        for lat, lon, start_date, end_date in ranges:
+            wanted.setdefault(self.grid_point(lat, lon), set()).update(date_range(start_date, end_date))
+
+        coll = self.get_collection()
+        known = {point: {} for point in wanted}
+        if coll is not None:
+            try:
+                self.ensure_indexes(coll)
+                for (lat, lon), dates in wanted.items():
+                    known[(lat, lon)] = self._load(coll, lat, lon, min(dates), max(dates))
+            except PyMongoError as e:
+                logger.warning('Archive store read error: %s', e)
+                coll = None
+
+        # Group each point's missing runs by span: one request per span and batch
+        spans = {}
+        for point, dates in wanted.items():
+            for span in contiguous_ranges(sorted(d for d in dates if d not in known[point])):
+                spans.setdefault(span, []).append(point)
+        batches = [
+            (span, points[i:i + self.batch_size])
+            for span, points in spans.items()
+            for i in range(0, len(points), self.batch_size)
+        ]
+
+        failed = {}
+        for done, ((first, last), points) in enumerate(batches, 1):
+            ops = []
+            for point, days in zip(points, self._fetch_days_many(points, first, last)):
+                if days is None:
+                    failed.setdefault(point, set()).update(date_range(first, last))
+                    continue
+                known[point].update(days)
+                ops.extend(self._upserts(point[0], point[1], days))
+            if coll is not None:
+                self._write(coll, ops)
+            if progress:
+                progress(done, len(batches))
+
+        series = []
+        for lat, lon, start_date, end_date in ranges:
+            point = self.grid_point(lat, lon)
+            dates = date_range(start_date, end_date)
+            if not failed.get(point, set()).isdisjoint(dates):
+                series.append(None)
+                continue
+            series.append({
+                'time': dates,
+                'temperature_2m_mean': [known[point].get(d) for d in dates]
+            })
+        return series
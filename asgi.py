@@ -0,0 +1,42 @@
+"""ASGI entry point.
+
+    ASYNC_MODE=1 uvicorn asgi:application --port 5001
+
+The app stays a WSGI app behind asgiref's adapter. Every request, to sync
+and async views alike, runs in one of ASGI_THREADS (default 32) threads and
+holds it until its response has been sent; streamed responses (exports, the
+live weather stream) hold it for as long as they stream. That pool is the
+limit on requests in flight per process, not the event loop: while an async
+view awaits upstream calls its thread just waits, so the calls within one
+request run concurrently, but a process still serves at most ASGI_THREADS
+requests at once. (asgiref's own adapter runs every request in one shared
+thread, i.e. one request at a time, hence the subclass below. Under a WSGI
+server, e.g. `python app.py` or gunicorn, each async view runs in a new
+event loop in its request's thread.)
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import app
+from settings import get_setting
+
+ASGI_THREADS = get_setting('ASGI_THREADS', 32, int)
+_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+
+
+class _PooledInstance(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+                                 thread_sensitive=False, executor=_executor)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """`WsgiToAsgi` that serves requests on a thread pool instead of asgiref's
+    single thread-sensitive thread."""
+
+    async def __call__(self, scope, receive, send):
+        await _PooledInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+application = PooledWsgiToAsgi(app)
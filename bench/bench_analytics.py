@@ -0,0 +1,62 @@
+"""Throughput of the series statistics: per-record loop vs. batched NumPy.
+
+Usage: python bench/bench_analytics.py [--records N] [--days N] [--gaps F]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import analytics  # noqa: E402
+
+
+def make_series(records, days, gaps):
+    rng = random.Random(42)
+    return [[None if rng.random() < gaps else round(rng.gauss(12, 8), 1) for _ in range(days)]
+            for _ in range(records)]
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--gaps', type=float, default=0.02, help='fraction of missing days')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if analytics.np is None:
+        sys.exit("NumPy is not installed; both paths would be the same pure-Python loop.")
+    series = make_series(args.records, args.days, args.gaps)
+    print(f"{args.records} records x {args.days} days, {args.gaps:.0%} gaps, best of {args.repeat}")
+
+    loop = timed(lambda: [analytics._summarize_py(values) for values in series], args.repeat)
+    batch = timed(lambda: analytics.summarize_many(series), args.repeat)
+    print(f"summary  loop  {args.records / loop:12,.0f} records/s")
+    print(f"summary  batch {args.records / batch:12,.0f} records/s  ({loop / batch:.1f}x)")
+
+    sample = series[:max(1, args.records // 10)]
+    np_module, analytics.np = analytics.np, None
+    try:
+        loop = timed(lambda: [analytics.rolling_mean(values, 7) for values in sample], args.repeat)
+    finally:
+        analytics.np = np_module
+    batch = timed(lambda: [analytics.rolling_mean(values, 7) for values in sample], args.repeat)
+    print(f"rolling  loop  {len(sample) / loop:12,.0f} records/s")
+    print(f"rolling  numpy {len(sample) / batch:12,.0f} records/s  ({loop / batch:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
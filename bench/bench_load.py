@@ -0,0 +1,374 @@
+"""Load benchmark: the app against local upstream stand-ins.
+
+Starts the fake upstream APIs (bench/fake_upstream.py) and the app in
+their own processes, with an in-memory MongoDB (mongomock) unless
+--mongo-uri is given, seeds some history records, and then drives a
+weighted mix of requests from --concurrency client threads. Reports
+throughput, latency percentiles per endpoint and the app process's memory.
+
+    python bench/bench_load.py --requests 4000 --concurrency 16 --json before.json
+    ... change something ...
+    python bench/bench_load.py --requests 4000 --concurrency 16 --compare before.json
+
+Request sequences are seeded, so two runs with the same options send the
+same requests. mongomock is neither fast nor thread-safe the way MongoDB
+is; use --mongo-uri (a scratch database, it is dropped) for numbers that
+include real database work.
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstream import PLACES, FakeUpstream  # noqa: E402
+
+DEFAULT_MIX = ('current=30,forecast=15,dashboard=10,search=20,history=10,record=6,'
+               'export_csv=2,export_json=2,create=5')
+
+
+# --- Server processes ---
+
+def _serve_fakes(options, ready):
+    fake = FakeUpstream(0, options['latency'], options['jitter'], options['error_rate'], options['seed'])
+    ready.put(fake.urls())
+    fake.server.serve_forever()
+
+
+def _patch_mongomock():
+    # pymongo >= 4.11 passes `sort` to the bulk builder, which mongomock 4.x
+    # does not accept; updates don't use it here, so drop it.
+    from mongomock.collection import BulkOperationBuilder
+    for name in ('add_update', 'add_replace'):
+        method = getattr(BulkOperationBuilder, name)
+
+        def without_sort(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        setattr(BulkOperationBuilder, name, without_sort)
+
+
+def _database(mongo_uri):
+    if mongo_uri:
+        import pymongo
+        client = pymongo.MongoClient(mongo_uri)
+        db = client.get_default_database('weather_bench')
+        client.drop_database(db.name)
+        return db
+    import mongomock
+    _patch_mongomock()
+    return mongomock.MongoClient().weather_bench
+
+
+def _serve_app(settings, mongo_uri, ready):
+    os.environ.update(settings)
+    sys.path.insert(0, ROOT)
+    import app as weather_app
+    from werkzeug.serving import make_server
+
+    # The app's own access log (ACCESS_LOG) is off too; keep the output to the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    db = _database(mongo_uri)
+    weather_app.get_collection_safe = lambda name: db[name]
+    server = make_server('127.0.0.1', 0, weather_app.app, threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def _start(target, *args):
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    process = ctx.Process(target=target, args=args + (ready,), daemon=True)
+    process.start()
+    return process, ready.get(timeout=60)
+
+
+def process_memory(pid):
+    """Current and peak resident memory of a process in MB (None if unknown)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return {
+            'rss_mb': round(int(fields['VmRSS'].split()[0]) / 1024, 1),
+            'peak_rss_mb': round(int(fields['VmHWM'].split()[0]) / 1024, 1)
+        }
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import psutil
+        return {'rss_mb': round(psutil.Process(pid).memory_info().rss / 2 ** 20, 1), 'peak_rss_mb': None}
+    except Exception:
+        return {'rss_mb': None, 'peak_rss_mb': None}
+
+
+# --- Request mix ---
+
+def _location(rng):
+    name, country, _, lat, lon, _ = rng.choice(PLACES)
+    if rng.random() < 0.2:
+        # Coordinate input, near but not on the place
+        return f"{lat + rng.uniform(-0.2, 0.2):.4f},{lon + rng.uniform(-0.2, 0.2):.4f}"
+    return name
+
+
+def _date_range(rng):
+    start = datetime.date(2023, 1, 1) + datetime.timedelta(days=rng.randrange(300))
+    end = start + datetime.timedelta(days=rng.randrange(7, 60))
+    return start.isoformat(), end.isoformat()
+
+
+def _create_body(rng):
+    start, end = _date_range(rng)
+    return {'location': _location(rng), 'start_date': start, 'end_date': end}
+
+
+OPS = {
+    'current': lambda rng, ids: ('GET', '/api/weather/current', {'location': _location(rng)}, None),
+    'forecast': lambda rng, ids: ('GET', '/api/weather/forecast', {'location': _location(rng)}, None),
+    'dashboard': lambda rng, ids: ('GET', '/api/weather/dashboard', {'location': _location(rng)}, None),
+    'search': lambda rng, ids: ('GET', '/api/locations/search',
+                                {'q': rng.choice(PLACES)[0][:rng.randint(2, 5)]}, None),
+    'history': lambda rng, ids: ('GET', '/api/weather/history', {'temperatures': 'summary', 'limit': 50}, None),
+    'record': lambda rng, ids: ('GET', f'/api/weather/history/{rng.choice(ids)}', {'v': 2}, None),
+    'export_csv': lambda rng, ids: ('GET', '/api/export/csv', None, None),
+    'export_json': lambda rng, ids: ('GET', '/api/export/json', None, None),
+    'create': lambda rng, ids: ('POST', '/api/weather', None, _create_body(rng)),
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPS:
+            raise SystemExit(f"Unknown operation in --mix: {name} (choose from {', '.join(OPS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _worker(base, mix, seed, count, deadline, ids, results):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    sent = 0
+    while (count is None or sent < count) and (deadline is None or time.perf_counter() < deadline):
+        name = rng.choices(names, weights)[0]
+        method, path, params, body = OPS[name](rng, ids)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base + path, params=params, json=body, timeout=120)
+            status, size = response.status_code, len(response.content)
+        except requests.RequestException:
+            status, size = 'error', 0
+        results.append((name, time.perf_counter() - started, status, size))
+        sent += 1
+
+
+def drive(base, mix, concurrency, total, duration, seed, ids):
+    """Run the mix from `concurrency` threads; returns (results, seconds)."""
+    results = []
+    per_worker = None if duration else -(-total // concurrency)
+    deadline = time.perf_counter() + duration if duration else None
+    threads = [threading.Thread(target=_worker, args=(base, mix, seed * 1000 + i, per_worker, deadline, ids, results))
+               for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+# --- Reporting ---
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    # Nearest rank
+    index = min(len(sorted_values), max(1, math.ceil(q / 100 * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(s[1] * 1000 for s in samples)
+    errors = sum(1 for s in samples if s[2] == 'error' or s[2] >= 500)
+
+    def ms(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'rps': round(len(samples) / seconds, 1) if seconds else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p90_ms': ms(percentile(latencies, 90)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'kb_per_request': round(sum(s[3] for s in samples) / len(samples) / 1024, 1) if samples else None
+    }
+
+
+def build_report(results, seconds, options, memory, upstream):
+    by_endpoint = {}
+    for sample in results:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+    return {
+        'config': options,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': _git_commit()
+        },
+        'seconds': round(seconds, 2),
+        'summary': summarize(results, seconds),
+        'endpoints': {name: summarize(samples, seconds) for name, samples in sorted(by_endpoint.items())},
+        'memory': memory,
+        'upstream': upstream
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report):
+    print(f"\n{report['summary']['requests']} requests in {report['seconds']}s "
+          f"({report['config']['concurrency']} clients, commit {report['environment']['commit']})")
+    header = f"{'endpoint':<12} {'count':>7} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'KB':>7}"
+    print(header)
+    print('-' * len(header))
+    rows = list(report['endpoints'].items()) + [('all', report['summary'])]
+    for name, s in rows:
+        print(f"{name:<12} {s['requests']:>7} {s['errors']:>6} {s['rps']:>8} {s['p50_ms']:>8} "
+              f"{s['p90_ms']:>8} {s['p99_ms']:>8} {s['kb_per_request']:>7}")
+    memory = report['memory']
+    print(f"\napp memory: {memory['before']['rss_mb']} MB before load, {memory['after']['rss_mb']} MB after, "
+          f"peak {memory['after']['peak_rss_mb']} MB")
+
+
+def _change(new, old):
+    if new is None or not old:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(report, baseline, tolerance, min_samples=20):
+    """Print changes against `baseline`; returns the list of regressions."""
+    print(f"\nCompared with {baseline['environment'].get('commit')} "
+          f"(regression if p99 +{tolerance:.0f}% or rps -{tolerance:.0f}%):")
+    differing = sorted(k for k, v in report['config'].items() if baseline['config'].get(k) != v)
+    if differing:
+        print(f"Note: options differ from the baseline run: {', '.join(differing)}")
+    print(f"{'endpoint':<12} {'rps':>24} {'p50 ms':>24} {'p99 ms':>24}")
+    regressions = []
+    rows = [(name, s, baseline['endpoints'].get(name)) for name, s in report['endpoints'].items()]
+    rows.append(('all', report['summary'], baseline['summary']))
+    for name, new, old in rows:
+        if old is None:
+            continue
+        cells = []
+        for key in ('rps', 'p50_ms', 'p99_ms'):
+            change = _change(new[key], old[key])
+            cells.append(f"{old[key]} -> {new[key]}" + (f" ({change:+.0f}%)" if change is not None else ''))
+        print(f"{name:<12} " + ' '.join(f"{c:>24}" for c in cells))
+        if new['requests'] < min_samples or old['requests'] < min_samples:
+            continue
+        p99 = _change(new['p99_ms'], old['p99_ms'])
+        rps = _change(new['rps'], old['rps'])
+        if p99 is not None and p99 > tolerance:
+            regressions.append(f"{name}: p99 {old['p99_ms']} -> {new['p99_ms']} ms")
+        if rps is not None and rps < -tolerance:
+            regressions.append(f"{name}: rps {old['rps']} -> {new['rps']}")
+    old_peak = (baseline.get('memory') or {}).get('after', {}).get('peak_rss_mb')
+    new_peak = report['memory']['after']['peak_rss_mb']
+    change = _change(new_peak, old_peak)
+    if change is not None:
+        print(f"peak memory  {old_peak} -> {new_peak} MB ({change:+.0f}%)")
+        if change > tolerance:
+            regressions.append(f"peak memory {old_peak} -> {new_peak} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark against local upstream stand-ins.")
+    parser.add_argument('--requests', type=int, default=2000, help='total requests (ignored with --duration)')
+    parser.add_argument('--duration', type=float, default=None, help='run for this many seconds instead')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=200, help='requests sent before measuring')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'operation weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--records', type=int, default=200, help='history records created before the run')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean upstream latency (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='stddev of the upstream latency (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream 503s')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mongo-uri', default=None, help='scratch MongoDB database (default: mongomock)')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='app setting for the run, e.g. --set ASYNC_MODE=1 (repeatable)')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='baseline report (from --json) to compare against')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='regression threshold in percent')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    options = {key: value for key, value in vars(args).items() if key not in ('json', 'compare', 'mongo_uri')}
+    options['mongo'] = 'mongodb' if args.mongo_uri else 'mongomock'
+
+    fakes, urls = _start(_serve_fakes, {'latency': args.latency, 'jitter': args.jitter,
+                                        'error_rate': args.error_rate, 'seed': args.seed})
+    settings = dict(urls, PREFETCH_ENABLED='0', ACCESS_LOG='0', NOMINATIM_MIN_INTERVAL='0')
+    settings.update(item.split('=', 1) for item in args.set)
+    server, port = _start(_serve_app, settings, args.mongo_uri)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        rng = random.Random(args.seed)
+        response = requests.post(f"{base}/api/weather/bulk",
+                                 json=[_create_body(rng) for _ in range(args.records)], timeout=600)
+        ids = [r['id'] for r in response.json()['results'] if r['status'] == 'created']
+        if not ids:
+            raise SystemExit(f"Seeding failed: {response.status_code} {response.text[:200]}")
+        print(f"Seeded {len(ids)} records; warming up with {args.warmup} requests...")
+        drive(base, mix, args.concurrency, args.warmup, None, args.seed + 1, ids)
+
+        before = process_memory(server.pid)
+        results, seconds = drive(base, mix, args.concurrency, args.requests, args.duration, args.seed, ids)
+        after = process_memory(server.pid)
+        upstream = requests.get(f"{base}/api/admin/stats", timeout=10).json()['upstream']['endpoints']
+    finally:
+        server.terminate()
+        fakes.terminate()
+
+    report = build_report(results, seconds, options, {'before': before, 'after': after}, upstream)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + '\n  '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Startup benchmark: cold boot and first-request latency of the app.
+
+Each run starts the app in a fresh process (as a new server worker would)
+and measures how long `import app` takes (module import plus app creation),
+then the latency of the first and second request to a few endpoints. The
+first request pays for whatever was deferred from startup (database
+client, connection pool, caches), so a change that makes booting cheaper
+should show up here without making the first request much slower.
+
+    python bench/bench_startup.py --runs 7 --json before.json
+    ... change something ...
+    python bench/bench_startup.py --runs 7 --compare before.json
+
+Upstream APIs are the local stand-ins from bench/fake_upstream.py. The
+database is mongomock unless --mongo-uri is given, in which case the app
+connects with its own client (set through MONGO_URI), so the cost of
+opening the first connection is part of the first request.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import ROOT, _database, _git_commit, _serve_fakes, _start, process_memory  # noqa: E402
+
+ENDPOINTS = {
+    'config': '/api/config',
+    'history': '/api/weather/history?temperatures=summary&limit=20',
+    'current': '/api/weather/current?location=Berlin',
+    'forecast': '/api/weather/forecast?location=Paris',
+}
+
+
+def _boot_app(settings, mongo_uri, ready):
+    started = time.perf_counter()
+    os.environ.update(settings)
+    sys.path.insert(0, ROOT)
+    import app as weather_app
+    imported = time.perf_counter()
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    if not mongo_uri:
+        db = _database(None)
+        weather_app.get_collection_safe = lambda name: db[name]
+    server = make_server('127.0.0.1', 0, weather_app.app, threaded=True)
+    ready.put({'port': server.server_port, 'import_ms': (imported - started) * 1000,
+               'ready_ms': (time.perf_counter() - started) * 1000})
+    server.serve_forever()
+
+
+def boot_once(settings, mongo_uri):
+    """Boot the app once; returns that run's timings in milliseconds."""
+    started = time.perf_counter()
+    server, info = _start(_boot_app, settings, mongo_uri)
+    run = {'spawn_ms': (time.perf_counter() - started) * 1000,
+           'import_ms': info['import_ms'], 'ready_ms': info['ready_ms']}
+    base = f"http://127.0.0.1:{info['port']}"
+    try:
+        run['memory_mb'] = process_memory(server.pid)['rss_mb']
+        for attempt in ('first', 'second'):
+            for name, path in ENDPOINTS.items():
+                # A new connection each time, like a client hitting a fresh worker
+                sent = time.perf_counter()
+                response = requests.get(base + path, timeout=60)
+                run[f'{attempt}_{name}_ms'] = (time.perf_counter() - sent) * 1000
+                if response.status_code >= 500:
+                    run.setdefault('errors', []).append(f"{name}: {response.status_code}")
+    finally:
+        server.terminate()
+        server.join(10)
+    return run
+
+
+def build_report(runs, options):
+    keys = [key for key in runs[0] if key != 'errors']
+    return {
+        'config': options,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': _git_commit()
+        },
+        'median': {key: round(statistics.median(run[key] for run in runs if run.get(key) is not None), 1)
+                   for key in keys},
+        'min': {key: round(min(run[key] for run in runs if run.get(key) is not None), 1) for key in keys},
+        'errors': sorted({error for run in runs for error in run.get('errors', [])}),
+        'runs': runs
+    }
+
+
+def print_report(report):
+    median, fastest = report['median'], report['min']
+    print(f"\n{report['config']['runs']} boots (commit {report['environment']['commit']}), median (min):")
+    print(f"  spawn to ready  {median['spawn_ms']:>8} ms ({fastest['spawn_ms']})")
+    print(f"  import app      {median['import_ms']:>8} ms ({fastest['import_ms']})")
+    print(f"  memory          {median['memory_mb']:>8} MB")
+    header = f"  {'endpoint':<10} {'first ms':>10} {'second ms':>10}"
+    print('\n' + header)
+    print('  ' + '-' * (len(header) - 2))
+    for name in ENDPOINTS:
+        print(f"  {name:<10} {median[f'first_{name}_ms']:>10} {median[f'second_{name}_ms']:>10}")
+    if report['errors']:
+        print("\nErrors: " + ', '.join(report['errors']))
+
+
+def compare(report, baseline, tolerance):
+    """Print median changes against `baseline`; returns the list of regressions.
+
+    Only values of at least a few milliseconds are checked, since smaller
+    ones are mostly noise.
+    """
+    print(f"\nCompared with {baseline['environment'].get('commit')} (regression if +{tolerance:.0f}%):")
+    regressions = []
+    for key, new in report['median'].items():
+        old = baseline['median'].get(key)
+        if old is None:
+            continue
+        change = (new - old) / old * 100 if old else 0
+        print(f"  {key:<22} {old:>9} -> {new:<9} ({change:+.0f}%)")
+        if change > tolerance and new - old >= 5:
+            regressions.append(f"{key}: {old} -> {new}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start and first-request latency of the app.")
+    parser.add_argument('--runs', type=int, default=5, help='fresh boots to take the median of')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean upstream latency (seconds)')
+    parser.add_argument('--mongo-uri', default=None, help='MongoDB for the app (default: mongomock)')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='app setting for the runs, e.g. --set ASYNC_MODE=1 (repeatable)')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='baseline report (from --json) to compare against')
+    parser.add_argument('--tolerance', type=float, default=20.0, help='regression threshold in percent')
+    args = parser.parse_args()
+
+    options = {'runs': args.runs, 'latency': args.latency, 'set': args.set,
+               'mongo': 'mongodb' if args.mongo_uri else 'mongomock'}
+    fakes, urls = _start(_serve_fakes, {'latency': args.latency, 'jitter': 0.0, 'error_rate': 0.0, 'seed': 1})
+    settings = dict(urls, PREFETCH_ENABLED='0', ACCESS_LOG='0', NOMINATIM_MIN_INTERVAL='0')
+    if args.mongo_uri:
+        settings['MONGO_URI'] = args.mongo_uri
+    settings.update(item.split('=', 1) for item in args.set)
+    runs = []
+    try:
+        for i in range(args.runs):
+            runs.append(boot_once(settings, args.mongo_uri))
+            print(f"Boot {i + 1}/{args.runs}: ready in {runs[-1]['spawn_ms']:.0f} ms")
+    finally:
+        fakes.terminate()
+
+    report = build_report(runs, options)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + '\n  '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Local stand-ins for the upstream APIs, for benchmarks.
+
+Serves open-meteo geocoding, archive and forecast and Nominatim reverse
+geocoding on 127.0.0.1 with deterministic data: the same coordinates and
+dates always give the same values. Every response can be delayed
+(`latency` seconds, normally distributed with `jitter`) and a fraction
+(`error_rate`) answered with a 503, which the app retries.
+
+Run standalone with `python bench/fake_upstream.py --port 8765` and point
+the app at the URLs it prints.
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# name, country, admin1, latitude, longitude, population
+PLACES = [
+    ('Amsterdam', 'Netherlands', 'North Holland', 52.374, 4.890, 741636),
+    ('Athens', 'Greece', 'Attica', 37.984, 23.728, 664046),
+    ('Auckland', 'New Zealand', 'Auckland', -36.849, 174.763, 417910),
+    ('Bangkok', 'Thailand', 'Bangkok', 13.754, 100.501, 5104476),
+    ('Barcelona', 'Spain', 'Catalonia', 41.389, 2.159, 1620343),
+    ('Berlin', 'Germany', 'Berlin', 52.524, 13.411, 3426354),
+    ('Bogota', 'Colombia', 'Bogota D.C.', 4.610, -74.082, 7674366),
+    ('Boston', 'United States', 'Massachusetts', 42.358, -71.060, 617594),
+    ('Brisbane', 'Australia', 'Queensland', -27.468, 153.028, 958504),
+    ('Budapest', 'Hungary', 'Budapest', 47.498, 19.040, 1741041),
+    ('Buenos Aires', 'Argentina', 'Buenos Aires F.D.', -34.613, -58.377, 13076300),
+    ('Cairo', 'Egypt', 'Cairo', 30.062, 31.249, 7734614),
+    ('Cape Town', 'South Africa', 'Western Cape', -33.926, 18.423, 3433441),
+    ('Chicago', 'United States', 'Illinois', 41.850, -87.650, 2720546),
+    ('Copenhagen', 'Denmark', 'Capital Region', 55.676, 12.566, 1153615),
+    ('Delhi', 'India', 'Delhi', 28.652, 77.231, 10927986),
+    ('Dublin', 'Ireland', 'Leinster', 53.333, -6.249, 1024027),
+    ('Helsinki', 'Finland', 'Uusimaa', 60.170, 24.935, 558457),
+    ('Hong Kong', 'Hong Kong', 'Central and Western', 22.278, 114.175, 7012738),
+    ('Istanbul', 'Turkey', 'Istanbul', 41.014, 28.950, 14804116),
+    ('Jakarta', 'Indonesia', 'Jakarta', -6.215, 106.845, 8540121),
+    ('Lagos', 'Nigeria', 'Lagos', 6.454, 3.395, 9000000),
+    ('Lima', 'Peru', 'Lima', -12.043, -77.028, 7737002),
+    ('Lisbon', 'Portugal', 'Lisbon', 38.717, -9.133, 517802),
+    ('London', 'United Kingdom', 'England', 51.509, -0.126, 8961989),
+    ('Los Angeles', 'United States', 'California', 34.052, -118.244, 3971883),
+    ('Madrid', 'Spain', 'Madrid', 40.417, -3.704, 3255944),
+    ('Melbourne', 'Australia', 'Victoria', -37.814, 144.963, 4917750),
+    ('Mexico City', 'Mexico', 'Mexico City', 19.428, -99.128, 12294193),
+    ('Montreal', 'Canada', 'Quebec', 45.509, -73.588, 1600000),
+    ('Moscow', 'Russia', 'Moscow', 55.752, 37.616, 10381222),
+    ('Mumbai', 'India', 'Maharashtra', 19.073, 72.883, 12691836),
+    ('Nairobi', 'Kenya', 'Nairobi County', -1.283, 36.817, 2750547),
+    ('New York', 'United States', 'New York', 40.714, -74.006, 8804190),
+    ('Oslo', 'Norway', 'Oslo', 59.913, 10.739, 580000),
+    ('Paris', 'France', 'Ile-de-France', 48.853, 2.349, 2138551),
+    ('Prague', 'Czechia', 'Prague', 50.088, 14.421, 1165581),
+    ('Reykjavik', 'Iceland', 'Capital Region', 64.135, -21.895, 118918),
+    ('Rome', 'Italy', 'Lazio', 41.892, 12.511, 2318895),
+    ('San Francisco', 'United States', 'California', 37.775, -122.419, 864816),
+    ('Santiago', 'Chile', 'Santiago Metropolitan', -33.457, -70.648, 4837295),
+    ('Sao Paulo', 'Brazil', 'Sao Paulo', -23.548, -46.636, 10021295),
+    ('Seoul', 'South Korea', 'Seoul', 37.566, 126.978, 10349312),
+    ('Singapore', 'Singapore', 'Singapore', 1.290, 103.850, 3547809),
+    ('Stockholm', 'Sweden', 'Stockholm', 59.333, 18.065, 1515017),
+    ('Sydney', 'Australia', 'New South Wales', -33.868, 151.207, 4627345),
+    ('Tokyo', 'Japan', 'Tokyo', 35.690, 139.692, 8336599),
+    ('Toronto', 'Canada', 'Ontario', 43.701, -79.416, 2600000),
+    ('Vienna', 'Austria', 'Vienna', 48.208, 16.372, 1691468),
+    ('Warsaw', 'Poland', 'Mazovia', 52.230, 21.012, 1702139),
+]
+
+WEATHER_CODES = (0, 1, 2, 3, 45, 51, 61, 63, 71, 80, 95)
+
+
+def _noise(*parts):
+    """Deterministic value in [0, 1) for the given key."""
+    return zlib.crc32(':'.join(str(p) for p in parts).encode()) / 2 ** 32
+
+
+def daily_mean(lat, lon, date):
+    """Plausible daily mean temperature: latitude, season and some noise."""
+    day = date.timetuple().tm_yday
+    season = math.cos(2 * math.pi * (day - 200) / 365.25) * (1 if lat >= 0 else -1)
+    value = 27 - 0.45 * abs(lat) + (4 + 0.25 * abs(lat)) * season + 6 * (_noise(lat, lon, date) - 0.5)
+    return round(value, 1)
+
+
+def _daily_value(field, lat, lon, date):
+    mean = daily_mean(lat, lon, date)
+    noise = _noise(field, lat, lon, date)
+    if field == 'weather_code':
+        return WEATHER_CODES[int(noise * len(WEATHER_CODES))]
+    if field in ('sunrise', 'sunset'):
+        hour = 6 if field == 'sunrise' else 18
+        return f"{date.isoformat()}T{hour:02d}:{int(noise * 60):02d}"
+    if field.endswith('_max'):
+        return round(mean + 3 + 3 * noise, 1)
+    if field.endswith('_min'):
+        return round(mean - 3 - 3 * noise, 1)
+    if field == 'temperature_2m_mean':
+        return mean
+    if field.startswith('wind_direction'):
+        return int(noise * 360)
+    return round(max(noise - 0.6, 0) * 20, 1)
+
+
+def _current_value(field, lat, lon, now):
+    noise = _noise(field, lat, lon, now.hour)
+    if field in ('temperature_2m', 'apparent_temperature'):
+        return round(daily_mean(lat, lon, now.date()) + 4 * (noise - 0.5), 1)
+    if field == 'weather_code':
+        return WEATHER_CODES[int(noise * len(WEATHER_CODES))]
+    if field == 'is_day':
+        return int(6 <= now.hour < 18)
+    if field == 'relative_humidity_2m':
+        return int(40 + noise * 60)
+    if field in ('pressure_msl', 'surface_pressure'):
+        return round(990 + noise * 40, 1)
+    if field == 'wind_direction_10m':
+        return int(noise * 360)
+    return round(max(noise - 0.5, 0) * 30, 1)
+
+
+def _dates(start, end):
+    day = datetime.date.fromisoformat(start)
+    end = datetime.date.fromisoformat(end)
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def _coords(query):
+    lats = [float(v) for v in query['latitude'][0].split(',')]
+    lons = [float(v) for v in query['longitude'][0].split(',')]
+    return list(zip(lats, lons))
+
+
+def geocoding(query):
+    name = query.get('name', [''])[0].strip().lower()
+    count = int(query.get('count', ['10'])[0])
+    matches = [p for p in PLACES if p[0].lower().startswith(name)] if name else []
+    matches.sort(key=lambda p: -p[5])
+    if not matches:
+        return {'generationtime_ms': 0.1}
+    return {'results': [
+        {'id': i, 'name': n, 'country': c, 'admin1': a, 'latitude': lat, 'longitude': lon,
+         'population': pop, 'country_code': c[:2].upper()}
+        for i, (n, c, a, lat, lon, pop) in enumerate(matches[:count])
+    ]}
+
+
+def reverse(query):
+    lat, lon = float(query['lat'][0]), float(query['lon'][0])
+    name, country = min(PLACES, key=lambda p: (p[3] - lat) ** 2 + (p[4] - lon) ** 2)[:2]
+    return {'display_name': f"{name}, {country}", 'address': {'city': name, 'country': country}}
+
+
+def archive(query):
+    fields = query.get('daily', ['temperature_2m_mean'])[0].split(',')
+    results = []
+    for lat, lon in _coords(query):
+        days = list(_dates(query['start_date'][0], query['end_date'][0]))
+        daily = {'time': [d.isoformat() for d in days]}
+        for field in fields:
+            daily[field] = [_daily_value(field, lat, lon, d) for d in days]
+        results.append({'latitude': lat, 'longitude': lon, 'timezone': 'GMT', 'daily': daily})
+    return results if len(results) > 1 else results[0]
+
+
+def forecast(query):
+    (lat, lon), = _coords(query)
+    now = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    result = {'latitude': lat, 'longitude': lon, 'timezone': 'GMT'}
+    if 'current' in query:
+        current = {'time': now.isoformat(timespec='minutes'), 'interval': 900}
+        for field in query['current'][0].split(','):
+            current[field] = _current_value(field, lat, lon, now)
+        result['current'] = current
+    if 'daily' in query:
+        days = [now.date() + datetime.timedelta(days=i) for i in range(int(query.get('forecast_days', ['7'])[0]))]
+        daily = {'time': [d.isoformat() for d in days]}
+        for field in query['daily'][0].split(','):
+            daily[field] = [_daily_value(field, lat, lon, d) for d in days]
+        result['daily'] = daily
+    return result
+
+
+ROUTES = {
+    '/v1/search': geocoding,
+    '/reverse': reverse,
+    '/v1/archive': archive,
+    '/v1/forecast': forecast,
+}
+
+
+class FakeUpstream:
+    """The fake APIs on one local port, served from a background thread."""
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def urls(self):
+        """Settings that point the app at this server."""
+        base = f"http://127.0.0.1:{self.port}"
+        return {
+            'GEOCODING_URL': f"{base}/v1/search",
+            'REVERSE_URL': f"{base}/reverse",
+            'ARCHIVE_URL': f"{base}/v1/archive",
+            'FORECAST_URL': f"{base}/v1/forecast",
+        }
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-upstream', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _draw(self):
+        with self._lock:
+            delay = max(self._random.gauss(self.latency, self.jitter), 0) if self.latency else 0
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                route = ROUTES.get(url.path)
+                with fake._lock:
+                    fake.counts[url.path] = fake.counts.get(url.path, 0) + 1
+                delay, failed = fake._draw()
+                if delay:
+                    time.sleep(delay)
+                if route is None:
+                    status, payload = 404, {'error': True, 'reason': 'Not found'}
+                elif failed:
+                    status, payload = 503, {'error': True, 'reason': 'Injected failure'}
+                else:
+                    try:
+                        status, payload = 200, route(parse_qs(url.query))
+                    except (KeyError, ValueError) as e:
+                        status, payload = 400, {'error': True, 'reason': f"Bad request: {e}"}
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake open-meteo / Nominatim APIs.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean delay per response (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='stddev of the delay (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 503 responses')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    fake = FakeUpstream(args.port, args.latency, args.jitter, args.error_rate, args.seed)
+    for name, url in fake.urls().items():
+        print(f"{name}={url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,429 @@
+"""In-process TTL caches with LRU eviction and optional persistent stores."""
+import asyncio
+import concurrent.futures
+import contextvars
+import datetime
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Every cache registers itself here so admin/metrics endpoints can report on it.
+registry = {}
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key runs `fn`; callers arriving while it is in
+    flight wait for and share its result (or exception). Sync (`do`) and
+    async (`ado`) callers share the same flights, whichever thread or event
+    loop they run on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> concurrent.futures.Future
+        self.coalesced = 0
+
+    def _join(self, key):
+        # Returns (future, leader)
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = concurrent.futures.Future()
+                return call, True
+            self.coalesced += 1
+            return call, False
+
+    def _finish(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn):
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return call.result()
+            except concurrent.futures.CancelledError:
+                # An async leader was cancelled; take over
+                continue
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            call.set_exception(e)
+            raise
+        self._finish(key)
+        call.set_result(result)
+        return result
+
+    async def ado(self, key, fn):
+        """Like `do()` for a coroutine function `fn`."""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # Shielded: a cancelled waiter must not cancel the shared call
+                return await asyncio.shield(asyncio.wrap_future(call))
+            except asyncio.CancelledError:
+                if not call.cancelled():
+                    raise
+                # The leader was cancelled; take over
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._finish(key)
+            call.cancel()
+            raise
+        except BaseException as e:
+            self._finish(key)
+            call.set_exception(e)
+            raise
+        self._finish(key)
+        call.set_result(result)
+        return result
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL.
+
+    `None` is a valid cached value and is treated as a negative entry (a known
+    miss); negative entries use `negative_ttl`. When a `store` is given,
+    local misses fall through to it and writes are copied to it, so entries
+    survive restarts and can be shared between worker processes.
+
+    With `stale_ttl`, expired entries are kept in memory for that much longer
+    so `stale()` can still return them, e.g. when the upstream that would
+    refresh them is down. Lookups never return stale entries.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=3600, negative_ttl=300, store=None, stale_ttl=0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'negative_hits': 0,
+            'store_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'stale_hits': 0,
+        }
+        registry[name] = self
+
+    def _insert(self, key, value, expires_at):
+        # Caller holds the lock.
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def lookup(self, key):
+        """Return `(hit, value)`. A hit with value None is a negative entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self._stats['hits'] += 1
+                    if value is None:
+                        self._stats['negative_hits'] += 1
+                    return True, value
+                if expires_at + self.stale_ttl <= now:
+                    del self._data[key]
+                    self._stats['expirations'] += 1
+
+        if self.store is not None:
+            stored = self.store.load(key)
+            if stored is not None and stored[1] > now:
+                value, expires_at = stored
+                with self._lock:
+                    self._insert(key, value, expires_at)
+                    self._stats['hits'] += 1
+                    self._stats['store_hits'] += 1
+                    if value is None:
+                        self._stats['negative_hits'] += 1
+                return True, value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return False, None
+
+    def get(self, key, default=None):
+        hit, value = self.lookup(key)
+        return value if hit and value is not None else default
+
+    def _peek(self, key):
+        # Like lookup() for the local map only, without touching stats.
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is not None and entry[1] > time.time():
+            return True, entry[0]
+        return False, None
+
+    def stale(self, key):
+        """Return `(hit, value)` for a local entry even if it has expired, as
+        long as it expired less than `stale_ttl` seconds ago."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] + self.stale_ttl <= time.time():
+                return False, None
+            self._stats['stale_hits'] += 1
+        return True, entry[0]
+
+    def peek(self, key):
+        """Like `lookup()` (including the store), but without counting a hit
+        or miss or refreshing the entry's LRU position."""
+        hit, value = self._peek(key)
+        if hit or self.store is None:
+            return hit, value
+        stored = self.store.load(key)
+        if stored is not None and stored[1] > time.time():
+            return True, stored[0]
+        return False, None
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling `loader()` on a miss.
+
+        Concurrent misses for the same key share a single `loader()` call.
+        A None result from the loader is returned but not cached (use set()
+        directly for negative entries).
+        """
+        hit, value = self.lookup(key)
+        if hit:
+            return value
+
+        def load():
+            # Another flight may have filled the entry between our lookup
+            # and becoming the leader.
+            hit, value = self._peek(key)
+            if hit:
+                return value
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+
+        return self._flights.do(key, load)
+
+    async def alookup(self, key):
+        """`lookup()` for coroutines: a persistent store is read in the
+        default executor (with the caller's context variables) instead of
+        blocking the event loop."""
+        if self.store is None:
+            return self.lookup(key)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, self.lookup, key)
+
+    async def aget_or_load(self, key, loader, ttl=None):
+        """`get_or_load()` for a coroutine function `loader`.
+
+        Shares its flights with `get_or_load()`, so concurrent misses for a
+        key make one upstream call whether they come from sync or async
+        views, on any event loop.
+        """
+        hit, value = await self.alookup(key)
+        if hit:
+            return value
+
+        async def load():
+            hit, value = self._peek(key)
+            if hit:
+                return value
+            value = await loader()
+            if value is not None:
+                await self.aset(key, value, ttl)
+            return value
+
+        return await self._flights.ado(key, load)
+
+    async def aset(self, key, value, ttl=None):
+        """`set()` for coroutines (a persistent store is written in the
+        default executor)."""
+        if self.store is None:
+            return self.set(key, value, ttl)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, self.set, key, value, ttl)
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._insert(key, value, expires_at)
+        if self.store is not None:
+            self.store.save(key, value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        stats['maxsize'] = self.maxsize
+        stats['coalesced'] = self._flights.coalesced
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['store'] = type(self.store).__name__ if self.store is not None else None
+        return stats
+
+
+# --- Persistent backing stores ---
+# Stores are best-effort: any error is swallowed and treated as a miss, so a
+# broken store never takes down the request path.
+
+class SQLiteStore:
+    """Cache entries in a local SQLite file (one table per namespace)."""
+
+    def __init__(self, path, namespace):
+        self.path = path
+        self.table = ''.join(c if c.isalnum() else '_' for c in namespace)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} '
+                         '(key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+            self._conn = conn
+        return self._conn
+
+    def load(self, key):
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning('SQLite cache load error: %s', e)
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, key, value, expires_at):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+                             (key, json.dumps(value), expires_at))
+                conn.execute(f'DELETE FROM {self.table} WHERE expires_at < ?', (time.time(),))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning('SQLite cache save error: %s', e)
+
+    def delete(self, key):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning('SQLite cache delete error: %s', e)
+
+    def clear(self):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(f'DELETE FROM {self.table}')
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning('SQLite cache clear error: %s', e)
+
+
+class MongoStore:
+    """Cache entries in a MongoDB collection shared by every worker.
+
+    `get_collection` is a callable so the collection is resolved lazily.
+    Keys are prefixed with `namespace`; a TTL index on `expires_at` lets
+    MongoDB purge expired entries on its own.
+    """
+
+    def __init__(self, get_collection, namespace):
+        self.get_collection = get_collection
+        self.namespace = namespace
+        self._indexed = False
+
+    def _coll(self):
+        coll = self.get_collection()
+        if coll is not None and not self._indexed:
+            try:
+                coll.create_index('expires_at', expireAfterSeconds=0)
+                self._indexed = True
+            except Exception as e:
+                logger.warning('Mongo cache index error: %s', e)
+        return coll
+
+    def _id(self, key):
+        return f"{self.namespace}:{key}"
+
+    def load(self, key):
+        try:
+            coll = self._coll()
+            doc = coll.find_one({'_id': self._id(key)}) if coll is not None else None
+        except Exception as e:
+            logger.warning('Mongo cache load error: %s', e)
+            return None
+        if doc is None:
+            return None
+        expires_at = doc['expires_at'].replace(tzinfo=datetime.timezone.utc).timestamp()
+        return doc.get('value'), expires_at
+
+    def save(self, key, value, expires_at):
+        try:
+            coll = self._coll()
+            if coll is not None:
+                coll.replace_one({'_id': self._id(key)}, {
+                    'value': value,
+                    'expires_at': datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+                }, upsert=True)
+        except Exception as e:
+            logger.warning('Mongo cache save error: %s', e)
+
+    def delete(self, key):
+        try:
+            coll = self._coll()
+            if coll is not None:
+                coll.delete_one({'_id': self._id(key)})
+        except Exception as e:
+            logger.warning('Mongo cache delete error: %s', e)
+
+    def clear(self):
+        try:
+            coll = self._coll()
+            if coll is not None:
+                coll.delete_many({'_id': {'$regex': f'^{re.escape(self.namespace)}:'}})
+        except Exception as e:
+            logger.warning('Mongo cache clear error: %s', e)
@@ -0,0 +1,245 @@
+"""Per-host circuit breakers for upstream APIs.
+
+A breaker watches the outcomes of recent calls to one host (errors, 429/5xx
+responses and calls slower than `slow_seconds` count as failures). Once
+enough of them fail within `window` seconds it opens, and calls to that host
+fail immediately with `CircuitOpenError` instead of tying up a worker for a
+full timeout. After `open_seconds` a single trial call is let through
+(half-open): success closes the breaker, failure opens it again. A
+background prober can also test open hosts with a cheap request and close
+their breakers as soon as they recover.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+from settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a host whose breaker is open.
+
+    Subclasses `requests.RequestException`, so existing upstream error
+    handling covers it. `retry_in` is the number of seconds until the next
+    trial call is allowed.
+    """
+
+    def __init__(self, message, retry_in=None):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Failure-rate breaker for one upstream host."""
+
+    def __init__(self, name, window=30, min_requests=10, failure_rate=0.5,
+                 slow_seconds=8.0, open_seconds=30):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._events = deque()  # (time, failed, slow) within the window
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._stats = {'opened': 0, 'rejected': 0, 'last_failure': None, 'last_failure_at': None}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def _prune(self, now):
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    def _open(self, now):
+        # Caller holds the lock.
+        if self._state != OPEN:
+            self._stats['opened'] += 1
+            logger.warning('Circuit for %s opened: %s', self.name, self._stats['last_failure'] or 'tripped')
+        self._state = OPEN
+        self._opened_at = now
+        self._trial_in_flight = False
+
+    def _close(self):
+        # Caller holds the lock.
+        self._state = CLOSED
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._events.clear()
+
+    def allow(self):
+        """Whether a call may be made now. Counts a rejection if not."""
+        now = time.time()
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and now >= self._opened_at + self.open_seconds:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def retry_in(self):
+        """Seconds until a trial call will be allowed (0 unless open)."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(self._opened_at + self.open_seconds - time.time(), 0)
+
+    def record(self, seconds, ok, detail=None):
+        """Record the outcome of a call that `allow()` let through."""
+        now = time.time()
+        slow = seconds >= self.slow_seconds
+        failed = not ok or slow
+        with self._lock:
+            if failed:
+                self._stats['last_failure'] = detail or ('slow response' if ok else 'error')
+                self._stats['last_failure_at'] = now
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self._close()
+                return
+            if self._state == OPEN:
+                # A call that started before the breaker opened
+                return
+            self._events.append((now, failed, slow))
+            self._prune(now)
+            failures = sum(1 for event in self._events if event[1])
+            if len(self._events) >= self.min_requests and failures / len(self._events) >= self.failure_rate:
+                self._open(now)
+
+    def trip(self):
+        """Open (or re-open) the breaker now, e.g. after a failed probe."""
+        with self._lock:
+            self._open(time.time())
+
+    def reset(self):
+        """Close the breaker, e.g. after a successful probe."""
+        with self._lock:
+            self._close()
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            requests_seen = len(self._events)
+            failures = sum(1 for event in self._events if event[1])
+            slow = sum(1 for event in self._events if event[2])
+            stats = dict(self._stats)
+            state = self._state
+            opened_at = self._opened_at
+        return {
+            'state': state,
+            'window_seconds': self.window,
+            'requests': requests_seen,
+            'failures': failures,
+            'slow': slow,
+            'failure_rate': round(failures / requests_seen, 3) if requests_seen else None,
+            'open_for': round(now - opened_at, 1) if opened_at is not None else None,
+            'retry_in': round(max(opened_at + self.open_seconds - now, 0), 1) if state == OPEN else None,
+            'times_opened': stats['opened'],
+            'rejected': stats['rejected'],
+            'last_failure': stats['last_failure'],
+            'last_failure_age': round(now - stats['last_failure_at'], 1) if stats['last_failure_at'] else None
+        }
+
+
+class CircuitBreakers:
+    """One breaker per host, created on first use, plus the recovery prober.
+
+    Settings (config.py or environment):
+      CIRCUIT_WINDOW         seconds of history considered (default 30)
+      CIRCUIT_MIN_REQUESTS   calls in the window before it can open (default 10)
+      CIRCUIT_FAILURE_RATE   failing fraction that opens it (default 0.5)
+      CIRCUIT_SLOW_SECONDS   calls at least this slow count as failures (default 8)
+      CIRCUIT_OPEN_SECONDS   how long it stays open before a trial call (default 30)
+    """
+
+    def __init__(self, window=None, min_requests=None, failure_rate=None, slow_seconds=None,
+                 open_seconds=None):
+        self.settings = {
+            'window': window or get_setting('CIRCUIT_WINDOW', 30, int),
+            'min_requests': min_requests or get_setting('CIRCUIT_MIN_REQUESTS', 10, int),
+            'failure_rate': failure_rate or get_setting('CIRCUIT_FAILURE_RATE', 0.5, float),
+            'slow_seconds': slow_seconds or get_setting('CIRCUIT_SLOW_SECONDS', 8.0, float),
+            'open_seconds': open_seconds or get_setting('CIRCUIT_OPEN_SECONDS', 30, int),
+        }
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._prober = None
+        self._stop = threading.Event()
+
+    def get(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    breaker = self._breakers[name] = CircuitBreaker(name, **self.settings)
+        return breaker
+
+    def status(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.status() for name, breaker in sorted(breakers.items())}
+
+    # --- recovery probing ---
+
+    @property
+    def probing(self):
+        return self._prober is not None and self._prober.is_alive()
+
+    def start_probing(self, probe, interval=10):
+        """Every `interval` seconds call `probe(name)` for each open breaker.
+
+        A True result closes the breaker; False keeps it open for another
+        `open_seconds`, so real traffic keeps failing fast meanwhile.
+        """
+        with self._lock:
+            if self.probing:
+                return
+            self._stop.clear()
+            self._prober = threading.Thread(target=self._probe_loop, args=(probe, interval),
+                                            name='circuit-probe', daemon=True)
+            self._prober.start()
+
+    def stop_probing(self):
+        self._stop.set()
+
+    def _probe_loop(self, probe, interval):
+        while not self._stop.wait(interval * random.uniform(0.8, 1.2)):
+            with self._lock:
+                breakers = [b for b in self._breakers.values() if b.state != CLOSED]
+            for breaker in breakers:
+                try:
+                    ok = probe(breaker.name)
+                except Exception:
+                    logger.exception('Circuit probe error for %s', breaker.name)
+                    ok = False
+                if ok is None:
+                    continue
+                if ok:
+                    breaker.reset()
+                else:
+                    breaker.trip()
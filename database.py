@@ -0,0 +1,94 @@
+"""Lazily created, per-process MongoDB client.
+
+pymongo clients must not be shared across a fork, so no client is created
+at import or app creation time. The first use in each process (each worker,
+when a pre-forking server such as gunicorn --preload loads the app first)
+creates one with the pool settings below; database and collection handles
+are cached per process as well.
+"""
+import os
+import threading
+
+from flask_pymongo.helpers import BSONObjectIdConverter, BSONProvider
+from pymongo import MongoClient, uri_parser
+
+from settings import get_setting
+
+# Setting (Flask config, config.py or environment) -> MongoClient option
+CLIENT_SETTINGS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+}
+
+
+class LazyMongo:
+    """Drop-in for the parts of Flask-PyMongo the app uses (`db`, `cx`),
+    with the client created on first use in each process."""
+
+    def __init__(self, **client_options):
+        self.client_options = client_options
+        self.uri = None
+        self.database_name = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._db = None
+        self._collections = {}
+
+    def init_app(self, app):
+        """Read `MONGO_URI` and the client settings from `app.config` (falling
+        back to config.py / the environment), register as
+        `app.extensions['mongo']` and install the BSON-aware JSON provider and
+        `ObjectId` URL converter, as Flask-PyMongo does. One instance serves
+        one app; create another for a second app."""
+        self.uri = app.config['MONGO_URI']
+        self.database_name = uri_parser.parse_uri(self.uri)['database']
+        for name, (option, cast) in CLIENT_SETTINGS.items():
+            value = app.config.get(name)
+            if value is None:
+                value = get_setting(name, None, cast)
+            if value is not None:
+                self.client_options[option] = cast(value)
+        with self._lock:
+            # A client for a previous configuration is replaced on next use
+            self._pid = None
+        app.extensions['mongo'] = self
+        app.url_map.converters['ObjectId'] = BSONObjectIdConverter
+        app.json = BSONProvider(app)
+
+    @property
+    def cx(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    if self.uri is None:
+                        raise RuntimeError("init_app() has not been called")
+                    # A client inherited through fork is dropped, not closed:
+                    # its sockets belong to the parent
+                    self._client = MongoClient(self.uri, **self.client_options)
+                    self._db = self._client[self.database_name] if self.database_name else None
+                    self._collections = {}
+                    self._pid = pid
+        return self._client
+
+    @property
+    def db(self):
+        """The database named in `MONGO_URI` (None if it names none)."""
+        self.cx  # creates this process's client if needed
+        return self._db
+
+    def collection(self, name):
+        """Cached collection handle, or None when there is no database."""
+        collections = self._collections if self._pid == os.getpid() else {}
+        coll = collections.get(name)
+        if coll is None:
+            db = self.db
+            if db is None:
+                return None
+            coll = self._collections.setdefault(name, db[name])
+        return coll
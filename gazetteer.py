@@ -0,0 +1,364 @@
+"""Offline place index for autocomplete and reverse geocoding.
+
+Loads a GeoNames cities dump (e.g. cities500.txt from
+https://download.geonames.org/export/dump/) into flat, array-backed columns
+and keeps a sorted list of normalized names so prefix lookups are a pair of
+bisects. Places the app has resolved through the geocoding API are learned
+on the fly, and every place carries a popularity count; results are ranked
+by popularity, then population.
+
+The same rows are bucketed into a lat/lon grid for nearest-place lookups.
+"""
+import bisect
+import heapq
+import math
+import threading
+import unicodedata
+from array import array
+
+# Sorts after any character that can appear in a key, to bound prefix ranges
+_HIGH = '\uffff'
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance in km."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def normalize(text):
+    """Lowercase, accent-free, single-spaced form used as the index key."""
+    text = text or ''
+    if text.isascii():
+        return ' '.join(text.lower().split())
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def _read_country_names(path):
+    """ISO code -> country name from GeoNames countryInfo.txt."""
+    names = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) > 4:
+                names[cols[0]] = cols[4]
+    return names
+
+
+def _read_admin1_names(path):
+    """"CC.code" -> region name from GeoNames admin1CodesASCII.txt."""
+    names = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) > 1:
+                names[cols[0]] = cols[1]
+    return names
+
+
+class Gazetteer:
+    """Prefix index over a static place list plus places learned at runtime.
+
+    Static rows live in parallel columns (row i is `names[i]`, `lats[i]`,
+    ...). `_keys` is the sorted list of `(normalized name, row)` pairs; for
+    prefixes that match more than `dense_prefix` rows the top `top_k` rows by
+    population are precomputed at load time, so even one-letter queries only
+    look at a handful of rows.
+
+    For `nearest`, rows are also ordered by the `cell_deg` grid cell they
+    fall in: `_cell_ids` (sorted) and `_cell_rows` are parallel arrays, so a
+    cell's rows are one bisected slice.
+    """
+
+    def __init__(self, top_k=10, learned_max=10000, dense_prefix=200, max_prefix=6, cell_deg=0.5):
+        self.top_k = top_k
+        self.learned_max = learned_max
+        self.dense_prefix = dense_prefix
+        self.max_prefix = max_prefix
+        self.cell_deg = cell_deg
+        self._lat_cells = int(math.ceil(180 / cell_deg))
+        self._lon_cells = int(math.ceil(360 / cell_deg))
+
+        self.names = []
+        self.countries = []
+        self.admin1 = []
+        self.lats = array('d')
+        self.lons = array('d')
+        self.populations = array('q')
+        self.ids = array('q')
+        self._keys = []
+        self._top = {}
+        self._ids_sorted = array('q')
+        self._id_rows = array('l')
+        self._cell_ids = array('l')
+        self._cell_rows = array('l')
+
+        self._lock = threading.Lock()
+        self._popularity = {}
+        self._learned = {}
+        self._learned_keys = []
+
+    def __len__(self):
+        return len(self.names)
+
+    # --- loading ---
+
+    def load(self, path, country_info_path=None, admin1_path=None, min_population=0):
+        """Load a GeoNames cities file, replacing any static rows. Returns the row count."""
+        countries = _read_country_names(country_info_path) if country_info_path else {}
+        regions = _read_admin1_names(admin1_path) if admin1_path else {}
+
+        names, country_col, admin1_col = [], [], []
+        lats, lons, populations, ids = array('d'), array('d'), array('q'), array('q')
+        keys = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) < 15:
+                    continue
+                try:
+                    population = int(cols[14] or 0)
+                    lat, lon = float(cols[4]), float(cols[5])
+                    geoname_id = int(cols[0])
+                except ValueError:
+                    continue
+                if population < min_population:
+                    continue
+                row = len(names)
+                names.append(cols[1])
+                country_col.append(countries.get(cols[8], cols[8]))
+                admin1_col.append(regions.get(f"{cols[8]}.{cols[10]}", ''))
+                lats.append(lat)
+                lons.append(lon)
+                populations.append(population)
+                ids.append(geoname_id)
+                for key in {normalize(cols[1]), normalize(cols[2])}:
+                    if key:
+                        keys.append((key, row))
+        keys.sort()
+
+        by_id = sorted(range(len(ids)), key=ids.__getitem__)
+        cells = array('l', (self._cell(lats[r], lons[r]) for r in range(len(names))))
+        by_cell = sorted(range(len(names)), key=cells.__getitem__)
+        with self._lock:
+            self.names, self.countries, self.admin1 = names, country_col, admin1_col
+            self.lats, self.lons, self.populations, self.ids = lats, lons, populations, ids
+            self._keys = keys
+            self._ids_sorted = array('q', (ids[r] for r in by_id))
+            self._id_rows = array('l', by_id)
+            self._cell_ids = array('l', (cells[r] for r in by_cell))
+            self._cell_rows = array('l', by_cell)
+            self._top = self._precompute_top()
+        return len(names)
+
+    def _precompute_top(self):
+        # A prefix can only be dense if its parent is, so only the ranges of
+        # dense prefixes are split further.
+        top = {}
+        keys = self._keys
+        pending = [('', 0, len(keys))]
+        while pending:
+            parent, start, end = pending.pop()
+            length = len(parent) + 1
+            if length > self.max_prefix:
+                continue
+            i = start
+            while i < end:
+                key = keys[i][0]
+                if len(key) < length:
+                    # The parent prefix itself is a complete name
+                    i += 1
+                    continue
+                prefix = key[:length]
+                j = bisect.bisect_left(keys, (prefix + _HIGH,), i, end)
+                if j - i > self.dense_prefix:
+                    top[prefix] = self._best_rows(i, j)
+                    pending.append((prefix, i, j))
+                i = j
+        return top
+
+    def _best_rows(self, start, end):
+        rows = {row for _, row in self._keys[start:end]}
+        return tuple(heapq.nlargest(self.top_k, rows, key=self.populations.__getitem__))
+
+    def _row_for_id(self, geoname_id):
+        i = bisect.bisect_left(self._ids_sorted, geoname_id)
+        if i < len(self._ids_sorted) and self._ids_sorted[i] == geoname_id:
+            return self._id_rows[i]
+        return None
+
+    # --- learning ---
+
+    @staticmethod
+    def _learned_key(name, lat, lon):
+        return (normalize(name), round(lat, 2), round(lon, 2))
+
+    def learn(self, item, uses=0):
+        """Add a place (a geocoding API result dict) to the index.
+
+        `uses` is added to its popularity; places already in the static
+        dataset (matched by GeoNames id) only have their popularity bumped.
+        """
+        name = item.get('name')
+        lat, lon = item.get('latitude'), item.get('longitude')
+        if not name or lat is None or lon is None:
+            return
+        geoname_id = item.get('id')
+        with self._lock:
+            if geoname_id is not None and self._row_for_id(geoname_id) is not None:
+                key = geoname_id
+            else:
+                key = self._learned_key(name, lat, lon)
+                if key not in self._learned:
+                    if len(self._learned) >= self.learned_max:
+                        return
+                    self._learned[key] = {
+                        'name': name,
+                        'latitude': lat,
+                        'longitude': lon,
+                        'country': item.get('country', ''),
+                        'admin1': item.get('admin1', ''),
+                        'id': geoname_id,
+                        'population': item.get('population') or 0
+                    }
+                    bisect.insort(self._learned_keys, key)
+            if uses:
+                self._popularity[key] = self._popularity.get(key, 0) + uses
+
+    # --- lookup ---
+
+    def _row_result(self, row):
+        return {
+            'name': self.names[row],
+            'latitude': self.lats[row],
+            'longitude': self.lons[row],
+            'country': self.countries[row],
+            'admin1': self.admin1[row],
+            'id': self.ids[row],
+            'population': self.populations[row]
+        }
+
+    def _static_rows(self, prefix):
+        rows = self._top.get(prefix)
+        if rows is not None:
+            return rows
+        start = bisect.bisect_left(self._keys, (prefix,))
+        end = bisect.bisect_left(self._keys, (prefix + _HIGH,), start)
+        if start == end:
+            return ()
+        return self._best_rows(start, end)
+
+    def search(self, query, limit=10):
+        """Places whose name starts with `query`, best first.
+
+        Results use the geocoding API's field names (name, latitude,
+        longitude, country, admin1, id, population).
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        candidates = []
+        for row in self._static_rows(prefix):
+            candidates.append((self._popularity.get(self.ids[row], 0), self._row_result(row)))
+        start = bisect.bisect_left(self._learned_keys, (prefix,))
+        for key in self._learned_keys[start:]:
+            if not key[0].startswith(prefix):
+                break
+            candidates.append((self._popularity.get(key, 0), dict(self._learned[key])))
+        candidates.sort(key=lambda c: (c[0], c[1]['population']), reverse=True)
+
+        # Learned places without a GeoNames id can duplicate static rows
+        results, seen = [], set()
+        for _, item in candidates:
+            key = (normalize(item['name']), round(item['latitude'], 1), round(item['longitude'], 1))
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append(item)
+            if len(results) == limit:
+                break
+        return results
+
+    # --- nearest place ---
+
+    def _cell_index(self, lat, lon):
+        i = min(int((lat + 90) / self.cell_deg), self._lat_cells - 1)
+        j = int(((lon + 180) % 360) / self.cell_deg) % self._lon_cells
+        return i, j
+
+    def _cell(self, lat, lon):
+        i, j = self._cell_index(lat, lon)
+        return i * self._lon_cells + j
+
+    def _cell_slice(self, i, j):
+        cell = i * self._lon_cells + j
+        start = bisect.bisect_left(self._cell_ids, cell)
+        end = bisect.bisect_right(self._cell_ids, cell, start)
+        return self._cell_rows[start:end]
+
+    def _ring(self, i, j, r):
+        """Grid cells at Chebyshev distance `r` from cell (i, j)."""
+        if r == 0:
+            yield i, j
+            return
+        width = min(2 * r + 1, self._lon_cells)
+        for di in range(-r, r + 1):
+            ci = i + di
+            if ci < 0 or ci >= self._lat_cells:
+                continue
+            if abs(di) == r:
+                offsets = range(-r, -r + width)
+            else:
+                offsets = (-r, r) if 2 * r < self._lon_cells else ()
+            for dj in offsets:
+                yield ci, (j + dj) % self._lon_cells
+
+    def nearest(self, lat, lon, max_km=50.0):
+        """The closest static place within `max_km`, or None.
+
+        Returns the place's fields plus `distance_km`. Searches outward in
+        rings of grid cells and stops once no unvisited cell can hold a
+        closer place.
+        """
+        if not self._cell_rows:
+            return None
+        i, j = self._cell_index(lat, lon)
+        best_row, best_km = None, max_km
+        # Rings needed to cover max_km in longitude at the highest latitude reached
+        edge = min(abs(lat) + max_km / KM_PER_DEGREE + self.cell_deg, 89.9)
+        cell_km = self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(edge))
+        max_rings = min(self._lon_cells // 2, int(math.ceil(max_km / cell_km)) + 1)
+        for r in range(max_rings + 1):
+            for ci, cj in self._ring(i, j, r):
+                for row in self._cell_slice(ci, cj):
+                    d = distance_km(lat, lon, self.lats[row], self.lons[row])
+                    if d <= best_km:
+                        best_row, best_km = row, d
+            # Everything outside ring r is at least r cells away; a degree
+            # of longitude shrinks towards the poles.
+            edge_lat = min(abs(lat) + (r + 1) * self.cell_deg, 90.0)
+            reach_km = r * self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+            if reach_km >= best_km:
+                break
+        if best_row is None:
+            return None
+        result = self._row_result(best_row)
+        result['distance_km'] = round(best_km, 2)
+        return result
+
+    def stats(self):
+        return {
+            'places': len(self.names),
+            'learned': len(self._learned),
+            'precomputed_prefixes': len(self._top)
+        }
@@ -0,0 +1,315 @@
+"""Background jobs with progress reporting.
+
+`MongoJobQueue` keeps jobs in a MongoDB collection, so any process can pick
+them up and report on them, they survive restarts, identical pending jobs
+are merged, and failed attempts are retried with backoff.
+"""
+import contextlib
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """A job failure with the HTTP status it maps to.
+
+    With `retry` the job is attempted again after a backoff (at least
+    `retry_after` seconds), until it runs out of attempts.
+    """
+
+    def __init__(self, message, code=500, retry=False, retry_after=0):
+        super().__init__(message)
+        self.code = code
+        self.retry = retry
+        self.retry_after = retry_after
+
+
+class QueueFull(Exception):
+    """Raised by `MongoJobQueue.submit` when `max_queued` jobs are waiting."""
+
+
+class MongoJobQueue:
+    """Jobs stored in a MongoDB collection, run by a bounded pool of threads.
+
+    `handlers` maps a job kind to `fn(payload, progress=report, job_id=id)`;
+    the return value becomes the job's `result`, and a `JobError` (or any
+    other exception) fails it. Workers claim queued jobs with an atomic
+    find-and-modify and hold a lease while running, renewed on every progress
+    report, so a job whose process died is picked up again once its lease
+    expires (counting as an attempt; a job that used up `max_attempts` fails
+    instead). A job can therefore run more than once, even concurrently when
+    a lease expires while its first run is still going, so handlers must be
+    idempotent per `job_id`. Jobs submitted with the same `dedupe_key` while one is still
+    queued or running share that job (enforced by a unique sparse index on
+    `pending_key`, which is removed when the job finishes). Finished jobs are
+    removed `keep_seconds` after they finish (TTL index).
+    """
+
+    ACTIVE = ('queued', 'running')
+
+    def __init__(self, get_collection, handlers, workers=2, max_attempts=3, backoff=30,
+                 lease_seconds=300, poll_interval=2.0, keep_seconds=24 * 3600, max_queued=1000):
+        self.get_collection = get_collection
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.keep_seconds = keep_seconds
+        self.max_queued = max_queued
+
+        self._lock = threading.Lock()
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._indexed = False
+        self._context = contextlib.nullcontext
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'done': 0, 'failed': 0, 'retried': 0,
+                       'rejected': 0}
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.utcnow()
+
+    def _collection(self):
+        coll = self.get_collection()
+        if coll is None:
+            raise PyMongoError("Database not initialized")
+        if not self._indexed:
+            self.ensure_indexes(coll)
+        return coll
+
+    def ensure_indexes(self, coll=None):
+        coll = coll if coll is not None else self.get_collection()
+        if coll is None or self._indexed:
+            return
+        coll.create_index([('pending_key', ASCENDING)], unique=True, sparse=True)
+        coll.create_index([('status', ASCENDING), ('run_after', ASCENDING)])
+        coll.create_index([('status', ASCENDING), ('lease_until', ASCENDING)])
+        coll.create_index([('expires_at', ASCENDING)], expireAfterSeconds=0)
+        self._indexed = True
+
+    # --- submitting ---
+
+    def submit(self, kind, payload, dedupe_key=None):
+        """Queue a job; returns `(job_id, created)`.
+
+        `created` is False when an identical job (same `dedupe_key`) was
+        already pending and its id is returned instead. Raises `QueueFull`
+        when too many jobs are waiting, and PyMongoError if the collection
+        can't be reached.
+        """
+        coll = self._collection()
+        if self.max_queued and coll.count_documents({'status': 'queued'}, limit=self.max_queued) >= self.max_queued:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFull(f"{self.max_queued} jobs are already queued")
+
+        now = self._now()
+        job = {
+            '_id': uuid.uuid4().hex,
+            'kind': kind,
+            'payload': payload,
+            'status': 'queued',
+            'attempts': 0,
+            'progress': {},
+            'result': None,
+            'error': None,
+            'code': None,
+            'created_at': now,
+            'run_after': now,
+            'started_at': None,
+            'finished_at': None
+        }
+        if dedupe_key is not None:
+            job['dedupe_key'] = job['pending_key'] = dedupe_key
+        for _ in range(2):
+            try:
+                coll.insert_one(job)
+                break
+            except DuplicateKeyError:
+                existing = coll.find_one({'pending_key': dedupe_key}, {'_id': 1})
+                if existing is not None:
+                    with self._lock:
+                        self._stats['deduplicated'] += 1
+                    return existing['_id'], False
+                # It finished between our insert and the lookup; try again
+        else:
+            raise PyMongoError(f"Could not queue job {dedupe_key}")
+
+        with self._lock:
+            self._stats['submitted'] += 1
+        self._wake.set()
+        return job['_id'], True
+
+    def get(self, job_id):
+        """The job's status, progress and result, or None if it is unknown (or expired)."""
+        job = self._collection().find_one({'_id': job_id}, {'payload': 0, 'pending_key': 0})
+        if job is None:
+            return None
+        job['id'] = job.pop('_id')
+        for field in ('created_at', 'run_after', 'started_at', 'finished_at', 'lease_until', 'expires_at'):
+            if isinstance(job.get(field), datetime.datetime):
+                job[field] = job[field].isoformat() + 'Z'
+        return job
+
+    # --- workers ---
+
+    def start(self, context=None):
+        """Start the worker threads in this process (threads don't survive a fork).
+
+        `context`, if given, is a callable returning a context manager that
+        each worker runs in (the app passes its `app_context`).
+        """
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if self._threads:
+                return
+            self._stop.clear()
+            if context is not None:
+                self._context = context
+            worker = f"{socket.gethostname()}:{os.getpid()}"
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, args=(f"{worker}:{number}",),
+                                          name=f'job-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def _work(self, worker):
+        with self._context():
+            self._work_loop(worker)
+
+    def _work_loop(self, worker):
+        while not self._stop.is_set():
+            try:
+                job = self._claim(worker)
+            except PyMongoError as e:
+                logger.warning('Job queue error: %s', e)
+                self._stop.wait(max(self.poll_interval, 10))
+                continue
+            if job is None:
+                self._wake.wait(self.poll_interval * random.uniform(0.8, 1.2))
+                self._wake.clear()
+                continue
+            try:
+                self._run(job, worker)
+            except Exception:
+                # Leave it to the lease: another worker retries it later
+                logger.exception('Job %s error', job['_id'])
+
+    def _claim(self, worker):
+        now = self._now()
+        coll = self._collection()
+        self._fail_expired(coll, now)
+        return coll.find_one_and_update(
+            {'$or': [
+                {'status': 'queued', 'run_after': {'$lte': now}},
+                # Its worker died (or stalled) without finishing it
+                {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$lt': self.max_attempts}}
+            ]},
+            {'$set': {'status': 'running', 'worker': worker, 'started_at': now,
+                      'lease_until': now + datetime.timedelta(seconds=self.lease_seconds)},
+             '$inc': {'attempts': 1}},
+            sort=[('run_after', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _fail_expired(self, coll, now):
+        # Jobs whose last allowed attempt outlived its lease (e.g. it keeps
+        # crashing its worker) are failed rather than run again
+        result = coll.update_many(
+            {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$gte': self.max_attempts}},
+            {'$set': {'status': 'failed', 'error': "Job did not finish within its lease", 'code': 500,
+                      'finished_at': now, 'expires_at': now + datetime.timedelta(seconds=self.keep_seconds)},
+             '$unset': {'pending_key': '', 'lease_until': ''}}
+        )
+        if result.modified_count:
+            with self._lock:
+                self._stats['failed'] += result.modified_count
+
+    def _run(self, job, worker):
+        coll = self._collection()
+        # Updates only apply while this worker still holds the job
+        owned = {'_id': job['_id'], 'worker': worker, 'attempts': job['attempts']}
+
+        def report(**fields):
+            update = {f'progress.{name}': value for name, value in fields.items()}
+            update['lease_until'] = self._now() + datetime.timedelta(seconds=self.lease_seconds)
+            try:
+                coll.update_one(owned, {'$set': update})
+            except PyMongoError as e:
+                logger.warning('Job %s progress error: %s', job['_id'], e)
+
+        handler = self.handlers.get(job['kind'])
+        try:
+            if handler is None:
+                raise JobError(f"Unknown job kind: {job['kind']}")
+            result = handler(job['payload'], progress=report, job_id=job['_id'])
+        except JobError as e:
+            self._failed(coll, owned, job, str(e), e.code, e.retry, e.retry_after)
+        except Exception as e:
+            logger.exception('Job %s failed', job['_id'])
+            self._failed(coll, owned, job, str(e), 500, isinstance(e, PyMongoError), 0)
+        else:
+            self._finish(coll, owned, 'done', {'result': result, 'error': None, 'code': None})
+            with self._lock:
+                self._stats['done'] += 1
+
+    def _failed(self, coll, owned, job, error, code, retry, retry_after):
+        if retry and job['attempts'] < self.max_attempts:
+            delay = max(self.backoff * 2 ** (job['attempts'] - 1) * random.uniform(0.8, 1.2), retry_after)
+            coll.update_one(owned, {
+                '$set': {'status': 'queued', 'error': error, 'code': code,
+                         'run_after': self._now() + datetime.timedelta(seconds=delay)},
+                '$unset': {'worker': '', 'lease_until': ''}
+            })
+            with self._lock:
+                self._stats['retried'] += 1
+            return
+        self._finish(coll, owned, 'failed', {'error': error, 'code': code})
+        with self._lock:
+            self._stats['failed'] += 1
+
+    def _finish(self, coll, owned, status, fields):
+        now = self._now()
+        try:
+            coll.update_one(owned, {
+                '$set': dict(fields, status=status, finished_at=now,
+                             expires_at=now + datetime.timedelta(seconds=self.keep_seconds)),
+                '$unset': {'pending_key': '', 'lease_until': ''}
+            })
+        except PyMongoError as e:
+            # The lease runs out and another worker repeats the job
+            logger.warning('Job %s completion error: %s', owned['_id'], e)
+
+    # --- introspection ---
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = sum(1 for t in self._threads if t.is_alive())
+        try:
+            coll = self._collection()
+            for status in self.ACTIVE:
+                stats[status] = coll.count_documents({'status': status})
+        except PyMongoError as e:
+            stats['error'] = str(e)
+        return stats
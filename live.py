@@ -0,0 +1,240 @@
+"""Live current-weather updates shared between stream subscribers.
+
+Subscribers to the same (rounded) location share one topic, and a single
+hub thread polls each topic that has subscribers, so the upstream call rate
+grows with the number of distinct locations, not the number of open
+streams. Every poll's result is compared with the previous one and only
+the fields that changed are fanned out. Topics without subscribers are kept
+for `idle_ttl` seconds (so a reloaded page gets its snapshot straight away)
+and then dropped.
+"""
+import contextlib
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def changed_fields(old, new):
+    """Fields of `new` that differ from `old` (removed fields map to None)."""
+    changed = {key: value for key, value in new.items() if old.get(key) != value}
+    changed.update({key: None for key in old if key not in new})
+    return changed
+
+
+class Subscription:
+    """One subscriber's queue of `(event, data)` tuples."""
+
+    def __init__(self, topic, size):
+        self.topic = topic
+        self._queue = queue.Queue(size)
+
+    def push(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # A slow reader missed updates: replace its backlog with a full
+            # snapshot so it can't end up applying a partial diff
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._queue.put_nowait(('snapshot', self.topic.data) if self.topic.data is not None else event)
+            return False
+        return True
+
+    def get(self, timeout):
+        """The next event, or None if there was none within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Topic:
+    __slots__ = ('key', 'data', 'subscribers', 'next_poll', 'polling', 'idle_since',
+                 'polls', 'failures', 'last_poll')
+
+    def __init__(self, key):
+        self.key = key
+        self.data = None
+        self.subscribers = set()
+        self.next_poll = 0
+        self.polling = False
+        self.idle_since = None
+        self.polls = 0
+        self.failures = 0
+        self.last_poll = None
+
+
+class LiveHub:
+    """Topics keyed by location, polled by one background thread.
+
+    `fetch(key)` returns `(data, fresh_for)`: a flat dict of the current
+    values (or None if they could not be fetched) and how many seconds they
+    stay fresh. A topic is polled again after `fresh_for` seconds, but not
+    sooner than `min_interval` (or `retry_interval` after a failure).
+
+    Subscribers receive `('snapshot', data)` first, then `('update',
+    changed_fields)` after each poll that changed something, or
+    `('error', {...})` while there is no data at all.
+    """
+
+    def __init__(self, fetch, min_interval=60, retry_interval=30, idle_ttl=60,
+                 max_subscribers=1000, queue_size=16, workers=4):
+        self.fetch = fetch
+        self.min_interval = min_interval
+        self.retry_interval = retry_interval
+        self.idle_ttl = idle_ttl
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._topics = {}
+        self._subscribers = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._context = contextlib.nullcontext
+        self._stats = {'polls': 0, 'poll_failures': 0, 'events': 0, 'resyncs': 0,
+                       'topics_collected': 0, 'rejected': 0}
+
+    # --- lifecycle ---
+
+    def start(self, context=None):
+        """Start the poll thread (in this process; threads don't survive a fork).
+
+        `context`, if given, is a callable returning a context manager that
+        every poll runs in (the app passes its `app_context`).
+        """
+        with self._lock:
+            if context is not None:
+                self._context = context
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='live-poll')
+            self._thread = threading.Thread(target=self._loop, name='live-hub', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- subscribers ---
+
+    def subscribe(self, key):
+        """Subscribe to `key`; None when `max_subscribers` are already connected."""
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                return None
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._topics[key] = _Topic(key)
+            subscription = Subscription(topic, self.queue_size)
+            topic.subscribers.add(subscription)
+            topic.idle_since = None
+            self._subscribers += 1
+            if topic.data is not None:
+                subscription.push(('snapshot', topic.data))
+        self.start()
+        self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        topic = subscription.topic
+        with self._lock:
+            if subscription not in topic.subscribers:
+                return
+            topic.subscribers.discard(subscription)
+            self._subscribers -= 1
+            if not topic.subscribers:
+                topic.idle_since = time.time()
+
+    # --- polling ---
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Live update error')
+            self._wake.wait(1.0)
+            self._wake.clear()
+
+    def run_once(self):
+        """Drop idle topics and start a poll for every due topic."""
+        now = time.time()
+        with self._lock:
+            idle = [key for key, topic in self._topics.items()
+                    if topic.idle_since is not None and now - topic.idle_since >= self.idle_ttl
+                    and not topic.polling]
+            for key in idle:
+                del self._topics[key]
+            self._stats['topics_collected'] += len(idle)
+            due = [topic for topic in self._topics.values()
+                   if topic.subscribers and not topic.polling and topic.next_poll <= now]
+            for topic in due:
+                topic.polling = True
+        for topic in due:
+            self._executor.submit(self._poll, topic)
+
+    def _poll(self, topic):
+        try:
+            with self._context():
+                data, fresh_for = self.fetch(topic.key)
+        except Exception as e:
+            logger.warning('Live update fetch error for %s: %s', topic.key, e)
+            data, fresh_for = None, 0
+
+        with self._lock:
+            topic.polling = False
+            topic.polls += 1
+            topic.last_poll = time.time()
+            self._stats['polls'] += 1
+            if data is None:
+                topic.failures += 1
+                self._stats['poll_failures'] += 1
+                topic.next_poll = topic.last_poll + self.retry_interval
+                # Keep showing the last values; only report the failure when there are none
+                event = ('error', {'error': "Could not retrieve current weather data."}) \
+                    if topic.data is None else None
+            else:
+                topic.next_poll = topic.last_poll + max(fresh_for, self.min_interval)
+                if topic.data is None:
+                    event = ('snapshot', data)
+                else:
+                    changed = changed_fields(topic.data, data)
+                    event = ('update', changed) if changed else None
+                topic.data = data
+            subscribers = list(topic.subscribers)
+
+        if event is None:
+            return
+        resyncs = sum(1 for subscription in subscribers if not subscription.push(event))
+        with self._lock:
+            self._stats['events'] += len(subscribers)
+            self._stats['resyncs'] += resyncs
+
+    # --- introspection ---
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['topics'] = len(self._topics)
+            stats['active_topics'] = sum(1 for topic in self._topics.values() if topic.subscribers)
+            stats['subscribers'] = self._subscribers
+        stats['running'] = self.running
+        return stats
@@ -0,0 +1,269 @@
+"""Prometheus-style metrics and per-request telemetry.
+
+Counters, gauges and histograms are kept in-process and rendered in the
+Prometheus text format by `registry.render()` (served at /metrics; with
+several worker processes each one reports its own). Collectors registered
+with `registry.collector()` are called at scrape time for values that live
+elsewhere, such as cache statistics.
+
+Each request gets a `RequestTrace` in a context variable; upstream calls and
+MongoDB commands made while handling it are attached to the trace, so the
+access log line can show them next to the request ID. Worker threads only
+see the trace when started through `ContextThreadPoolExecutor`.
+"""
+import bisect
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) for latency histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Metric families and scrape-time collectors, rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register `fn()` returning `[(name, type, help, [(labels_dict, value), ...])]`."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                logger.exception('Metrics collector error')
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=(), registry=registry):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=registry):
+        super().__init__(name, help_text, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            state['counts'][index] += 1
+            state['sum'] += value
+
+    def render(self):
+        with self._lock:
+            values = {key: {'counts': list(s['counts']), 'sum': s['sum']} for key, s in self._values.items()}
+        lines = self._header()
+        for key, state in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state['counts']):
+                cumulative += count
+                le = _format_value(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+# --- Metrics recorded by the app ---
+
+http_requests = Counter('http_requests_total', 'HTTP requests handled.', ['route', 'method', 'status'])
+http_latency = Histogram('http_request_duration_seconds', 'Time to handle an HTTP request, including streaming.',
+                         ['route', 'method'])
+http_in_flight = Gauge('http_requests_in_flight', 'HTTP requests currently being handled.')
+upstream_latency = Histogram('upstream_request_duration_seconds', 'Upstream API call attempts by endpoint.',
+                             ['endpoint', 'host', 'status'])
+mongo_latency = Histogram('mongodb_command_duration_seconds', 'MongoDB commands by name.',
+                          ['command', 'outcome'])
+
+
+# --- Request traces ---
+
+_trace = contextvars.ContextVar('request_trace', default=None)
+
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestTrace:
+    """Upstream calls and MongoDB time recorded while handling one request."""
+
+    def __init__(self, request_id=None):
+        self.id = request_id if request_id and _REQUEST_ID.match(request_id) else uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.upstream = []
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_upstream(self, call):
+        with self._lock:
+            self.upstream.append(call)
+
+    def add_mongo(self, seconds):
+        with self._lock:
+            self.mongo_commands += 1
+            self.mongo_seconds += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_trace(request_id=None):
+    """Start a trace for the current request; returns `(trace, token)`."""
+    trace = RequestTrace(request_id)
+    return trace, _trace.set(trace)
+
+
+def end_trace(token):
+    try:
+        _trace.reset(token)
+    except ValueError:
+        # Streamed responses can finish in a different context than they started
+        _trace.set(None)
+
+
+def current_trace():
+    return _trace.get()
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs each task in a copy of the submitter's
+    context, so work fanned out from a request stays attached to its trace."""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def observe_upstream(endpoint, host, seconds, status):
+    """Upstream client hook: one attempt at `endpoint` took `seconds`.
+
+    `status` is the HTTP status code, or 'error' when no response came back.
+    """
+    upstream_latency.observe(seconds, endpoint=endpoint, host=host, status=status)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add_upstream({'endpoint': endpoint, 'host': host, 'status': status,
+                            'ms': round(seconds * 1000, 1)})
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command (pass to MongoClient `event_listeners`)."""
+
+    def started(self, event):
+        pass
+
+    def _finished(self, event, outcome):
+        seconds = event.duration_micros / 1e6
+        mongo_latency.observe(seconds, command=event.command_name, outcome=outcome)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add_mongo(seconds)
+
+    def succeeded(self, event):
+        self._finished(event, 'ok')
+
+    def failed(self, event):
+        self._finished(event, 'error')
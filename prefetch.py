@@ -0,0 +1,277 @@
+"""Background refresh of cached weather for the most requested locations.
+
+Requests are counted per location with exponential decay, so the ranking
+follows current traffic. A scheduler thread periodically walks the top-N
+locations and refreshes each cached response shortly before it expires
+(with per-item jitter so refreshes don't line up), staying under a token
+bucket rate limit per upstream host.
+"""
+import contextlib
+import heapq
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityTracker:
+    """Decayed request counts per location.
+
+    A request adds 1 to the location's score; scores halve every
+    `half_life` seconds. At most `max_tracked` locations are kept.
+    """
+
+    def __init__(self, half_life=3600, max_tracked=10000):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self._entries = {}  # (lat, lon) -> {'score', 'updated', 'kinds'}
+
+    def _decayed(self, entry, now):
+        return entry['score'] * 0.5 ** ((now - entry['updated']) / self.half_life)
+
+    def record(self, lat, lon, kind):
+        now = time.time()
+        key = (lat, lon)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {'score': 0.0, 'updated': now, 'kinds': set()}
+            entry['score'] = self._decayed(entry, now) + 1
+            entry['updated'] = now
+            entry['kinds'].add(kind)
+            if len(self._entries) > self.max_tracked:
+                self._prune(now)
+
+    def _prune(self, now):
+        # Caller holds the lock. Keep the top 90% so pruning is infrequent.
+        keep = heapq.nlargest(int(self.max_tracked * 0.9), self._entries.items(),
+                              key=lambda item: self._decayed(item[1], now))
+        self._entries = dict(keep)
+
+    def top(self, n):
+        """The `n` most popular locations as `(lat, lon, score, kinds)`."""
+        now = time.time()
+        with self._lock:
+            items = [(key, self._decayed(e, now), set(e['kinds'])) for key, e in self._entries.items()]
+        best = heapq.nlargest(n, items, key=lambda item: item[1])
+        return [(lat, lon, score, kinds) for (lat, lon), score, kinds in best]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, with bursts of `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, stop=None):
+        """Block until a token is available. Returns False if `stop` was set first."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+    def tokens(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class PrefetchScheduler:
+    """Keep cached responses for popular locations fresh.
+
+    `entry_fetched_at(kind, lat, lon)` returns when the cached response was
+    fetched (None if it isn't cached); `refresh(kind, lat, lon)` fetches and
+    caches a new one and returns whether that worked. `ttls` maps each kind
+    to its cache TTL and `hosts` to the upstream host it calls; each host
+    gets its own token bucket.
+
+    Every `interval` seconds the `top_n` locations are checked, and a
+    response is refreshed once it is within `lead` seconds (plus up to
+    `jitter` seconds, drawn per item) of expiring, or missing.
+    """
+
+    def __init__(self, tracker, entry_fetched_at, refresh, ttls, hosts, top_n=200,
+                 interval=30, lead=60, jitter=30, rate=1.0, burst=5):
+        self.tracker = tracker
+        self.entry_fetched_at = entry_fetched_at
+        self.refresh = refresh
+        self.ttls = ttls
+        self.hosts = hosts
+        self.top_n = top_n
+        self.interval = interval
+        self.lead = lead
+        self.jitter = jitter
+        self.buckets = {host: TokenBucket(rate, burst) for host in set(hosts.values())}
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._context = contextlib.nullcontext
+        self._items = {}  # (kind, lat, lon) -> schedule state
+        self._stats = {'runs': 0, 'refreshed': 0, 'failed': 0, 'last_run_at': None, 'last_run_seconds': None}
+
+    # --- lifecycle ---
+
+    def start(self, context=None):
+        """Start the refresh thread; `context`, if given, is a callable
+        returning a context manager it runs in (e.g. a Flask app context)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            if context is not None:
+                self._context = context
+            self._thread = threading.Thread(target=self._loop, name='prefetch', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _loop(self):
+        # Stagger the first run so workers started together don't sync up
+        if self._stop.wait(random.uniform(0, self.interval)):
+            return
+        with self._context():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception:
+                    logger.exception('Prefetch error')
+                if self._stop.wait(self.interval):
+                    return
+
+    # --- scheduling ---
+
+    def _item(self, kind, lat, lon):
+        key = (kind, lat, lon)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                item = self._items[key] = {
+                    'jitter': random.uniform(0, self.jitter),
+                    'refreshes': 0,
+                    'failures': 0,
+                    'last_refresh': None,
+                    'last_error': None
+                }
+        return item
+
+    def due_at(self, kind, lat, lon, fetched_at):
+        """When the cached response should next be refreshed (0 if now)."""
+        if fetched_at is None:
+            return 0
+        item = self._item(kind, lat, lon)
+        return fetched_at + self.ttls[kind] - self.lead - item['jitter']
+
+    def run_once(self):
+        """Refresh every due response for the current top locations."""
+        started = time.time()
+        top = self.tracker.top(self.top_n)
+        with self._lock:
+            # Forget locations that dropped out of the top N
+            current = {(lat, lon) for lat, lon, _, _ in top}
+            self._items = {key: item for key, item in self._items.items() if key[1:] in current}
+        for lat, lon, _, kinds in top:
+            for kind in sorted(kinds):
+                if self._stop.is_set():
+                    return
+                if self.due_at(kind, lat, lon, self.entry_fetched_at(kind, lat, lon)) > time.time():
+                    continue
+                if not self.buckets[self.hosts[kind]].acquire(self._stop):
+                    return
+                self._refresh(kind, lat, lon)
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['last_run_at'] = started
+            self._stats['last_run_seconds'] = round(time.time() - started, 3)
+
+    def _refresh(self, kind, lat, lon):
+        item = self._item(kind, lat, lon)
+        try:
+            ok = self.refresh(kind, lat, lon)
+            error = None if ok else 'upstream returned no data'
+        except Exception as e:
+            ok, error = False, str(e)
+        with self._lock:
+            item['last_refresh'] = time.time()
+            item['last_error'] = error
+            # New jitter each cycle so items don't settle into lockstep
+            item['jitter'] = random.uniform(0, self.jitter)
+            if ok:
+                item['refreshes'] += 1
+                self._stats['refreshed'] += 1
+            else:
+                item['failures'] += 1
+                self._stats['failed'] += 1
+
+    # --- introspection ---
+
+    def stats(self):
+        """Run and refresh counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def status(self, limit=None):
+        """Schedule and freshness of the top locations, for the admin endpoint."""
+        now = time.time()
+        schedule = []
+        for lat, lon, score, kinds in self.tracker.top(limit or self.top_n):
+            for kind in sorted(kinds):
+                fetched_at = self.entry_fetched_at(kind, lat, lon)
+                item = dict(self._item(kind, lat, lon))
+                schedule.append({
+                    'kind': kind,
+                    'latitude': lat,
+                    'longitude': lon,
+                    'popularity': round(score, 3),
+                    'age': round(now - fetched_at, 1) if fetched_at is not None else None,
+                    'expires_in': round(fetched_at + self.ttls[kind] - now, 1) if fetched_at is not None else None,
+                    'refresh_in': round(max(self.due_at(kind, lat, lon, fetched_at) - now, 0), 1),
+                    'refreshes': item['refreshes'],
+                    'failures': item['failures'],
+                    'last_refresh_age': round(now - item['last_refresh'], 1) if item['last_refresh'] else None,
+                    'last_error': item['last_error']
+                })
+        with self._lock:
+            stats = dict(self._stats)
+        if stats['last_run_at'] is not None:
+            stats['last_run_age'] = round(now - stats['last_run_at'], 1)
+        del stats['last_run_at']
+        return dict(
+            stats,
+            running=self.running,
+            tracked_locations=len(self.tracker),
+            top_n=self.top_n,
+            interval=self.interval,
+            lead=self.lead,
+            jitter=self.jitter,
+            rate_limits={host: {'rate': b.rate, 'burst': b.burst, 'tokens': round(b.tokens(), 2)}
+                         for host, b in self.buckets.items()},
+            schedule=schedule
+        )
@@ -0,0 +1,150 @@
+"""Response encoding: a fast JSON provider and gzip/brotli compression.
+
+`OrjsonProvider` takes over JSON encoding when orjson is installed and
+encodes every value the way the provider it replaces does (only without
+whitespace). `compress` is applied to every response after the view ran;
+streamed responses are compressed chunk by chunk and flushed as they go,
+so exports keep constant memory and still reach the client progressively.
+"""
+import json
+import zlib
+
+from flask.json.provider import JSONProvider
+
+# Optional: faster JSON serialization
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: brotli compression (gzip is always available)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'text/'
+)
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider that encodes with orjson.
+
+    Wraps the provider it replaces (`fallback`, e.g. Flask-PyMongo's BSON
+    provider): values orjson can't encode natively (ObjectIds, datetimes)
+    are encoded by the fallback, so output is unchanged, and parsing
+    request bodies stays with the fallback too.
+    """
+
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+    def __init__(self, app, fallback):
+        super().__init__(app)
+        self.fallback = fallback
+
+    def _default(self, obj):
+        return json.loads(self.fallback.dumps(obj))
+
+    def _dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=self._default, option=self.OPTIONS)
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            try:
+                return self._dumps_bytes(obj).decode()
+            except TypeError:
+                # e.g. integers beyond 64 bits
+                pass
+        return self.fallback.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self.fallback.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = self._dumps_bytes(obj)
+        except TypeError:
+            body = self.fallback.dumps(obj)
+        return self._app.response_class(body, mimetype='application/json')
+
+
+def available_encodings():
+    """Content codings this process can produce, preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _compressor(encoding, level):
+    """`(compress, flush, finish)` functions for one compressed body."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level['br'])
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(level['gzip'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _compressed_chunks(chunks, encoding, level, flush_size, charset='utf-8'):
+    # Without a flush the compressor holds everything until finish(), so the
+    # output is flushed every `flush_size` input bytes for the client to
+    # receive the body as it is produced.
+    compress, flush, finish = _compressor(encoding, level)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += flush()
+                pending = 0
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress(response, accept_encodings, min_size=500, gzip_level=6, brotli_quality=4, flush_size=8192):
+    """Compress `response` with the best coding the client accepts.
+
+    Skips non-200 responses, already-encoded ones, types that don't benefit
+    (images, archives) and bodies shorter than `min_size` bytes. Streamed
+    bodies are always compressed, and flushed every `flush_size` bytes.
+    """
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    mimetype = response.mimetype or ''
+    if not mimetype.startswith(COMPRESSIBLE_TYPES) or mimetype == 'text/event-stream':
+        # Event streams must reach the client as each event is written
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    level = {'gzip': gzip_level, 'br': brotli_quality}
+    response.direct_passthrough = False
+    if response.is_streamed:
+        response.response = _compressed_chunks(response.response, encoding, level, flush_size)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        compress_chunk, _, finish = _compressor(encoding, level)
+        response.set_data(compress_chunk(data) + finish())
+
+    response.headers['Content-Encoding'] = encoding
+    # The encoded body differs byte-for-byte, so a strong validator becomes weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,31 @@
+import os
+
+# Optional local overrides live in config.py (same file that holds
+# GOOGLE_MAPS_API_KEY). Anything not set there can come from the environment.
+try:
+    import config as _config
+except ImportError:
+    _config = None
+
+
+def get_setting(name, default=None, cast=None):
+    """Read a setting from config.py, then the environment, then `default`.
+
+    `cast` converts string values (e.g. int, float). Booleans accept
+    1/true/yes/on (case-insensitive).
+    """
+    value = getattr(_config, name, None) if _config is not None else None
+    if value is None:
+        value = os.environ.get(name)
+    if value is None:
+        return default
+    if cast is bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        return bool(value)
+    if cast is not None:
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return default
+    return value
@@ -3,6 +3,11 @@ let currentRecords = [];
 let googleMapsApiKey = '';
 let autocompleteTimeout = null;
 let selectedLocationData = {};
+let historyCursor = null;
+let liveSource = null;
+let liveWeather = null;
+let liveUpdatesEnabled = false;
+const HISTORY_PAGE_SIZE = 50;
 
 document.addEventListener('DOMContentLoaded', function() {
     const weatherForm = document.getElementById('weather-form');
@@ -15,6 +20,7 @@ document.addEventListener('DOMContentLoaded', function() {
         .then(response => response.json())
         .then(data => {
             googleMapsApiKey = data.google_maps_api_key;
+            liveUpdatesEnabled = Boolean(data.live_updates);
         })
         .catch(error => {
             console.error('Error fetching config:', error);
@@ -79,7 +85,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         showResult('Loading...', 'success');
 
-        fetch('/api/weather', {
+        fetch('/api/weather?v=2', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -120,7 +126,7 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
-        fetch(`/api/weather/history/${id}`, {
+        fetch(`/api/weather/history/${id}?v=2`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -243,24 +249,78 @@ function selectLocation(inputId, dropdownId, locationData) {
 
 function getCurrentWeather(location) {
     const display = document.getElementById('current-weather-display');
+    const forecastDisplay = document.getElementById('forecast-display');
     display.innerHTML = '<p style="text-align: center;"><i class="fas fa-spinner fa-spin"></i> Loading current weather...</p>';
+    forecastDisplay.innerHTML = '<p style="text-align: center;"><i class="fas fa-spinner fa-spin"></i> Loading forecast...</p>';
     
-    fetch('/api/weather/current', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ location: location })
-    })
+    // One request for current conditions and the forecast; GET so the
+    // browser can reuse cached responses (ETag / Cache-Control)
+    fetch(`/api/weather/dashboard?location=${encodeURIComponent(location)}`)
     .then(response => response.json())
     .then(data => {
         if (data.error) {
             display.innerHTML = `<p style="color: red; text-align: center;">${data.error}</p>`;
+            forecastDisplay.innerHTML = '';
+            return;
+        }
+        if (data.current) {
+            displayCurrentWeather(data.current);
+            startLiveUpdates(location);
         } else {
-            displayCurrentWeather(data);
-            getForecast(location);
+            display.innerHTML = '<p style="color: red; text-align: center;">Could not retrieve current weather data.</p>';
+        }
+        if (data.forecast) {
+            displayForecast(data);
+        } else {
+            forecastDisplay.innerHTML = '<p style="color: red; text-align: center;">Could not retrieve forecast data.</p>';
+        }
+        if (data.stale) {
+            // Served from cache while the weather service is unavailable
+            const fetched = Object.values(data.stale)[0].fetched_at;
+            display.insertAdjacentHTML('afterbegin',
+                `<p style="color: #b36b00; text-align: center;"><i class="fas fa-exclamation-triangle"></i> Weather service unavailable, showing data from ${new Date(fetched).toLocaleString()}.</p>`);
         }
     })
     .catch(error => {
         display.innerHTML = `<p style="color: red; text-align: center;">Error: ${error.message}</p>`;
+        forecastDisplay.innerHTML = '';
+    });
+}
+
+// Keep the current conditions card up to date over Server-Sent Events.
+// The server sends a full snapshot first and then only the changed fields.
+// Only used when the server enables live updates (see /api/config).
+function startLiveUpdates(location) {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+    if (!liveUpdatesEnabled || !window.EventSource) {
+        return;
+    }
+    const source = new EventSource(`/api/weather/stream?location=${encodeURIComponent(location)}`);
+    liveSource = source;
+    source.addEventListener('error', () => {
+        // The browser reconnects by itself after network errors, but gives up
+        // on an error response (e.g. 503 when the server has too many streams)
+        if (source.readyState === EventSource.CLOSED && liveSource === source) {
+            setTimeout(() => {
+                if (liveSource === source) {
+                    startLiveUpdates(location);
+                }
+            }, 60000);
+        }
+    });
+    source.addEventListener('snapshot', event => {
+        liveWeather = JSON.parse(event.data);
+        displayCurrentWeather(liveWeather);
+    });
+    source.addEventListener('update', event => {
+        if (!liveWeather) {
+            return;
+        }
+        Object.assign(liveWeather, JSON.parse(event.data));
+        displayCurrentWeather(liveWeather);
     });
 }
 
@@ -310,28 +370,6 @@ function displayCurrentWeather(data) {
     `;
 }
 
-function getForecast(location) {
-    const display = document.getElementById('forecast-display');
-    display.innerHTML = '<p style="text-align: center;"><i class="fas fa-spinner fa-spin"></i> Loading forecast...</p>';
-    
-    fetch('/api/weather/forecast', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ location: location })
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.error) {
-            display.innerHTML = `<p style="color: red; text-align: center;">${data.error}</p>`;
-        } else {
-            displayForecast(data);
-        }
-    })
-    .catch(error => {
-        display.innerHTML = `<p style="color: red; text-align: center;">Error: ${error.message}</p>`;
-    });
-}
-
 function displayForecast(data) {
     const display = document.getElementById('forecast-display');
     let html = '<div class="forecast-grid">';
@@ -400,16 +438,33 @@ function showResult(message, type) {
 }
 
 function fetchHistory() {
-    fetch('/api/weather/history')
-        .then(response => response.json())
+    // Reload from the first page
+    currentRecords = [];
+    historyCursor = null;
+    document.getElementById('history-container').innerHTML = '';
+    loadHistoryPage();
+}
+
+function loadHistoryPage() {
+    let url = `/api/weather/history?temperatures=summary&limit=${HISTORY_PAGE_SIZE}`;
+    if (historyCursor) {
+        url += `&cursor=${encodeURIComponent(historyCursor)}`;
+    }
+
+    fetch(url)
+        .then(response => {
+            historyCursor = response.headers.get('X-Next-Cursor');
+            return response.json();
+        })
         .then(data => {
-            currentRecords = data;
+            currentRecords = currentRecords.concat(data);
             const historyContainer = document.getElementById('history-container');
             const noRecords = document.getElementById('no-records');
+            const loadMore = document.getElementById('history-load-more');
             
-            historyContainer.innerHTML = '';
+            loadMore.style.display = historyCursor ? 'block' : 'none';
             
-            if (data.length === 0) {
+            if (currentRecords.length === 0) {
                 noRecords.style.display = 'block';
                 return;
             }
@@ -417,10 +472,7 @@ function fetchHistory() {
             noRecords.style.display = 'none';
             
             data.forEach(record => {
-                const temps = JSON.parse(record.temperatures);
-                const avgTemp = calculateAverage(temps.temperature_2m_mean);
-                const minTemp = Math.min(...temps.temperature_2m_mean);
-                const maxTemp = Math.max(...temps.temperature_2m_mean);
+                const summary = record.temperature_summary;
                 
                 const recordDiv = document.createElement('div');
                 recordDiv.className = 'history-item';
@@ -431,9 +483,9 @@ function fetchHistory() {
                         ${formatDate(record.start_date)} to ${formatDate(record.end_date)}
                     </div>
                     <div class="temp-summary">
-                        <p><strong>Average:</strong> ${avgTemp.toFixed(1)}°C</p>
-                        <p><strong>Min:</strong> ${minTemp.toFixed(1)}°C</p>
-                        <p><strong>Max:</strong> ${maxTemp.toFixed(1)}°C</p>
+                        <p><strong>Average:</strong> ${formatTemp(summary.mean)}</p>
+                        <p><strong>Min:</strong> ${formatTemp(summary.min)}</p>
+                        <p><strong>Max:</strong> ${formatTemp(summary.max)}</p>
                     </div>
                     <div class="actions">
                         <button onclick="showDetails('${record.id}')" class="btn btn-details">
@@ -455,8 +507,8 @@ function fetchHistory() {
         });
 }
 
-function calculateAverage(arr) {
-    return arr.reduce((a, b) => a + b, 0) / arr.length;
+function formatTemp(value) {
+    return value === null || value === undefined ? 'N/A' : `${value.toFixed(1)}°C`;
 }
 
 function formatDate(dateStr) {
@@ -481,10 +533,23 @@ function closeModal() {
 }
 
 function showDetails(id) {
-    const record = currentRecords.find(r => r.id === id);
-    if (!record) return;
-    
-    const temps = JSON.parse(record.temperatures);
+    // The list only carries summaries; load the full series on demand
+    fetch(`/api/weather/history/${id}?v=2`)
+        .then(response => response.json())
+        .then(record => {
+            if (record.error) {
+                alert(`Error: ${record.error}`);
+            } else {
+                renderDetails(record);
+            }
+        })
+        .catch(error => {
+            alert(`Error: ${error.message}`);
+        });
+}
+
+function renderDetails(record) {
+    const temps = record.temperatures;
     const detailsTitle = document.getElementById('details-title');
     const detailsContent = document.getElementById('details-content');
     
@@ -496,7 +561,7 @@ function showDetails(id) {
         tempChart += `
             <div class="temp-entry">
                 <span><i class="fas fa-calendar-day"></i> ${formatDate(date)}</span>
-                <span><i class="fas fa-thermometer-half"></i> ${temps.temperature_2m_mean[index].toFixed(1)}°C</span>
+                <span><i class="fas fa-thermometer-half"></i> ${formatTemp(temps.temperature_2m_mean[index])}</span>
             </div>
         `;
     });
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Settings are read when the app module is imported: no background work and
+# no access log during tests.
+os.environ.update({
+    'PREFETCH_ENABLED': '0',
+    'ACCESS_LOG': '0',
+    'ENSURE_INDEXES': '0',
+    'JOB_WORKERS_ENABLED': '0',
+    'NOMINATIM_MIN_INTERVAL': '0',
+})
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def _patch_mongomock():
+    # pymongo >= 4.11 passes `sort` to the bulk builder, which mongomock 4.x
+    # does not accept (same workaround as bench/bench_load.py)
+    from mongomock.collection import BulkOperationBuilder
+    for name in ('add_update', 'add_replace'):
+        method = getattr(BulkOperationBuilder, name)
+        if getattr(method, 'without_sort', False):
+            continue
+
+        def without_sort(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        without_sort.without_sort = True
+        setattr(BulkOperationBuilder, name, without_sort)
+
+
+_patch_mongomock()
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().weather_test
+
+
+@pytest.fixture
+def weather_app(db, monkeypatch):
+    """The app module, with its collections in a fresh mongomock database."""
+    import app as weather_app
+    monkeypatch.setattr(weather_app, 'get_collection_safe', lambda name: db[name])
+    weather_app.stats_cache.clear()
+    return weather_app
+
+
+@pytest.fixture
+def client(weather_app):
+    weather_app.app.config['TESTING'] = True
+    return weather_app.app.test_client()
+
+
+@pytest.fixture
+def make_records(weather_app, db):
+    """Insert `count` history records; returns their ids."""
+    def make(count, location='Berlin, Germany'):
+        daily = {'time': ['2024-01-01', '2024-01-02', '2024-01-03'],
+                 'temperature_2m_mean': [1.5, None, 3.25]}
+        docs = [weather_app.build_record(f"{location} {i}" if count > 1 else location, 52.52, 13.4,
+                                         '2024-01-01', '2024-01-03', daily)
+                for i in range(count)]
+        return db.weather_history.insert_many(docs).inserted_ids
+    return make
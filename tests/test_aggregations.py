@@ -0,0 +1,187 @@
+import datetime
+from collections import Counter, defaultdict
+
+import pytest
+
+import aggregations
+import analytics
+from archive_store import date_range
+
+DAILY = 'daily_temperatures'
+
+# location, archive grid point, start, end, created
+RECORDS = [
+    ('Berlin', (52.52, 13.41), '2024-01-28', '2024-02-03', datetime.datetime(2024, 2, 4)),
+    # Overlaps the first record: its days must not be counted twice
+    ('Berlin', (52.52, 13.41), '2024-02-01', '2024-02-10', datetime.datetime(2024, 2, 11)),
+    # Same name, another grid point
+    ('Berlin', (52.5, 13.38), '2024-01-30', '2024-01-31', datetime.datetime(2024, 2, 11)),
+    ('Madrid', (40.42, -3.7), '2023-12-30', '2024-01-02', datetime.datetime(2024, 3, 1)),
+]
+
+
+def temperature(lat, day):
+    """A deterministic mean for a day, with a gap every ninth day."""
+    n = datetime.date.fromisoformat(day).toordinal()
+    if n % 9 == 0:
+        return None
+    return round(lat / 4 - 10 + (n * 7 % 13) * 0.75, 2)
+
+
+@pytest.fixture
+def history(db):
+    days = date_range('2023-12-20', '2024-02-20')
+    for lat, lon in {point for _, point, *_ in RECORDS}:
+        db[DAILY].insert_many([{'lat': lat, 'lon': lon, 'date': day, 'temperature_2m_mean': temperature(lat, day)}
+                               for day in days])
+    for location, (lat, lon), start, end, created in RECORDS:
+        values = [temperature(lat, day) for day in date_range(start, end)]
+        db.weather_history.insert_one({
+            'location': location, 'latitude': lat, 'longitude': lon,
+            'start_date': start, 'end_date': end, 'created_at': created,
+            'temperature_summary': analytics.summarize(values)
+        })
+    return db.weather_history
+
+
+def _bind(value, variables):
+    if isinstance(value, dict):
+        return {k: _bind(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_bind(v, variables) for v in value]
+    if isinstance(value, str) and value.startswith('$$'):
+        return variables[value[2:]]
+    return value
+
+
+def _field(doc, path):
+    for part in path.lstrip('$').split('.'):
+        doc = doc[part]
+    return doc
+
+
+def _mongomock_compatible(stages):
+    # mongomock lacks $substrBytes; $substr is the same on ASCII dates
+    if isinstance(stages, dict):
+        return {('$substr' if k == '$substrBytes' else k): _mongomock_compatible(v) for k, v in stages.items()}
+    if isinstance(stages, list):
+        return [_mongomock_compatible(v) for v in stages]
+    return stages
+
+
+def aggregate(coll, pipeline):
+    """`coll.aggregate(pipeline)`, running `$lookup` with `let` (which
+    mongomock does not implement) one input document at a time."""
+    pipeline = _mongomock_compatible(pipeline)
+    for i, stage in enumerate(pipeline):
+        lookup = stage.get('$lookup')
+        if lookup and 'let' in lookup:
+            docs = list(coll.aggregate(pipeline[:i]))
+            joined = coll.database[f'{coll.name}_joined']
+            for doc in docs:
+                variables = {name: _field(doc, path) for name, path in lookup['let'].items()}
+                inner = _bind(lookup['pipeline'], variables)
+                doc[lookup['as']] = list(coll.database[lookup['from']].aggregate(inner))
+            joined.insert_many(docs)
+            return aggregate(joined, pipeline[i + 1:])
+    return list(coll.aggregate(pipeline))
+
+
+def covered_days(match_location=None):
+    """location -> [(day, value)] of the stored days the records cover, once per grid point."""
+    spans = defaultdict(list)
+    for location, point, start, end, _ in RECORDS:
+        if match_location in (None, location):
+            spans[(location, point)].append((start, end))
+    days = defaultdict(list)
+    for (location, (lat, _)), ranges in spans.items():
+        span = date_range(min(s for s, _ in ranges), max(e for _, e in ranges))
+        for day in span:
+            if temperature(lat, day) is not None:
+                days[location].append((day, temperature(lat, day)))
+    return days
+
+
+def by_period(period):
+    groups = defaultdict(list)
+    for location, values in covered_days().items():
+        for day, value in values:
+            groups[(location, period(day))].append(value)
+    return {key: {'mean': sum(vs) / len(vs), 'min': min(vs), 'max': max(vs), 'days': len(vs)}
+            for key, vs in groups.items()}
+
+
+def test_location_averages_match_the_records(history):
+    result = aggregate(history, aggregations.location_averages({}, 10))
+
+    expected = []
+    for location in ('Berlin', 'Madrid'):
+        rows = [r for r in history.find({'location': location})]
+        summaries = [r['temperature_summary'] for r in rows]
+        days = sum(s['count'] for s in summaries)
+        expected.append({
+            'location': location,
+            'records': len(rows),
+            'days': days,
+            'mean': pytest.approx(sum(s['mean'] * s['count'] for s in summaries) / days),
+            'min': min(s['min'] for s in summaries),
+            'max': max(s['max'] for s in summaries),
+            'first_date': min(r['start_date'] for r in rows),
+            'last_date': max(r['end_date'] for r in rows),
+        })
+    assert result == expected
+    assert aggregate(history, aggregations.location_averages({}, 1)) == expected[:1]
+
+
+def test_monthly_climatology_counts_each_stored_day_once(history):
+    result = aggregate(history, aggregations.monthly_climatology({}, DAILY))
+
+    periods = by_period(lambda day: day[5:7])
+    expected = [
+        {'location': location, 'months': [
+            dict(periods[(location, month)], month=month, mean=pytest.approx(periods[(location, month)]['mean']))
+            for month in sorted(m for loc, m in periods if loc == location)
+        ]}
+        for location in ('Berlin', 'Madrid')
+    ]
+    assert result == expected
+    # The first two Berlin records overlap by three days
+    record_days = sum(r['temperature_summary']['count'] for r in history.find({'location': 'Berlin'}))
+    assert sum(m['days'] for m in result[0]['months']) < record_days
+
+
+def test_monthly_climatology_respects_the_match(history):
+    result = aggregate(history, aggregations.monthly_climatology({'location': 'Madrid'}, DAILY))
+
+    assert [r['location'] for r in result] == ['Madrid']
+    assert [m['month'] for m in result[0]['months']] == ['01', '12']
+    assert sum(m['days'] for m in result[0]['months']) == len(covered_days('Madrid')['Madrid'])
+
+
+def test_extreme_periods_rank_year_months_by_mean(history):
+    result = aggregate(history, aggregations.extreme_periods({}, 2, DAILY))
+
+    periods = [dict(stats, location=location, month=month)
+               for (location, month), stats in by_period(lambda day: day[:7]).items()]
+    warmest = sorted(periods, key=lambda p: -p['mean'])[:2]
+    coldest = sorted(periods, key=lambda p: p['mean'])[:2]
+    assert len(result) == 1
+    for name, expected in (('warmest', warmest), ('coldest', coldest)):
+        assert [(p['location'], p['month']) for p in result[0][name]] == \
+            [(p['location'], p['month']) for p in expected]
+        assert [p['mean'] for p in result[0][name]] == pytest.approx([p['mean'] for p in expected])
+
+
+def test_records_over_time_counts_per_month(history):
+    result = aggregate(history, aggregations.records_over_time({}))
+
+    counts = Counter(created.strftime('%Y-%m') for *_, created in RECORDS)
+    assert result == [{'month': month, 'records': counts[month]} for month in sorted(counts)]
+
+
+def test_location_points_count_records_per_grid_point(history):
+    result = aggregate(history, aggregations.location_points({}))
+
+    counts = Counter((location, point) for location, point, *_ in RECORDS)
+    assert sorted((r['location'], (r['latitude'], r['longitude']), r['records']) for r in result) == \
+        sorted((location, point, n) for (location, point), n in counts.items())
@@ -0,0 +1,51 @@
+import pytest
+
+import analytics
+
+SERIES = [
+    [12.5, None, 14.0, 9.25, None, 11.0],
+    [],
+    None,
+    [None, None],
+    [-3.5],
+    [20.0, 21.5, 19.0, 22.25, 18.75, None, 20.5, 23.0, 17.5],
+]
+
+
+def assert_same_summary(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        assert actual[key] == (value if value is None else pytest.approx(value)), key
+
+
+def test_summarize_many_matches_each_series_on_its_own():
+    batch = analytics.summarize_many(SERIES)
+
+    assert len(batch) == len(SERIES)
+    for summary, values in zip(batch, SERIES):
+        assert_same_summary(summary, analytics._summarize_py(values))
+        assert_same_summary(analytics.summarize(values), analytics._summarize_py(values))
+
+
+def test_summarize_many_of_nothing():
+    assert analytics.summarize_many([]) == []
+
+
+def test_empty_series_have_no_statistics():
+    assert analytics.summarize_many([[None, None], []]) == [
+        {'count': 0, 'mean': None, 'min': None, 'max': None, 'stddev': None, 'null_count': 2},
+        {'count': 0, 'mean': None, 'min': None, 'max': None, 'stddev': None, 'null_count': 0},
+    ]
+
+
+@pytest.mark.parametrize('values', SERIES[0::5])
+def test_vectorized_functions_match_plain_python(monkeypatch, values):
+    dates = [f'2024-{(i % 3) + 1:02d}-{i + 1:02d}' for i in range(len(values))]
+    vectorized = (analytics.rolling_mean(values, 3, 2), analytics.monthly_means(dates, values),
+                  analytics.anomalies(dates, values, 15.0), analytics.degree_days(values))
+
+    monkeypatch.setattr(analytics, 'np', None)
+    plain = (analytics.rolling_mean(values, 3, 2), analytics.monthly_means(dates, values),
+             analytics.anomalies(dates, values, 15.0), analytics.degree_days(values))
+
+    assert vectorized == plain
@@ -0,0 +1,54 @@
+import json
+import logging
+import threading
+
+import app as weather_app
+
+
+def test_second_app_keeps_its_own_database():
+    first = weather_app.app
+    other = weather_app.create_app({'MONGO_URI': 'mongodb://localhost:27017/other_db'})
+
+    assert other.extensions['mongo'] is not first.extensions['mongo']
+    assert first.extensions['mongo'].database_name == 'weather_app'
+    assert other.extensions['mongo'].database_name == 'other_db'
+    with other.app_context():
+        assert weather_app.current_mongo().database_name == 'other_db'
+    with first.app_context():
+        assert weather_app.current_mongo().database_name == 'weather_app'
+    # No app to fall back to outside an app context
+    assert weather_app.current_mongo() is None
+
+
+def test_background_work_uses_the_app_that_started_it():
+    other = weather_app.create_app({'MONGO_URI': 'mongodb://localhost:27017/other_db'})
+    seen = []
+
+    def work():
+        seen.append(weather_app.current_mongo())
+
+    with other.app_context():
+        thread = threading.Thread(target=weather_app.with_app_context(work))
+    thread.start()
+    thread.join()
+    assert seen == [other.extensions['mongo']]
+
+
+def test_access_log_goes_through_logging(client, monkeypatch):
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    monkeypatch.setattr(weather_app, 'ACCESS_LOG', True)
+    monkeypatch.setattr(weather_app.access_logger, 'level', logging.INFO)
+    weather_app.access_logger.addHandler(handler)
+    try:
+        response = client.get('/api/weather/history?temperatures=none', headers={'X-Request-ID': 'abc-123'})
+        client.get('/metrics')
+    finally:
+        weather_app.access_logger.removeHandler(handler)
+
+    assert len(records) == 1
+    assert records[0].name == 'access' and records[0].levelno == logging.INFO
+    line = json.loads(records[0].getMessage())
+    assert line['request_id'] == response.headers['X-Request-ID'] == 'abc-123'
+    assert (line['route'], line['status']) == ('/api/weather/history', 200)
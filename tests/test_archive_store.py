@@ -0,0 +1,104 @@
+import datetime
+
+from archive_store import ArchiveStore, contiguous_ranges, date_range
+
+
+class FakeArchive:
+    """archive-api stand-in: every day's mean is its day of the month."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    @staticmethod
+    def _data(start_date, end_date):
+        dates = date_range(start_date, end_date)
+        return {'daily': {'time': dates, 'temperature_2m_mean': [float(d[-2:]) for d in dates]}}
+
+    def fetch(self, lat, lon, start_date, end_date):
+        self.calls.append(([(lat, lon)], start_date, end_date))
+        return None if self.fail else self._data(start_date, end_date)
+
+    def fetch_many(self, lats, lons, start_date, end_date):
+        self.calls.append((list(zip(lats, lons)), start_date, end_date))
+        return None if self.fail else [self._data(start_date, end_date) for _ in lats]
+
+
+def make_store(db, archive, **kwargs):
+    return ArchiveStore(lambda: db.archive_days, archive.fetch, fetch_many=archive.fetch_many, **kwargs)
+
+
+def test_contiguous_ranges():
+    dates = ['2024-01-01', '2024-01-02', '2024-01-04', '2024-01-31', '2024-02-01']
+    assert contiguous_ranges(dates) == [('2024-01-01', '2024-01-02'), ('2024-01-04', '2024-01-04'),
+                                        ('2024-01-31', '2024-02-01')]
+
+
+def test_nearby_coordinates_share_a_grid_point(db):
+    archive = FakeArchive()
+    store = make_store(db, archive)
+    assert store.grid_point(52.5163, 13.3777) == (52.52, 13.38)
+
+    first = store.get_series(52.5163, 13.3777, '2024-01-01', '2024-01-03')
+    second = store.get_series(52.5201, 13.3849, '2024-01-01', '2024-01-03')
+    assert first == second == {'time': ['2024-01-01', '2024-01-02', '2024-01-03'],
+                               'temperature_2m_mean': [1.0, 2.0, 3.0]}
+    # The second lookup rounded to the same point and was served from the store
+    assert archive.calls == [([(52.52, 13.38)], '2024-01-01', '2024-01-03')]
+    assert db.archive_days.count_documents({'lat': 52.52, 'lon': 13.38}) == 3
+
+
+def test_only_missing_days_are_fetched_and_merged(db):
+    archive = FakeArchive()
+    store = make_store(db, archive)
+    store.get_series(52.52, 13.41, '2024-01-03', '2024-01-04')
+    store.get_series(52.52, 13.41, '2024-01-08', '2024-01-08')
+    archive.calls.clear()
+
+    series = store.get_series(52.52, 13.41, '2024-01-01', '2024-01-10')
+    assert archive.calls == [([(52.52, 13.41)], '2024-01-01', '2024-01-02'),
+                             ([(52.52, 13.41)], '2024-01-05', '2024-01-07'),
+                             ([(52.52, 13.41)], '2024-01-09', '2024-01-10')]
+    assert series['temperature_2m_mean'] == [float(day) for day in range(1, 11)]
+
+
+def test_failed_fetch_returns_none_and_stores_nothing(db):
+    store = make_store(db, FakeArchive(fail=True))
+    assert store.get_series(52.52, 13.41, '2024-01-01', '2024-01-02') is None
+    assert db.archive_days.count_documents({}) == 0
+
+
+def test_recent_null_days_are_not_stored(db):
+    today = datetime.date.today()
+    recent = (today - datetime.timedelta(days=1)).isoformat()
+    old = (today - datetime.timedelta(days=30)).isoformat()
+    store = make_store(db, FakeArchive(), settle_days=7)
+    store._save(db.archive_days, 52.52, 13.41, {recent: None, old: None})
+    assert [doc['date'] for doc in db.archive_days.find()] == [old]
+
+
+def test_get_many_batches_shared_spans_and_keeps_input_order(db):
+    archive = FakeArchive()
+    store = make_store(db, archive, batch_size=2)
+    store.get_series(48.86, 2.35, '2024-01-01', '2024-01-02')
+    archive.calls.clear()
+
+    ranges = [(52.52, 13.41, '2024-01-01', '2024-01-02'),
+              (48.86, 2.35, '2024-01-01', '2024-01-03'),
+              (40.42, -3.7, '2024-01-01', '2024-01-02'),
+              (52.5201, 13.4149, '2024-01-02', '2024-01-02')]
+    series = store.get_many(ranges)
+
+    # Paris already had two days; the other points share one span, two per request
+    assert sorted(archive.calls) == sorted([
+        ([(52.52, 13.41), (40.42, -3.7)], '2024-01-01', '2024-01-02'),
+        ([(48.86, 2.35)], '2024-01-03', '2024-01-03'),
+    ])
+    assert [s['time'] for s in series] == [date_range(*r[2:]) for r in ranges]
+    assert series[1]['temperature_2m_mean'] == [1.0, 2.0, 3.0]
+    assert series[3]['temperature_2m_mean'] == [2.0]
+
+
+def test_get_many_marks_failed_entries(db):
+    store = make_store(db, FakeArchive(fail=True))
+    assert store.get_many([(52.52, 13.41, '2024-01-01', '2024-01-01')]) == [None]
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+from flask import Flask
+
+pytest.importorskip('asgiref')
+import asgi  # noqa: E402
+
+
+def call(application, path):
+    body = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            body.append(message.get('body', b''))
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [],
+             'http_version': '1.1', 'server': ('test', 80), 'scheme': 'http', 'root_path': ''}
+    return application(scope, receive, send), body
+
+
+def test_requests_are_served_concurrently():
+    slow = Flask('slow')
+
+    @slow.route('/')
+    def index():
+        time.sleep(0.3)
+        return 'ok'
+
+    application = asgi.PooledWsgiToAsgi(slow)
+
+    async def main():
+        calls = [call(application, '/') for _ in range(4)]
+        await asyncio.gather(*(coroutine for coroutine, _ in calls))
+        return [b''.join(body) for _, body in calls]
+
+    started = time.perf_counter()
+    assert asyncio.run(main()) == [b'ok'] * 4
+    # One at a time would take 1.2 s
+    assert time.perf_counter() - started < 0.9
@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import SQLiteStore, SingleFlight, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache('test-expiry', ttl=10)
+    c.set('a', 1)
+    assert c.lookup('a') == (True, 1)
+    clock.now += 10
+    assert c.lookup('a') == (False, None)
+    assert c.stats()['expirations'] == 1
+
+
+def test_negative_entries_use_negative_ttl(clock):
+    c = TTLCache('test-negative', ttl=100, negative_ttl=5)
+    c.set('missing', None)
+    assert c.lookup('missing') == (True, None)
+    assert c.get('missing', 'default') == 'default'
+    clock.now += 5
+    assert c.lookup('missing') == (False, None)
+    assert c.stats()['negative_hits'] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = TTLCache('test-lru', maxsize=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    c.lookup('a')
+    c.set('c', 3)
+    assert c.lookup('b') == (False, None)
+    assert c.lookup('a') == (True, 1)
+    assert c.lookup('c') == (True, 3)
+    assert c.stats()['evictions'] == 1
+
+
+def test_stale_entries_are_only_returned_by_stale(clock):
+    c = TTLCache('test-stale', ttl=10, stale_ttl=60)
+    c.set('a', 1)
+    clock.now += 30
+    assert c.lookup('a') == (False, None)
+    assert c.stale('a') == (True, 1)
+    clock.now += 40
+    assert c.stale('a') == (False, None)
+
+
+def test_store_backs_local_misses(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite3')
+    TTLCache('test-store-a', ttl=10, store=SQLiteStore(path, 'weather')).set('a', {'x': 1})
+    other = TTLCache('test-store-b', ttl=10, store=SQLiteStore(path, 'weather'))
+    assert other.lookup('a') == (True, {'x': 1})
+    assert other.stats()['store_hits'] == 1
+    clock.now += 10
+    other.delete('a')
+    assert other.lookup('a') == (False, None)
+
+
+def test_get_or_load_does_not_cache_none():
+    c = TTLCache('test-load-none')
+    calls = []
+    assert c.get_or_load('a', lambda: calls.append(1)) is None
+    assert c.get_or_load('a', lambda: calls.append(1)) is None
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    c = TTLCache('test-coalesce')
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(c.get_or_load('k', loader))) for _ in range(8)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Give the followers time to join the flight
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['value'] * 8
+    assert calls == [1]
+    assert c.stats()['coalesced'] == 7
+
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+    with pytest.raises(ValueError):
+        flights.do('k', lambda: (_ for _ in ()).throw(ValueError('boom')))
+    # A failed flight is not remembered
+    assert flights.do('k', lambda: 2) == 2
+
+
+def test_async_misses_share_one_load():
+    c = TTLCache('test-async-coalesce')
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'value'
+
+    async def main():
+        return await asyncio.gather(*(c.aget_or_load('k', loader) for _ in range(10)))
+
+    assert asyncio.run(main()) == ['value'] * 10
+    assert calls == [1]
+    assert c.lookup('k') == (True, 'value')
+
+
+def test_async_misses_on_different_loops_share_one_load():
+    # Under a WSGI server each async view runs in its own event loop
+    c = TTLCache('test-async-loops')
+    calls = []
+    gate = threading.Barrier(4)
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return 'value'
+
+    async def request():
+        gate.wait(5)
+        return await c.aget_or_load('k', loader)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(asyncio.run(request()))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['value'] * 4
+    assert calls == [1]
+
+
+def test_cancelled_async_leader_hands_over():
+    flights = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return 'value'
+
+    async def main():
+        leader = asyncio.ensure_future(flights.ado('k', slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.ado('k', fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == 'value'
+
+
+def test_async_store_lookup_runs_in_executor(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'cache.sqlite3'), 'weather')
+    threads = []
+    load = store.load
+
+    def recording_load(key):
+        threads.append(threading.current_thread())
+        return load(key)
+
+    store.load = recording_load
+    c = TTLCache('test-async-store', store=store)
+
+    async def loader():
+        return 'value'
+
+    assert asyncio.run(c.aget_or_load('k', loader)) == 'value'
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,130 @@
+import pytest
+
+import circuit
+from circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers, CircuitOpenError
+from upstream import UpstreamClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit.time, 'time', clock)
+    return clock
+
+
+def make_breaker(**kwargs):
+    options = dict(window=30, min_requests=4, failure_rate=0.5, slow_seconds=5, open_seconds=10)
+    options.update(kwargs)
+    return CircuitBreaker('api.example.com', **options)
+
+
+def fail(breaker, times, seconds=0.1):
+    for _ in range(times):
+        assert breaker.allow()
+        breaker.record(seconds, False, 'forecast: 503')
+
+
+def test_opens_once_enough_calls_fail(clock):
+    breaker = make_breaker()
+    fail(breaker, 3)
+    # Below min_requests it stays closed, however many fail
+    assert breaker.state == CLOSED
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.status()['last_failure'] == 'forecast: 503'
+
+
+def test_failure_rate_below_threshold_stays_closed(clock):
+    breaker = make_breaker()
+    for ok in (True, True, True, False, True, False):
+        breaker.record(0.1, ok)
+    assert breaker.state == CLOSED
+
+
+def test_old_failures_leave_the_window(clock):
+    breaker = make_breaker()
+    fail(breaker, 3)
+    clock.advance(31)
+    fail(breaker, 1)
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(6, True)
+    assert breaker.state == OPEN
+    assert breaker.status()['last_failure'] == 'slow response'
+
+
+def test_open_breaker_rejects_until_open_seconds_pass(clock):
+    breaker = make_breaker()
+    fail(breaker, 4)
+    clock.advance(4)
+    assert not breaker.allow()
+    assert breaker.retry_in() == pytest.approx(6)
+    assert breaker.status()['rejected'] == 1
+
+
+def test_half_open_lets_one_trial_through_and_closes_on_success(clock):
+    breaker = make_breaker()
+    fail(breaker, 4)
+    clock.advance(10)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Everyone else waits for the trial call
+    assert not breaker.allow()
+    breaker.record(0.1, True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    # The failures that opened it are forgotten
+    assert breaker.status()['requests'] == 0
+
+
+def test_failed_trial_opens_it_again(clock):
+    breaker = make_breaker()
+    fail(breaker, 4)
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record(0.1, False)
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == pytest.approx(10)
+    assert breaker.status()['times_opened'] == 2
+
+
+def test_calls_finishing_while_open_are_ignored(clock):
+    breaker = make_breaker()
+    fail(breaker, 4)
+    breaker.record(0.1, True)
+    assert breaker.state == OPEN
+
+
+def test_trip_and_reset(clock):
+    breaker = make_breaker()
+    breaker.trip()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    breaker.reset()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_upstream_client_fails_fast_while_open(clock):
+    breakers = CircuitBreakers(min_requests=4, open_seconds=10)
+    client = UpstreamClient(endpoints={'forecast': 'http://api.example.com/v1/forecast'}, breakers=breakers)
+    client.breaker('forecast').trip()
+    with pytest.raises(CircuitOpenError) as error:
+        client.get('forecast')
+    assert error.value.retry_in == pytest.approx(10)
+    assert breakers.status()['api.example.com']['rejected'] == 1
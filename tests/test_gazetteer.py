@@ -0,0 +1,104 @@
+import pytest
+
+from gazetteer import Gazetteer
+
+# geonameid, name, asciiname, lat, lon, country code, admin1 code, population
+PLACES = [
+    (1, 'Zürich', 'Zurich', 47.3769, 8.5417, 'CH', '25', 341730),
+    (2, 'Zug', 'Zug', 47.1662, 8.5155, 'CH', '09', 30934),
+    (3, 'Zurzach', 'Zurzach', 47.5875, 8.2935, 'CH', '01', 4300),
+    (4, 'Zuoz', 'Zuoz', 46.6023, 9.9597, 'CH', '03', 1200),
+    (5, 'Basel', 'Basel', 47.5584, 7.5733, 'CH', '03', 164488),
+    (6, 'Nordrand', 'Nordrand', 47.51, 8.0, 'CH', '01', 500),
+    (7, 'Südrand', 'Sudrand', 47.01, 8.0, 'CH', '01', 90000),
+    (8, 'Ostende', 'Ostende', 0.0, -179.99, 'KI', '00', 100),
+]
+
+
+def geonames_line(geoname_id, name, asciiname, lat, lon, country, admin1, population):
+    cols = [str(geoname_id), name, asciiname, '', str(lat), str(lon), 'P', 'PPL', country, '', admin1,
+            '', '', '', str(population), '', '', 'Europe/Zurich', '2024-01-01']
+    return '\t'.join(cols) + '\n'
+
+
+@pytest.fixture
+def cities(tmp_path):
+    path = tmp_path / 'cities.txt'
+    path.write_text(''.join(geonames_line(*place) for place in PLACES), encoding='utf-8')
+    return str(path)
+
+
+def names(results):
+    return [r['name'] for r in results]
+
+
+@pytest.mark.parametrize('dense_prefix', [200, 1])
+def test_prefix_search_ranks_by_population(cities, dense_prefix):
+    gazetteer = Gazetteer(dense_prefix=dense_prefix)
+    assert gazetteer.load(cities) == len(PLACES)
+
+    assert names(gazetteer.search('zu')) == ['Zürich', 'Zug', 'Zurzach', 'Zuoz']
+    assert names(gazetteer.search('  ZUR ')) == ['Zürich', 'Zurzach']
+    assert names(gazetteer.search('zu', limit=2)) == ['Zürich', 'Zug']
+    assert gazetteer.search('xyz') == []
+    assert gazetteer.search('') == []
+
+
+def test_accented_names_match_either_spelling(cities):
+    gazetteer = Gazetteer()
+    gazetteer.load(cities)
+
+    assert names(gazetteer.search('Zür')) == names(gazetteer.search('zur')) == ['Zürich', 'Zurzach']
+    assert names(gazetteer.search('sud')) == names(gazetteer.search('Süd')) == ['Südrand']
+
+
+def test_popular_places_rank_before_larger_ones(cities):
+    gazetteer = Gazetteer()
+    gazetteer.load(cities)
+
+    gazetteer.learn({'id': 4, 'name': 'Zuoz', 'latitude': 46.6023, 'longitude': 9.9597}, uses=2)
+    gazetteer.learn({'name': 'Zumikon', 'latitude': 47.33, 'longitude': 8.62, 'population': 5000}, uses=1)
+
+    assert names(gazetteer.search('zu')) == ['Zuoz', 'Zumikon', 'Zürich', 'Zug', 'Zurzach']
+    # Known GeoNames ids are not learned twice
+    assert gazetteer.stats()['learned'] == 1
+
+
+def test_learned_duplicates_of_static_places_are_dropped(cities):
+    gazetteer = Gazetteer()
+    gazetteer.load(cities)
+
+    gazetteer.learn({'name': 'Zürich', 'latitude': 47.37, 'longitude': 8.54}, uses=1)
+
+    assert names(gazetteer.search('zuri')) == ['Zürich']
+
+
+def test_nearest_looks_past_its_own_grid_cell(cities):
+    gazetteer = Gazetteer(cell_deg=0.5)
+    gazetteer.load(cities)
+
+    # Südrand shares the query's cell (47.0-47.5) but is ~53 km away;
+    # Nordrand is in the next cell up and ~2 km away.
+    place = gazetteer.nearest(47.49, 8.0, max_km=100)
+
+    assert place['name'] == 'Nordrand'
+    assert place['distance_km'] == pytest.approx(2.22, abs=0.01)
+
+
+def test_nearest_wraps_around_the_antimeridian(cities):
+    gazetteer = Gazetteer()
+    gazetteer.load(cities)
+
+    place = gazetteer.nearest(0.0, 179.99)
+
+    assert place['name'] == 'Ostende'
+    assert place['distance_km'] == pytest.approx(2.22, abs=0.01)
+
+
+def test_nearest_respects_max_km(cities):
+    gazetteer = Gazetteer()
+    gazetteer.load(cities)
+
+    assert gazetteer.nearest(47.49, 8.0, max_km=1) is None
+    assert gazetteer.nearest(60.0, 8.0) is None
+    assert Gazetteer().nearest(47.49, 8.0) is None
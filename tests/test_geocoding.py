@@ -0,0 +1,110 @@
+import pytest
+
+
+@pytest.fixture
+def throttled(weather_app, monkeypatch):
+    """Nominatim reverse lookups allowed once a minute, with no gazetteer."""
+    monkeypatch.setattr(weather_app, 'NOMINATIM_MIN_INTERVAL', 60.0)
+    monkeypatch.setattr(weather_app, 'NOMINATIM_MAX_WAIT', 0.0)
+    monkeypatch.setattr(weather_app, 'local_place_name', lambda lat, lon: None)
+    monkeypatch.setattr(weather_app, 'REVERSE_GEOCODE_FALLBACK', True)
+    weather_app.reverse_geocode_cache.clear()
+    calls = []
+
+    def reverse(lat, lon):
+        calls.append((lat, lon))
+        return 'Potsdam, Germany'
+
+    monkeypatch.setattr(weather_app, '_reverse_geocode', reverse)
+    # Use up the current slot
+    monkeypatch.setattr(weather_app, '_nominatim_last', 0.0)
+    weather_app.nominatim_slot()
+    return calls
+
+
+def test_nominatim_slot_waits_for_its_turn(weather_app, monkeypatch):
+    monkeypatch.setattr(weather_app, 'NOMINATIM_MIN_INTERVAL', 0.2)
+    monkeypatch.setattr(weather_app, '_nominatim_last', 0.0)
+    slept = []
+    monkeypatch.setattr(weather_app.time, 'sleep', slept.append)
+    assert weather_app.nominatim_slot()
+    assert not weather_app.nominatim_slot()
+    assert weather_app.nominatim_slot(wait=1)
+    # The second waiter is queued behind the first
+    assert weather_app.nominatim_slot(wait=1)
+    assert len(slept) == 2 and slept[1] > slept[0] > 0
+    assert not weather_app.nominatim_slot(wait=0.1)
+
+
+def test_throttled_read_uses_the_coordinate_name(weather_app, throttled):
+    assert weather_app.get_city_from_coords(52.4, 13.06) == "Location (52.4000, 13.0600)"
+    assert weather_app.lookup_city(52.4, 13.06) == (False, None)
+    assert throttled == []
+
+
+def test_throttled_record_is_saved_pending_and_resolved_later(weather_app, db, throttled, monkeypatch):
+    daily = {'time': ['2024-01-01'], 'temperature_2m_mean': [2.0]}
+    monkeypatch.setattr(weather_app.archive_store, 'get_series', lambda *args: daily)
+
+    record, _ = weather_app.create_record('52.4,13.06', '2024-01-01', '2024-01-01')
+    stored = db.weather_history.find_one({'_id': record['_id']})
+    assert stored['location_pending'] is True
+    assert throttled == []
+
+    monkeypatch.setattr(weather_app, 'NOMINATIM_MIN_INTERVAL', 0.0)
+    result = weather_app.app.test_cli_runner().invoke(args=['resolve-locations'])
+    assert 'Resolved 1 record(s), 0 still pending' in result.output
+    stored = db.weather_history.find_one({'_id': record['_id']})
+    assert stored['location'] == 'Potsdam, Germany'
+    assert stored['location_key'] == 'potsdam, germany'
+    assert 'location_pending' not in stored
+
+
+def test_record_does_not_wait_and_a_job_resolves_it(weather_app, db, throttled, monkeypatch):
+    daily = {'time': ['2024-01-01'], 'temperature_2m_mean': [2.0]}
+    monkeypatch.setattr(weather_app.archive_store, 'get_series', lambda *args: daily)
+    monkeypatch.setattr(weather_app, 'NOMINATIM_MAX_WAIT', 120.0)
+    slept = []
+    monkeypatch.setattr(weather_app.time, 'sleep', slept.append)
+
+    record, _ = weather_app.create_record('52.4,13.06', '2024-01-01', '2024-01-01')
+    assert record['location_pending'] is True
+    assert slept == [] and throttled == []
+
+    job = db.jobs.find_one({'kind': 'resolve_location'})
+    assert job['payload'] == {'id': str(record['_id'])}
+    claimed = weather_app.record_jobs._claim('w1')
+    weather_app.record_jobs._run(claimed, 'w1')
+    # The job worker waits for its turn instead
+    assert len(slept) == 1 and len(throttled) == 1
+    assert db.jobs.find_one({'_id': job['_id']})['status'] == 'done'
+    stored = db.weather_history.find_one({'_id': record['_id']})
+    assert stored['location'] == 'Potsdam, Germany'
+    assert 'location_pending' not in stored
+
+
+def test_renamed_record_keeps_its_name(weather_app, db, client, throttled, monkeypatch):
+    daily = {'time': ['2024-01-01'], 'temperature_2m_mean': [2.0]}
+    monkeypatch.setattr(weather_app.archive_store, 'get_series', lambda *args: daily)
+    record, _ = weather_app.create_record('52.4,13.06', '2024-01-01', '2024-01-01')
+    assert client.put(f"/api/weather/history/{record['_id']}", json={'location': 'Home'}).status_code == 200
+
+    monkeypatch.setattr(weather_app, 'NOMINATIM_MIN_INTERVAL', 0.0)
+    assert weather_app.run_resolve_location_job({'id': str(record['_id'])}) == {'id': str(record['_id'])}
+    assert db.weather_history.find_one({'_id': record['_id']})['location'] == 'Home'
+    assert throttled == []
+
+
+def test_reverse_lookup_is_not_retried(weather_app, monkeypatch):
+    calls = []
+
+    def get(endpoint, params=None, retries=None, **kwargs):
+        calls.append((endpoint, retries))
+        response = weather_app.requests.Response()
+        response.status_code = 429
+        return response
+
+    monkeypatch.setattr(weather_app.upstream, 'get', get)
+    with pytest.raises(weather_app.requests.HTTPError):
+        weather_app._reverse_geocode(52.4, 13.06)
+    assert calls == [('reverse', 0)]
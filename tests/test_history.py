@@ -0,0 +1,90 @@
+
+def test_location_filter_is_an_indexable_prefix_match(weather_app):
+    query = weather_app.build_history_query({'location': 'Ber(lin'})
+    # Case-insensitive through the lower-cased key, not a regex option, so
+    # MongoDB can bound the index scan by the prefix
+    assert query == {'location_key': {'$regex': r'^ber\(lin'}}
+
+
+def test_location_filter_ignores_case(client, make_records):
+    make_records(1, 'Berlin, Germany')
+    make_records(1, 'Bern, Switzerland')
+    names = lambda response: sorted(item['location'] for item in response.get_json())
+    assert names(client.get('/api/weather/history?location=BER&temperatures=none')) == \
+        ['Berlin, Germany', 'Bern, Switzerland']
+    assert names(client.get('/api/weather/history?location=berl&temperatures=none')) == ['Berlin, Germany']
+
+
+def test_renamed_record_is_found_by_its_new_name(client, make_records):
+    record_id = make_records(1, 'Berlin')[0]
+    assert client.put(f'/api/weather/history/{record_id}', json={'location': 'Potsdam'}).status_code == 200
+    response = client.get('/api/weather/history?location=pots&temperatures=none')
+    assert [item['id'] for item in response.get_json()] == [str(record_id)]
+
+
+def test_backfill_location_keys(weather_app, db, make_records):
+    make_records(1, 'Berlin')
+    db.weather_history.update_many({}, {'$unset': {'location_key': ''}})
+    result = weather_app.app.test_cli_runner().invoke(args=['backfill-location-keys'])
+    assert 'Updated 1 record(s)' in result.output
+    assert db.weather_history.find_one()['location_key'] == 'berlin'
+
+
+def test_history_etag_round_trip(client, make_records):
+    record_id = make_records(1, 'Berlin')[0]
+    url = '/api/weather/history?temperatures=none'
+    first = client.get(url)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+
+    again = client.get(url, headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+    # A write bumps the version, so the old ETag no longer matches
+    assert client.put(f'/api/weather/history/{record_id}', json={'location': 'Potsdam'}).status_code == 200
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()[0]['location'] == 'Potsdam'
+
+
+def test_export_etag_round_trip(client, make_records):
+    make_records(2, 'Berlin')
+    headers = {'Accept-Encoding': 'gzip'}
+    first = client.get('/api/export/csv', headers=headers)
+    assert first.status_code == 200
+    assert first.get_data()
+    etag = first.headers['ETag']
+
+    again = client.get('/api/export/csv', headers=dict(headers, **{'If-None-Match': etag}))
+    assert again.status_code == 304
+    assert again.data == b''
+    # Each URL has its own ETag
+    other = client.get('/api/export/json', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.get_json()
+
+
+def test_unknown_version_is_rejected_only_by_record_endpoints(client):
+    assert client.get('/api/weather/history?v=3').status_code == 400
+    assert client.get('/api/export/csv?v=3').status_code == 400
+    # Cache-busting query strings on the page and static files still work
+    assert client.get('/?v=3').status_code == 200
+    static = client.get('/static/app.js?v=3')
+    assert static.status_code == 200
+    static.close()
+
+
+def test_stats_cache_follows_writes_from_other_processes(client, db, make_records):
+    make_records(1, 'Berlin')
+    records = lambda: sum(row['records'] for row in client.get('/api/weather/stats?view=activity').get_json()['activity'])
+    assert records() == 1
+
+    # Another process saves a record: this process's cache is not cleared,
+    # but the shared change counter moves on
+    make_records(1, 'Bern')
+    assert records() == 1
+    db.counters.update_one({'_id': 'weather_history'}, {'$inc': {'version': 1}}, upsert=True)
+    assert records() == 2
@@ -0,0 +1,249 @@
+import contextlib
+import datetime
+import threading
+
+import pytest
+
+from jobs import JobError, MongoJobQueue, QueueFull
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime.datetime.utcnow()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def make_queue(db, clock, handlers, **kwargs):
+    options = dict(workers=1, max_attempts=3, backoff=10, lease_seconds=60, max_queued=5)
+    options.update(kwargs)
+    queue = MongoJobQueue(lambda: db.jobs, handlers, **options)
+    queue._now = clock
+    return queue
+
+
+def run_next(queue, worker='w1'):
+    job = queue._claim(worker)
+    if job is not None:
+        queue._run(job, worker)
+    return job
+
+
+def test_job_runs_and_stores_its_result(db, clock):
+    seen = []
+
+    def handler(payload, progress, job_id):
+        seen.append(job_id)
+        progress(stage='working')
+        return {'double': payload['n'] * 2}
+
+    queue = make_queue(db, clock, {'double': handler})
+    job_id, created = queue.submit('double', {'n': 21})
+    assert created
+    assert queue.get(job_id)['status'] == 'queued'
+    run_next(queue)
+    job = queue.get(job_id)
+    assert job['status'] == 'done'
+    assert job['result'] == {'double': 42}
+    assert job['progress'] == {'stage': 'working'}
+    assert job['attempts'] == 1
+    assert seen == [job_id]
+    assert run_next(queue) is None
+
+
+def test_pending_jobs_are_deduplicated(db, clock):
+    queue = make_queue(db, clock, {'noop': lambda payload, **kwargs: None})
+    first, _ = queue.submit('noop', {}, dedupe_key='same')
+    assert queue.submit('noop', {}, dedupe_key='same') == (first, False)
+    run_next(queue)
+    # Finished jobs no longer absorb new submissions
+    second, created = queue.submit('noop', {}, dedupe_key='same')
+    assert created and second != first
+
+
+def test_full_queue_rejects_jobs(db, clock):
+    queue = make_queue(db, clock, {}, max_queued=2)
+    queue.submit('noop', {})
+    queue.submit('noop', {})
+    with pytest.raises(QueueFull):
+        queue.submit('noop', {})
+
+
+def test_retryable_errors_back_off_then_fail(db, clock):
+    def handler(payload, **kwargs):
+        raise JobError("upstream down", 503, retry=True)
+
+    queue = make_queue(db, clock, {'flaky': handler}, max_attempts=2)
+    job_id, _ = queue.submit('flaky', {})
+    run_next(queue)
+    job = queue.get(job_id)
+    assert job['status'] == 'queued'
+    assert job['error'] == "upstream down"
+    # Not due before the backoff has passed
+    assert run_next(queue) is None
+    clock.advance(13)
+    run_next(queue)
+    job = queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['code'] == 503
+    assert job['attempts'] == 2
+
+
+def test_non_retryable_errors_fail_at_once(db, clock):
+    def handler(payload, **kwargs):
+        raise JobError("no such place", 404)
+
+    queue = make_queue(db, clock, {'bad': handler})
+    job_id, _ = queue.submit('bad', {})
+    run_next(queue)
+    assert queue.get(job_id)['status'] == 'failed'
+    assert queue.get(job_id)['attempts'] == 1
+
+
+def test_expired_lease_is_reclaimed(db, clock):
+    queue = make_queue(db, clock, {'work': lambda payload, **kwargs: 'ok'})
+    job_id, _ = queue.submit('work', {})
+    stalled = queue._claim('w1')
+    assert queue._claim('w2') is None
+    clock.advance(61)
+    job = queue._claim('w2')
+    assert job['_id'] == job_id and job['attempts'] == 2
+    # The first worker no longer owns the job and can't finish it
+    queue._run(stalled, 'w1')
+    assert queue.get(job_id)['status'] == 'running'
+    queue._run(job, 'w2')
+    assert queue.get(job_id)['status'] == 'done'
+
+
+def test_progress_renews_the_lease(db, clock):
+    claims = []
+
+    def handler(payload, progress, **kwargs):
+        clock.advance(50)
+        progress(stage='halfway')
+        clock.advance(50)
+        claims.append(queue._claim('w2'))
+        return 'ok'
+
+    queue = make_queue(db, clock, {'slow': handler})
+    job_id, _ = queue.submit('slow', {})
+    run_next(queue)
+    assert claims == [None]
+    assert queue.get(job_id)['status'] == 'done'
+
+
+def test_job_that_keeps_outliving_its_lease_fails(db, clock):
+    queue = make_queue(db, clock, {}, max_attempts=2)
+    job_id, _ = queue.submit('crash', {})
+    assert queue._claim('w1') is not None
+    clock.advance(61)
+    assert queue._claim('w2') is not None
+    clock.advance(61)
+    assert queue._claim('w3') is None
+    job = queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 2
+    assert 'pending_key' not in db.jobs.find_one({'_id': job_id})
+    assert queue.stats()['failed'] == 1
+
+
+def test_create_record_job_is_idempotent(weather_app, db, monkeypatch):
+    daily = {'time': ['2024-01-01'], 'temperature_2m_mean': [2.0]}
+    monkeypatch.setattr(weather_app, 'get_location_coords', lambda location: (52.52, 13.4, 'Berlin'))
+    monkeypatch.setattr(weather_app.archive_store, 'get_series', lambda *args: daily)
+    weather_app.ensure_indexes()
+    payload = {'location': 'Berlin', 'start_date': '2024-01-01', 'end_date': '2024-01-01'}
+    first = weather_app.run_create_record_job(payload, job_id='job-1')
+    again = weather_app.run_create_record_job(payload, job_id='job-1')
+    assert first == again
+    assert db.weather_history.count_documents({}) == 1
+    weather_app.run_create_record_job(payload, job_id='job-2')
+    assert db.weather_history.count_documents({}) == 2
+
+
+def history_version(db):
+    counter = db.counters.find_one({'_id': 'weather_history'})
+    return counter['version'] if counter else 0
+
+
+@pytest.mark.parametrize('body', [
+    {'location': 'Paris'},
+    {'location': 'Paris', 'start_date': '2024-01-01', 'end_date': '2024-01-03'},
+])
+def test_update_bumps_history_version_once(client, weather_app, db, make_records, monkeypatch, body):
+    daily = {'time': ['2024-01-01', '2024-01-02', '2024-01-03'], 'temperature_2m_mean': [1.0, 2.0, 3.0]}
+    monkeypatch.setattr(weather_app, 'get_location_coords', lambda location: (48.85, 2.35, 'Paris'))
+    monkeypatch.setattr(weather_app.archive_store, 'get_series', lambda *args: daily)
+    record_id = make_records(1)[0]
+    before = history_version(db)
+    response = client.put(f'/api/weather/history/{record_id}', json=body)
+    assert response.status_code == 200
+    assert response.get_json()['location'] == 'Paris'
+    assert history_version(db) == before + 1
+
+
+def test_workers_run_in_the_given_context(db, clock):
+    entered = threading.Event()
+
+    @contextlib.contextmanager
+    def context():
+        entered.set()
+        yield
+
+    queue = make_queue(db, clock, {}, poll_interval=0.01)
+    queue.start(context)
+    try:
+        assert entered.wait(2)
+    finally:
+        queue.stop()
+
+
+@pytest.fixture
+def bulk_app(weather_app, db, monkeypatch):
+    daily = {'time': ['2024-01-01'], 'temperature_2m_mean': [2.0]}
+    monkeypatch.setattr(weather_app, 'get_record_location', lambda location: (52.5, 13.4, location, True))
+    monkeypatch.setattr(weather_app.archive_store, 'get_many',
+                        lambda requests, progress=None: [daily] * len(requests))
+    db.weather_history.create_index('job_id', unique=True, sparse=True)
+    # Index the fresh database's `jobs` collection too
+    monkeypatch.setattr(weather_app.record_jobs, '_indexed', False)
+    return weather_app
+
+
+def test_bulk_job_runs_on_the_persistent_queue(bulk_app, db, client):
+    items = [{'location': 'Berlin', 'start_date': '2024-01-01', 'end_date': '2024-01-01'},
+             {'location': 'Paris', 'start_date': '2024-01-01', 'end_date': '2024-01-01', 'extra': 1}]
+    response = client.post('/api/weather/bulk', json={'items': items, 'background': True})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    stored = db.jobs.find_one({'_id': job_id})
+    assert stored['kind'] == 'bulk_create'
+    assert stored['payload']['items'][1] == {'location': 'Paris', 'start_date': '2024-01-01',
+                                             'end_date': '2024-01-01'}
+    # The same items while it is pending share the job
+    again = client.post('/api/weather/bulk', json={'items': items, 'background': True})
+    assert again.get_json()['job_id'] == job_id
+
+    queue = bulk_app.record_jobs
+    queue._run(queue._claim('w1'), 'w1')
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    assert job['status'] == 'done'
+    assert job['result']['created'] == 2
+    assert db.weather_history.count_documents({}) == 2
+
+
+def test_repeated_bulk_run_reports_the_records_it_saved(bulk_app, db):
+    items = [{'location': 'Berlin', 'start_date': '2024-01-01', 'end_date': '2024-01-01'}]
+    first = bulk_app.run_bulk_create_job({'items': items}, job_id='j1')
+    second = bulk_app.run_bulk_create_job({'items': items}, job_id='j1')
+    assert second == first
+    assert db.weather_history.count_documents({}) == 1
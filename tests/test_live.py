@@ -0,0 +1,68 @@
+from live import LiveHub, changed_fields
+
+
+def make_hub(fetch, **kwargs):
+    hub = LiveHub(fetch, min_interval=0, retry_interval=0, **kwargs)
+    # Run polls inline instead of on the hub's threads
+    hub.start = lambda: None
+    hub._executor = type('Inline', (), {'submit': staticmethod(lambda fn, *args: fn(*args))})()
+    return hub
+
+
+def test_changed_fields():
+    assert changed_fields({'a': 1, 'b': 2, 'c': 3}, {'a': 1, 'b': 5}) == {'b': 5, 'c': None}
+
+
+def test_subscribers_get_a_snapshot_then_only_changes():
+    values = iter([{'t': 1, 'w': 2}, {'t': 1, 'w': 3}, {'t': 1, 'w': 3}])
+    hub = make_hub(lambda key: (next(values), 0))
+    subscription = hub.subscribe('berlin')
+    for _ in range(3):
+        hub.run_once()
+    assert subscription.get(0) == ('snapshot', {'t': 1, 'w': 2})
+    assert subscription.get(0) == ('update', {'w': 3})
+    assert subscription.get(0) is None
+
+
+def test_subscribers_of_a_location_share_one_poll():
+    calls = []
+    hub = make_hub(lambda key: (calls.append(key) or {'t': 1}, 60))
+    subscriptions = [hub.subscribe('berlin') for _ in range(5)]
+    hub.run_once()
+    hub.run_once()
+    assert calls == ['berlin']
+    assert all(s.get(0) == ('snapshot', {'t': 1}) for s in subscriptions)
+
+
+def test_subscriptions_beyond_the_limit_are_rejected():
+    hub = make_hub(lambda key: ({'t': 1}, 60), max_subscribers=2)
+    first = hub.subscribe('a')
+    assert hub.subscribe('b') is not None
+    assert hub.subscribe('c') is None
+    hub.unsubscribe(first)
+    assert hub.subscribe('c') is not None
+    assert hub.stats()['rejected'] == 1
+
+
+def test_slow_subscriber_is_resynced_with_a_snapshot():
+    counter = iter(range(100))
+    hub = make_hub(lambda key: ({'t': next(counter)}, 0), queue_size=2)
+    subscription = hub.subscribe('berlin')
+    for _ in range(5):
+        hub.run_once()
+    assert subscription.get(0) == ('snapshot', {'t': 4})
+
+
+def test_stream_is_disabled_by_default(client):
+    response = client.get('/api/weather/stream?location=Berlin')
+    assert response.status_code == 404
+    assert client.get('/api/config').get_json()['live_updates'] is False
+
+
+def test_stream_beyond_the_limit_gets_503(client, weather_app, monkeypatch):
+    monkeypatch.setattr(weather_app, 'STREAM_ENABLED', True)
+    monkeypatch.setattr(weather_app, 'get_location_coords', lambda location: (52.52, 13.4, 'Berlin'))
+    monkeypatch.setattr(weather_app.live_hub, 'subscribe', lambda key: None)
+    response = client.get('/api/weather/stream?location=Berlin')
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) > 0
@@ -0,0 +1,76 @@
+import gzip
+import zlib
+
+from flask import Flask, Response
+from werkzeug.http import parse_accept_header
+
+import responses
+
+
+def accept(value):
+    return parse_accept_header(value)
+
+
+def streamed(chunks, state):
+    for chunk in chunks:
+        yield chunk
+    state['exhausted'] = True
+
+
+def test_small_body_is_not_compressed():
+    app = Flask(__name__)
+    with app.app_context():
+        response = responses.compress(Response('{"a": 1}', mimetype='application/json'), accept('gzip'))
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data() == b'{"a": 1}'
+
+
+def test_body_is_gzip_compressed():
+    body = ('{"values": [' + ', '.join(str(i) for i in range(1000)) + ']}').encode()
+    response = responses.compress(Response(body, mimetype='application/json'), accept('gzip'))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == body
+
+
+def test_strong_etag_becomes_weak():
+    response = Response('x' * 1000, mimetype='text/plain')
+    response.set_etag('abc')
+    response = responses.compress(response, accept('gzip'))
+    assert response.get_etag() == ('abc', True)
+
+
+def test_event_stream_is_not_compressed():
+    response = Response(iter(['data: x\n\n'] * 100), mimetype='text/event-stream')
+    assert 'Content-Encoding' not in responses.compress(response, accept('gzip')).headers
+
+
+def test_streamed_body_is_flushed_before_the_end():
+    lines = [f"line {i}: {'abcdefgh' * 8}\n" for i in range(500)]
+    state = {'exhausted': False}
+    response = Response(streamed(lines, state), mimetype='text/plain')
+    response = responses.compress(response, accept('gzip'), flush_size=4096)
+
+    early = []
+    body = b''
+    for chunk in response.response:
+        if not state['exhausted']:
+            early.append(chunk)
+        body += chunk
+    assert len([chunk for chunk in early if chunk]) > 1
+    # Each flushed prefix decodes on its own
+    assert zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(b''.join(early[:2]))
+    assert gzip.decompress(body) == ''.join(lines).encode()
+
+
+def test_compressed_export_streams_in_chunks(client, make_records):
+    make_records(300)
+    response = client.get('/api/export/markdown', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    chunks = [chunk for chunk in response.response if chunk]
+    response.close()
+    assert len(chunks) > 2
+    text = gzip.decompress(b''.join(chunks)).decode()
+    assert text.count('- **Record ID:**') == 300
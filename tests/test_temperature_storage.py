@@ -0,0 +1,58 @@
+import math
+import struct
+
+from bson import BSON
+from bson.binary import Binary
+
+from temperature_storage import is_packed, pack_series, store_series, unpack_series, unpack_values
+
+DAILY = {
+    'time': ['2024-02-27', '2024-02-28', '2024-02-29', '2024-03-01'],
+    'temperature_2m_mean': [12.3, -0.1, None, 7.0],
+}
+
+
+def test_packed_series_round_trips():
+    packed = pack_series(DAILY)
+
+    assert is_packed(packed)
+    assert packed['start_date'] == '2024-02-27'
+    assert isinstance(packed['values'], Binary)
+    assert len(packed['values']) == 4 * len(DAILY['time'])
+    # float32 noise (12.3 -> 12.300000190734863) is dropped on the way out
+    assert unpack_series(packed) == DAILY
+
+
+def test_packed_series_survives_bson():
+    packed = BSON.decode(BSON.encode({'temperatures': pack_series(DAILY)}))['temperatures']
+
+    assert unpack_series(packed) == DAILY
+
+
+def test_missing_values_are_stored_as_nan():
+    packed = pack_series({'time': ['2024-01-01', '2024-01-02'], 'temperature_2m_mean': [None, float('nan')]})
+
+    assert all(math.isnan(v) for v in struct.unpack('<2f', bytes(packed['values'])))
+    assert unpack_values(packed) == [None, None]
+
+
+def test_series_with_gaps_in_dates_is_left_as_json():
+    daily = {'time': ['2024-01-01', '2024-01-03'], 'temperature_2m_mean': [1.0, 2.0]}
+
+    assert pack_series(daily) is daily
+    assert pack_series({'time': ['2024-01-01'], 'temperature_2m_mean': []}) == \
+        {'time': ['2024-01-01'], 'temperature_2m_mean': []}
+
+
+def test_readers_accept_both_formats():
+    assert unpack_series(DAILY) is DAILY
+    assert unpack_values(DAILY) == DAILY['temperature_2m_mean']
+    assert unpack_values(None) is None
+
+
+def test_store_series_converts_between_formats():
+    packed = store_series(DAILY, 'binary')
+
+    assert is_packed(packed)
+    assert store_series(packed, 'binary') is packed
+    assert store_series(packed, 'json') == DAILY
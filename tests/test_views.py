@@ -0,0 +1,50 @@
+import pytest
+
+CURRENT = {'current': {'temperature_2m': 3.0, 'weather_code': 1, 'time': '2024-01-01T12:00'}}
+FORECAST = {'daily': {'time': ['2024-01-01'], 'weather_code': [1], 'temperature_2m_max': [4.0],
+                      'temperature_2m_min': [-1.0]}}
+
+
+@pytest.fixture
+def fake_upstream(weather_app, monkeypatch):
+    """Sync and async lookups answering from the same fake data."""
+    pytest.importorskip('asgiref')
+    places = {'berlin': (52.52, 13.41, 'Berlin')}
+
+    def coords(location):
+        return places.get(location.lower(), (None, None, None))
+
+    def weather(kind, lat, lon):
+        return ({'current': CURRENT, 'forecast': FORECAST}[kind], 60, None)
+
+    async def acoords(location):
+        return coords(location)
+
+    async def aweather(kind, lat, lon):
+        return weather(kind, lat, lon)
+
+    monkeypatch.setattr(weather_app, 'get_location_coords', coords)
+    monkeypatch.setattr(weather_app, 'aget_location_coords', acoords)
+    monkeypatch.setattr(weather_app, 'get_cached_weather', weather)
+    monkeypatch.setattr(weather_app, 'aget_cached_weather', aweather)
+    return weather_app
+
+
+@pytest.mark.parametrize('endpoint, query', [
+    ('get_current_weather_api', 'location=Berlin'),
+    ('get_forecast_api', 'location=Berlin'),
+    ('get_dashboard_api', 'location=Berlin'),
+    ('get_current_weather_api', 'location=Atlantis'),
+    ('get_forecast_api', ''),
+    ('get_dashboard_api', 'location=Berlin&history_days=x'),
+])
+def test_async_views_answer_like_the_sync_ones(fake_upstream, endpoint, query):
+    app = fake_upstream.app
+    sync_view = app.view_functions[f'weather.{endpoint}']
+    async_view = fake_upstream.ASYNC_VIEWS[endpoint]
+    answers = []
+    for view in (sync_view, async_view):
+        with app.test_request_context(f'/?{query}'):
+            response = app.make_response(app.ensure_sync(view)())
+            answers.append((response.status_code, response.get_json()))
+    assert answers[0] == answers[1]
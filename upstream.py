@@ -0,0 +1,359 @@
+"""Shared HTTP client for every upstream API the app talks to.
+
+One `requests.Session` per process keeps a keep-alive connection pool per
+host, so repeat calls to open-meteo / Nominatim reuse TCP+TLS connections
+instead of paying a new handshake each time. `AsyncUpstreamClient` does the
+same over httpx for the async views (ASYNC_MODE).
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit import CircuitBreakers, CircuitOpenError
+from settings import get_setting
+
+# Optional: only needed for the async client (ASYNC_MODE)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Base URL for each logical endpoint. Overridable so the app can be pointed
+# at mirrors or local stand-ins.
+DEFAULT_ENDPOINTS = {
+    'geocoding': 'https://geocoding-api.open-meteo.com/v1/search',
+    'reverse': 'https://nominatim.openstreetmap.org/reverse',
+    'archive': 'https://archive-api.open-meteo.com/v1/archive',
+    'forecast': 'https://api.open-meteo.com/v1/forecast',
+}
+
+# (connect, read) timeouts in seconds. Archive downloads for long ranges are
+# the slowest responses we see, so they get the longest read timeout.
+DEFAULT_TIMEOUTS = {
+    'geocoding': (3.05, 10),
+    'reverse': (3.05, 10),
+    'archive': (3.05, 30),
+    'forecast': (3.05, 10),
+}
+
+# Responses worth retrying; anything else is returned to the caller as-is.
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+USER_AGENT = 'WeatherApp/1.0'
+
+
+def _parse_timeout(value, default):
+    """Parse "connect,read" (or a single number used for both)."""
+    if not value:
+        return default
+    try:
+        parts = [float(p) for p in str(value).split(',')]
+    except ValueError:
+        return default
+    if len(parts) == 1:
+        return (parts[0], parts[0])
+    return (parts[0], parts[1])
+
+
+class UpstreamError(requests.RequestException):
+    """Raised by the async client when every attempt failed.
+
+    Subclasses `requests.RequestException` so callers handle sync and async
+    failures the same way.
+    """
+
+
+class _UpstreamBase:
+    """Endpoint, timeout, retry and counter configuration shared by the
+    sync and async clients.
+
+    Settings (config.py or environment):
+      UPSTREAM_POOL_CONNECTIONS  number of per-host pools to keep (default 10)
+      UPSTREAM_POOL_MAXSIZE      keep-alive connections per host (default 20)
+      UPSTREAM_RETRIES           retries after the first attempt (default 2)
+      UPSTREAM_BACKOFF           base backoff in seconds (default 0.3)
+      UPSTREAM_TIMEOUT_<NAME>    "connect,read" for an endpoint, e.g.
+                                 UPSTREAM_TIMEOUT_ARCHIVE="3,60"
+      <NAME>_URL                 base URL override, e.g. ARCHIVE_URL
+
+    `observer(endpoint, host, seconds, status)`, if given, is called after
+    every attempt with its latency and HTTP status ('error' when no response
+    came back), in the caller's context.
+
+    Every host has a circuit breaker (from `breakers`, which clients can
+    share): while it is open, calls raise `CircuitOpenError` right away.
+    """
+
+    COUNTERS = ('requests', 'retries', 'errors', 'rejected')
+
+    def __init__(self, endpoints=None, timeouts=None, pool_connections=None,
+                 pool_maxsize=None, retries=None, backoff=None, observer=None, breakers=None):
+        self.endpoints = dict(DEFAULT_ENDPOINTS)
+        for name in self.endpoints:
+            self.endpoints[name] = get_setting(f'{name.upper()}_URL', self.endpoints[name])
+        self.endpoints.update(endpoints or {})
+        self.hosts = {name: urlparse(url).netloc for name, url in self.endpoints.items()}
+        self.observer = observer
+        self.breakers = breakers if breakers is not None else CircuitBreakers()
+
+        self.timeouts = {}
+        for name in self.endpoints:
+            default = DEFAULT_TIMEOUTS.get(name, (3.05, 10))
+            self.timeouts[name] = _parse_timeout(get_setting(f'UPSTREAM_TIMEOUT_{name.upper()}'), default)
+        self.timeouts.update(timeouts or {})
+
+        self.pool_connections = pool_connections or get_setting('UPSTREAM_POOL_CONNECTIONS', 10, int)
+        self.pool_maxsize = pool_maxsize or get_setting('UPSTREAM_POOL_MAXSIZE', 20, int)
+        self.retries = retries if retries is not None else get_setting('UPSTREAM_RETRIES', 2, int)
+        self.backoff = backoff if backoff is not None else get_setting('UPSTREAM_BACKOFF', 0.3, float)
+
+        self._lock = threading.Lock()
+        self._counters = {name: dict.fromkeys(self.COUNTERS, 0) for name in self.endpoints}
+
+    def _count(self, endpoint, key, n=1):
+        with self._lock:
+            self._counters.setdefault(endpoint, dict.fromkeys(self.COUNTERS, 0))
+            self._counters[endpoint][key] += n
+
+    def breaker(self, endpoint):
+        return self.breakers.get(self.hosts.get(endpoint, endpoint))
+
+    def _admit(self, endpoint):
+        """Raise `CircuitOpenError` if the endpoint's host is failing fast."""
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            self._count(endpoint, 'rejected')
+            raise CircuitOpenError(f"{endpoint}: circuit open for {breaker.name}", breaker.retry_in())
+
+    @staticmethod
+    def succeeded(status):
+        return status != 'error' and status < 500 and status != 429
+
+    def _observe(self, endpoint, started, status):
+        seconds = time.perf_counter() - started
+        self.breaker(endpoint).record(seconds, self.succeeded(status),
+                                      None if self.succeeded(status) else f"{endpoint}: {status}")
+        if self.observer is not None:
+            self.observer(endpoint, self.hosts.get(endpoint, ''), seconds, status)
+
+    def _backoff_delay(self, attempt):
+        # Exponential backoff with jitter so retries from many workers spread out.
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _pool_counters(self):
+        return 0, 0
+
+    def stats(self):
+        """Counters for the admin endpoint: pool reuse, retries and errors."""
+        requests_sent, connections = self._pool_counters()
+        with self._lock:
+            per_endpoint = {name: dict(c) for name, c in self._counters.items()}
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'new_connections': connections,
+            'pool_hits': max(requests_sent - connections, 0),
+            'retries': sum(c['retries'] for c in per_endpoint.values()),
+            'errors': sum(c['errors'] for c in per_endpoint.values()),
+            'rejected': sum(c['rejected'] for c in per_endpoint.values()),
+            'endpoints': per_endpoint,
+        }
+
+
+class UpstreamClient(_UpstreamBase):
+    """Pooled, retrying GET client shared by all upstream helpers."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = None
+        self._pid = None
+
+    # --- session management ---
+
+    def _get_session(self):
+        # Sessions (and their sockets) must not be shared across a fork.
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                          pool_maxsize=self.pool_maxsize,
+                                          max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers['User-Agent'] = USER_AGENT
+                    self._session = session
+                    self._pid = pid
+        return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+    # --- requests ---
+
+    def get(self, endpoint, params=None, headers=None, timeout=None, retries=None):
+        """GET `endpoint` (a key of `self.endpoints`) with bounded retries.
+
+        `timeout` and `retries` override the endpoint's defaults for this
+        call. Returns the final `requests.Response` (which may still be a
+        non-200). Raises `requests.RequestException` when every attempt failed
+        at the connection level, or `CircuitOpenError` (a subclass) when the
+        host's breaker is open.
+        """
+        url = self.endpoints[endpoint]
+        timeout = timeout or self.timeouts.get(endpoint, (3.05, 10))
+        retries = self.retries if retries is None else retries
+        session = self._get_session()
+
+        attempt = 0
+        while True:
+            self._admit(endpoint)
+            self._count(endpoint, 'requests')
+            started = time.perf_counter()
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._observe(endpoint, started, 'error')
+                if attempt >= retries:
+                    self._count(endpoint, 'errors')
+                    raise
+            else:
+                self._observe(endpoint, started, response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    if response.status_code >= 400:
+                        self._count(endpoint, 'errors')
+                    return response
+                response.close()
+            self._count(endpoint, 'retries')
+            time.sleep(self._backoff_delay(attempt))
+            attempt += 1
+
+    def probe(self, endpoint, params=None, timeout=(3.05, 5)):
+        """One attempt at `endpoint` that ignores its circuit breaker.
+
+        Returns whether the host answered without a 429/5xx.
+        """
+        started = time.perf_counter()
+        try:
+            response = self._get_session().get(self.endpoints[endpoint], params=params, timeout=timeout)
+        except requests.RequestException:
+            self._observe(endpoint, started, 'error')
+            return False
+        response.close()
+        self._observe(endpoint, started, response.status_code)
+        return self.succeeded(response.status_code)
+
+    # --- introspection ---
+
+    def _pool_counters(self):
+        session = self._session
+        if session is None:
+            return 0, 0
+        requests_sent = 0
+        connections = 0
+        adapters = {id(a): a for a in session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        return requests_sent, connections
+
+
+class AsyncUpstreamClient(_UpstreamBase):
+    """Async counterpart of `UpstreamClient` built on httpx.
+
+    All requests run on one dedicated I/O event loop thread per process with
+    a single pooled `httpx.AsyncClient`; callers on any event loop await
+    them through `asyncio.wrap_future`, so connections stay pooled across
+    requests and event loops, and the upstream calls within one request run
+    concurrently. Waiting on a call costs no thread of its own, but the
+    calling request still holds its server thread meanwhile, so requests in
+    flight per process remain bounded by the server's threads (ASGI_THREADS
+    under asgi.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        if httpx is None:
+            raise RuntimeError("httpx is required for the async upstream client (pip install httpx)")
+        super().__init__(*args, **kwargs)
+        self._loop = None
+        self._client = None
+        self._pid = None
+
+    def _get_loop(self):
+        pid = os.getpid()
+        if self._loop is None or self._pid != pid:
+            with self._lock:
+                if self._loop is None or self._pid != pid:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='upstream-io', daemon=True).start()
+                    self._loop = loop
+                    self._client = None
+                    self._pid = pid
+        return self._loop
+
+    def _get_client(self):
+        # Only called on the I/O loop.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': USER_AGENT},
+                limits=httpx.Limits(max_connections=self.pool_connections * self.pool_maxsize,
+                                    max_keepalive_connections=self.pool_maxsize),
+            )
+        return self._client
+
+    async def _request(self, endpoint, params, headers, timeout, retries, context):
+        url = self.endpoints[endpoint]
+        connect, read = timeout or self.timeouts.get(endpoint, (3.05, 10))
+        retries = self.retries if retries is None else retries
+        client = self._get_client()
+
+        attempt = 0
+        while True:
+            self._admit(endpoint)
+            self._count(endpoint, 'requests')
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, params=params, headers=headers,
+                                            timeout=httpx.Timeout(read, connect=connect))
+            except httpx.TransportError as e:
+                context.run(self._observe, endpoint, started, 'error')
+                if attempt >= retries:
+                    self._count(endpoint, 'errors')
+                    raise UpstreamError(f"{endpoint} request failed: {e}") from e
+            else:
+                context.run(self._observe, endpoint, started, response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    if response.status_code >= 400:
+                        self._count(endpoint, 'errors')
+                    return response
+            self._count(endpoint, 'retries')
+            await asyncio.sleep(self._backoff_delay(attempt))
+            attempt += 1
+
+    async def get(self, endpoint, params=None, headers=None, timeout=None, retries=None):
+        """Async version of `UpstreamClient.get`; returns an `httpx.Response`.
+
+        Raises `UpstreamError` when every attempt failed at the connection level
+        and `CircuitOpenError` when the host's breaker is open.
+        """
+        # The request runs on the I/O loop; observer calls get the caller's context
+        future = asyncio.run_coroutine_threadsafe(
+            self._request(endpoint, params, headers, timeout, retries, contextvars.copy_context()),
+            self._get_loop())
+        return await asyncio.wrap_future(future)